@@ -0,0 +1,177 @@
+import argparse
+import csv
+import os
+import re
+import time
+
+import compare
+import result_writers
+from netlist_cache import ParseCache, DEFAULT_CACHE_DIR
+
+'''
+Headless batch mode for compare.py. Takes a manifest of netlist pairs and compares them across a pool of worker
+processes, writing each pair's results to its own file (an Excel workbook unless --format says otherwise) plus a
+summary.csv covering the whole run.
+
+Manifest format (CSV, one comparison per line, paths relative to the manifest, lines starting with # are ignored):
+    Board Rev A.xlsx,OrCAD,Cadence          <- two sheets of one workbook
+    rev_a.htm,rev_b.htm                     <- two Allegro Net List Reports
+
+Parsed netlists are shared between jobs (and runs) through the on-disk parse cache, so a revision that shows up in
+several pairs is only parsed once. With --incremental, every net's pins are fingerprinted once per file revision and
+the fingerprints are cached with the parsed netlist, so each job only compares the pins of the nets whose fingerprints
+differ (compare.compare_incremental).
+
+Usage:
+    python batch.py nightly.csv --output results --workers 8
+'''
+
+SUMMARY_FIELDS = ["name", "first", "second", "status", "removed", "added", "changed", "renamed", "seconds", "output",
+                  "error"]
+
+
+# One comparison from the manifest. Excel sources carry the sheet to read, htm sources don't.
+class BatchJob(object):
+    def __init__(self, name, first, second, first_sheet=None, second_sheet=None):
+        self.name = name
+        self.first = first
+        self.second = second
+        self.first_sheet = first_sheet
+        self.second_sheet = second_sheet
+
+    def __repr__(self):
+        return "BatchJob({!r})".format(self.name)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare many netlist pairs listed in a manifest.")
+    add_arguments(parser)
+    return run_from_args(parser.parse_args(argv))
+
+
+def add_arguments(parser):
+    parser.add_argument("manifest", help="CSV of (workbook, sheet, sheet) or (htm, htm) rows")
+    parser.add_argument("-o", "--output", default="batch_results", help="directory for the results")
+    parser.add_argument("-j", "--workers", type=int, default=None,
+                        help="number of worker processes (defaults to the number of CPUs)")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="directory for the parsed netlist cache")
+    parser.add_argument("--no-cache", action="store_true", help="always parse netlists from scratch")
+    parser.add_argument("-f", "--format", choices=result_writers.FORMATS, default="xlsx",
+                        help="format of each job's results")
+    parser.add_argument("--incremental", action="store_true",
+                        help="keep net fingerprints in the parse cache and only compare the pins of nets whose "
+                             "fingerprints differ")
+    parser.add_argument("--reader", choices=compare.EXCEL_READERS, default=None,
+                        help="how to read Excel sheets (defaults to pandas if it is installed)")
+
+
+def run_from_args(args):
+    jobs = read_manifest(args.manifest)
+    results = run_batch(jobs, args.output, args.workers, None if args.no_cache else args.cache_dir, args.incremental,
+                        args.format, args.reader)
+    failed = sum(1 for result in results if result["status"] != "ok")
+    print("Compared {} pair{}, {} failed. Summary written to {}".format(
+        len(results), '' if len(results) == 1 else 's', failed, os.path.join(args.output, "summary.csv")))
+    return 1 if failed else 0
+
+
+def read_manifest(manifest_path):
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    jobs = []
+    with open(manifest_path, 'r', newline='') as f:
+        for line_num, row in enumerate(csv.reader(f), 1):
+            row = [field.strip() for field in row]
+            if not row or not any(row) or row[0].startswith("#"):
+                continue
+            if len(row) == 3:
+                if os.path.splitext(row[0])[1].lower() not in (".xls", ".xlsx"):
+                    raise IOError("Line {} of {} has three fields, but {} is not an Excel workbook.".format(
+                        line_num, manifest_path, row[0]))
+                if row[1] == row[2]:
+                    raise IOError("Line {} of {} compares sheet {} with itself.".format(line_num, manifest_path,
+                                                                                        row[1]))
+                workbook = os.path.join(base_dir, row[0])
+                name = "{} {} vs {}".format(os.path.splitext(os.path.basename(row[0]))[0], row[1], row[2])
+                jobs.append(BatchJob(name, workbook, workbook, row[1], row[2]))
+            elif len(row) == 2:
+                name = "{} vs {}".format(os.path.splitext(os.path.basename(row[0]))[0],
+                                         os.path.splitext(os.path.basename(row[1]))[0])
+                jobs.append(BatchJob(name, os.path.join(base_dir, row[0]), os.path.join(base_dir, row[1])))
+            else:
+                raise IOError("Line {} of {} should be workbook,sheet,sheet or htm,htm.".format(line_num,
+                                                                                              manifest_path))
+    return jobs
+
+
+# Runs every job across a ProcessPoolExecutor and writes summary.csv to output_dir. Returns the summary rows in
+# manifest order. Netlists are read through a ParseCache in cache_dir unless it is None.
+def run_batch(jobs, output_dir, workers=None, cache_dir=None, incremental=False, fmt="xlsx", reader=None):
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    result_writers.check_format(fmt)
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    output_paths = _output_paths(jobs, output_dir, fmt)
+
+    results = [None] * len(jobs)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(run_job, job, output_path, cache_dir, incremental, fmt, reader): i
+                   for i, (job, output_path) in enumerate(zip(jobs, output_paths))}
+        for future in as_completed(futures):
+            i = futures[future]
+            results[i] = future.result()
+            print("[{}] {} ({:.2f}s)".format(results[i]["status"], jobs[i].name, results[i]["seconds"]))
+
+    with open(os.path.join(output_dir, "summary.csv"), 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_FIELDS)
+        writer.writeheader()
+        writer.writerows(results)
+    return results
+
+
+# Compares one pair and writes its results file. Runs inside a worker process, so errors are reported in the
+# returned summary row rather than raised.
+def run_job(job, output_path, cache_dir=None, incremental=False, fmt="xlsx", reader=None):
+    start = time.perf_counter()
+    result = {"name": job.name, "first": _describe(job.first, job.first_sheet),
+              "second": _describe(job.second, job.second_sheet), "output": output_path, "error": ""}
+    try:
+        cache = None if cache_dir is None else ParseCache(cache_dir)
+        netlist1, netlist2 = compare.load_netlists([(job.first, job.first_sheet), (job.second, job.second_sheet)],
+                                                   cache=cache, reader=reader, fingerprints=incremental)
+        if incremental:
+            diff = compare.compare_incremental(netlist1, netlist2)
+        else:
+            diff = compare.compare_sheets(netlist1, netlist2)
+        # Results go to their own file, so the input workbook is never rewritten
+        result_writers.write_results(diff, output_path, fmt, job.first)
+        result.update(status="ok", removed=len(diff.removed), added=len(diff.added), changed=len(diff.changed),
+                      renamed=len(diff.renamed))
+    except Exception as e:
+        result.update(status="error", error="{}: {}".format(type(e).__name__, e))
+    result["seconds"] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def _describe(path, sheet):
+    return path if sheet is None else "{}[{}]".format(path, sheet)
+
+
+# One results file per job, named after the job and kept unique across the batch
+def _output_paths(jobs, output_dir, fmt="xlsx"):
+    paths = []
+    used = set()
+    for job in jobs:
+        stem = re.sub(r'[^\w.+\- ]', '_', job.name)
+        candidate = stem
+        count = 1
+        while candidate.lower() in used:
+            count += 1
+            candidate = "{} ({})".format(stem, count)
+        used.add(candidate.lower())
+        paths.append(os.path.join(output_dir, candidate + "." + fmt))
+    return paths
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
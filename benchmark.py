@@ -0,0 +1,291 @@
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from html import escape
+
+import compare
+
+'''
+Benchmarks for compare.py and modify_footprints.py on synthetic netlists.
+
+For every scale a pair of netlists is generated: a random board, and a revision of it where some of the nets were
+renamed, some pins moved to other nets and some nets deleted. Both are written out as an Excel workbook (one sheet each)
+and as two Allegro Net List Reports (.htm), along with two Component Reports and a symbol library for the footprint
+stages. Each stage is then timed on its own (best of --repeat runs) and the results are written as JSON so runs on
+different versions can be compared.
+
+The time it takes to start the command line tools is measured too, along with which of the heavy dependencies (pandas,
+openpyxl, bs4) they import just to start up. --check-startup only runs that check and fails if startup takes longer than
+--startup-budget or pulls in any of them.
+
+Usage:
+    python benchmark.py --scales 1k,10k,100k --repeat 3 --output bench_results.json
+    python benchmark.py --check-startup
+'''
+
+BENCHMARK_FORMAT = 1
+SYMBOL_EXTENSIONS = ['.dra', '.fsm', '.psm', '.bsm', '.osm', '.ssm']
+# Imported lazily by the code paths that need them, never just to start up
+HEAVY_MODULES = ['pandas', 'numpy', 'openpyxl', 'bs4']
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time each stage of compare.py and modify_footprints.py on synthetic "
+                                                 "netlists.")
+    parser.add_argument("--scales", default="1k,10k", help="comma separated net counts, e.g. 1k,10k,100k,1M")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per stage, the fastest one is reported")
+    parser.add_argument("--mean-fanout", type=float, default=3.5, help="average number of pins per net")
+    parser.add_argument("--max-fanout", type=int, default=500, help="most pins on any one net")
+    parser.add_argument("--rename-rate", type=float, default=0.01, help="fraction of nets renamed in the revision")
+    parser.add_argument("--move-rate", type=float, default=0.01, help="fraction of nets with a pin moved to another net")
+    parser.add_argument("--delete-rate", type=float, default=0.005, help="fraction of nets deleted in the revision")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--skip-footprints", action="store_true", help="only time the compare.py stages")
+    parser.add_argument("--work-dir", default=None,
+                        help="where to write the generated inputs (kept afterwards); defaults to a temporary directory")
+    parser.add_argument("-o", "--output", default="bench_results.json", help="JSON file to write the timings to")
+    parser.add_argument("--check-startup", action="store_true",
+                        help="only check the startup time and imports of the command line tools")
+    parser.add_argument("--startup-budget", type=float, default=0.5,
+                        help="most seconds \"netlist-compare --help\" may take for --check-startup")
+    args = parser.parse_args(argv)
+
+    if args.check_startup:
+        startup = measure_startup(max(args.repeat, 5))
+        print("Startup: {:.3f}s, heavy modules imported: {}".format(startup["seconds"],
+                                                                      ", ".join(startup["heavy_modules"]) or "none"))
+        if startup["heavy_modules"] or startup["seconds"] > args.startup_budget:
+            print("Startup check failed (budget is {:.3f}s).".format(args.startup_budget))
+            return 1
+        return 0
+
+    report = {"format": BENCHMARK_FORMAT, "python": platform.python_version(), "platform": platform.platform(),
+              "started": time.strftime("%Y-%m-%dT%H:%M:%S"), "settings": {
+                  "mean_fanout": args.mean_fanout, "max_fanout": args.max_fanout, "rename_rate": args.rename_rate,
+                  "move_rate": args.move_rate, "delete_rate": args.delete_rate, "seed": args.seed,
+                  "repeat": args.repeat}, "startup": measure_startup(max(args.repeat, 5)), "runs": []}
+
+    work_dir = args.work_dir if args.work_dir is not None else tempfile.mkdtemp(prefix="netlist-bench-")
+    try:
+        for scale in args.scales.split(","):
+            nets = parse_scale(scale)
+            print("Benchmarking {} nets...".format(nets))
+            run = run_scale(nets, os.path.join(work_dir, str(nets)), args)
+            report["runs"].append(run)
+            for stage, seconds in run["stages"].items():
+                print("    {:<24}{:>10.3f}s".format(stage, seconds))
+    finally:
+        if args.work_dir is None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print("Results written to {}".format(args.output))
+
+
+# Best time of "netlist-compare --help" in a fresh interpreter, and the heavy modules importing the command line tools
+# pulls in
+def measure_startup(repeat):
+    here = os.path.dirname(os.path.abspath(__file__))
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, os.path.join(here, "cli.py"), "--help"], stdout=subprocess.DEVNULL, check=True)
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    code = "import sys, cli, modify_footprints; print(' '.join(m for m in {!r} if m in sys.modules))".format(
+        HEAVY_MODULES)
+    imported = subprocess.run([sys.executable, "-c", code], cwd=here, stdout=subprocess.PIPE, check=True,
+                              universal_newlines=True).stdout.split()
+    return {"seconds": round(best, 6), "heavy_modules": imported}
+
+
+# "10k" -> 10000, "1M" -> 1000000
+def parse_scale(scale):
+    scale = scale.strip()
+    multiplier = {"k": 1000, "m": 1000000}.get(scale[-1:].lower(), 1)
+    return int(float(scale[:-1] if multiplier > 1 else scale) * multiplier)
+
+
+def run_scale(nets, work_dir, args):
+    if not os.path.exists(work_dir):
+        os.makedirs(work_dir)
+    rng = random.Random(args.seed)
+    netlist1 = generate_netlist(nets, args.mean_fanout, args.max_fanout, rng)
+    netlist2 = perturb_netlist(netlist1, args.rename_rate, args.move_rate, args.delete_rate, rng)
+
+    xlsx_path = os.path.join(work_dir, "netlists.xlsx")
+    htm_paths = [os.path.join(work_dir, "first.htm"), os.path.join(work_dir, "second.htm")]
+    write_xlsx(xlsx_path, [("First", netlist1), ("Second", netlist2)])
+    write_net_list_report(htm_paths[0], netlist1)
+    write_net_list_report(htm_paths[1], netlist2)
+
+    run = {"nets": nets, "pins": sum(len(pins) for pins in netlist1.values()), "stages": {}}
+    stages = run["stages"]
+    timer = StageTimer(stages, args.repeat)
+
+    frames = timer.time("excel_to_dataframe", read_sheets, xlsx_path, ["First", "Second"])
+    dicts = timer.time("data_frame_to_dict", lambda: [compare.data_frame_to_dict(frame) for frame in frames])
+    timer.time("htm_to_dict", lambda: [compare.htm_to_dict(path) for path in htm_paths])
+    netlists = timer.time("load_netlists", compare.load_netlists, [(xlsx_path, "First"), (xlsx_path, "Second")])
+    diff = timer.time("compare_sheets", compare.compare_sheets, dicts[0], dicts[1])
+    timer.time("compare_netlists", compare.compare_sheets, netlists[0], netlists[1])
+    # Fingerprints are worked out once per file revision and read back from the parse cache after that
+    for netlist in netlists:
+        netlist.fingerprints()
+    timer.time("compare_incremental", compare.compare_incremental, netlists[0], netlists[1])
+    timer.time("export", compare.export_results, diff, xlsx_path, os.path.join(work_dir, "results.xlsx"))
+    run["diff"] = {"removed": len(diff.removed), "added": len(diff.added), "changed": len(diff.changed),
+                   "renamed": len(diff.renamed)}
+
+    if not args.skip_footprints:
+        run_footprint_stages(max(nets // 5, 1), work_dir, timer, rng)
+    return run
+
+
+# Random board: nets are named N<number>, and every pin (<refdes>.<pin number>) sits on exactly one net. Most nets have
+# a few pins, a handful (power and ground) have many.
+def generate_netlist(nets, mean_fanout, max_fanout, rng):
+    netlist = {}
+    pins_per_part = 16
+    pin_count = 0
+    extra = max(mean_fanout - 2, 0.01)
+    for i in range(nets):
+        fanout = min(2 + int(rng.expovariate(1 / extra)), max_fanout)
+        pins = []
+        for _ in range(fanout):
+            part, pin = divmod(pin_count, pins_per_part)
+            pins.append("{}{}.{}".format("URCJ"[part % 4], part, pin + 1))
+            pin_count += 1
+        netlist["N{}".format(i)] = pins
+    # Pins are handed out in order above, so shuffle which nets they end up on
+    all_pins = [pin for pins in netlist.values() for pin in pins]
+    rng.shuffle(all_pins)
+    start = 0
+    for net_name, pins in netlist.items():
+        netlist[net_name] = all_pins[start:start + len(pins)]
+        start += len(pins)
+    return netlist
+
+
+# Revision of a netlist with renamed nets, pins moved from one net to another and deleted nets
+def perturb_netlist(netlist, rename_rate, move_rate, delete_rate, rng):
+    revision = {net_name: list(pins) for net_name, pins in netlist.items()}
+    net_names = list(revision)
+    count = len(net_names)
+
+    for net_name in rng.sample(net_names, int(count * move_rate)):
+        other = net_names[rng.randrange(count)]
+        if other != net_name and len(revision[net_name]) > 1:
+            revision[other].append(revision[net_name].pop())
+    for net_name in rng.sample(net_names, int(count * delete_rate)):
+        revision.pop(net_name, None)
+    renamed = 0
+    for net_name in rng.sample(net_names, int(count * rename_rate)):
+        if net_name in revision:
+            revision["N{}".format(count + renamed)] = revision.pop(net_name)
+            renamed += 1
+    return revision
+
+
+def write_xlsx(path, sheets):
+    import openpyxl
+    wb = openpyxl.Workbook(write_only=True)
+    for sheet_name, netlist in sheets:
+        ws = wb.create_sheet(title=sheet_name)
+        ws.append(["Net Name", "Net Pins"])
+        for net_name, pins in netlist.items():
+            ws.append([net_name, " ".join(pins)])
+    wb.save(path)
+    wb.close()
+
+
+def write_net_list_report(path, netlist):
+    with open(path, 'w') as f:
+        f.write("<html><head><title>Net List Report</title></head><body>\n<table>\n")
+        f.write("<tr><td>Net List Report</td></tr>\n<tr><td>Net Name</td><td>Net Pins</td></tr>\n")
+        for net_name, pins in netlist.items():
+            f.write("<tr><td>{}</td><td>{}</td></tr>\n".format(escape(net_name), escape(" ".join(pins))))
+        f.write("</table>\n</body></html>\n")
+
+
+def write_component_report(path, components):
+    with open(path, 'w') as f:
+        f.write("<html><head><title>Component Report</title></head><body>\n<table>\n")
+        f.write("<tr><td>REFDES</td><td>COMP_CLASS</td><td>COMP_PART_NUMBER</td><td>COMP_VALUE</td>"
+                "<td>SYM_NAME</td></tr>\n")
+        for refdes, package in components.items():
+            f.write("<tr><td>{}</td><td>IC</td><td>PN-{}</td><td></td><td>{}</td></tr>\n".format(
+                escape(refdes), escape(package), escape(package)))
+        f.write("</table>\n</body></html>\n")
+
+
+# Same as compare.excel_to_dataframe without the sheet prompts
+def read_sheets(path, sheet_names):
+    import pandas as pd
+    xl = pd.ExcelFile(path)
+    return [compare.parse_sheet(xl, sheet_name) for sheet_name in sheet_names]
+
+
+# parse_to_dict on two Component Reports, then search_for_files and add_files against a generated symbol library
+def run_footprint_stages(components, work_dir, timer, rng):
+    import modify_footprints
+
+    packages = ["PKG{}".format(i) for i in range(max(components // 20, 10))]
+    old_components = {"U{}".format(i): rng.choice(packages) for i in range(components)}
+    new_components = {refdes: package + "_NEW" if rng.random() < 0.1 else package
+                      for refdes, package in old_components.items()}
+    report_paths = [os.path.join(work_dir, "old_components.htm"), os.path.join(work_dir, "new_components.htm")]
+    write_component_report(report_paths[0], old_components)
+    write_component_report(report_paths[1], new_components)
+
+    library = os.path.join(work_dir, "symbols")
+    target = os.path.join(work_dir, "symbols_updated")
+    for path in (library, target):
+        if not os.path.exists(path):
+            os.makedirs(path)
+    for package in packages:
+        for extension in SYMBOL_EXTENSIONS:
+            with open(os.path.join(library, package + extension), 'w') as f:
+                f.write(package)
+
+    cwd = os.getcwd()
+    try:
+        timer.time("parse_to_dict", lambda: [modify_footprints.parse_to_dict(path) for path in report_paths])
+        mapping = {old_components[refdes]: new_components[refdes] for refdes in old_components}
+        files = timer.time("search_for_files", lambda: modify_footprints.search_for_files(dict(mapping), library))
+        os.chdir(library)
+        timer.time("add_files", modify_footprints.add_files, files, target)
+    finally:
+        os.chdir(cwd)
+
+
+# Times stages into a {stage -> seconds} dict, keeping the fastest of repeat runs. Whatever the stages print is hidden.
+class StageTimer(object):
+    def __init__(self, stages, repeat=1):
+        self.stages = stages
+        self.repeat = max(repeat, 1)
+
+    def time(self, stage, func, *args):
+        best = None
+        result = None
+        for _ in range(self.repeat):
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                start = time.perf_counter()
+                result = func(*args)
+                seconds = time.perf_counter() - start
+            best = seconds if best is None else min(best, seconds)
+        self.stages[stage] = round(best, 6)
+        return result
+
+
+if __name__ == '__main__':
+    sys.exit(main())
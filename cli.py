@@ -0,0 +1,227 @@
+import argparse
+import os
+import sys
+
+import batch
+import compare
+import netlist_store
+import profiling
+import result_writers
+import server
+from netlist_cache import ParseCache, DEFAULT_CACHE_DIR
+
+'''
+Command line entry point for comparing netlists (installed as "netlist-compare"; modify_footprints.py is installed as
+"modify-footprints").
+
+    netlist-compare compare "Board Rev A.xlsx" OrCAD Cadence      <- two sheets of one workbook
+    netlist-compare compare rev_a.htm rev_b.htm -o "a vs b.xlsx"  <- two Allegro Net List Reports
+    netlist-compare compare rev_a.htm rev_b.htm --format jsonl    <- results as JSON lines instead of Excel
+    netlist-compare compare rev_a.htm rev_b.htm --store boards.db <- netlists held in SQLite instead of memory
+    netlist-compare connectivity rev_a.htm rev_b.htm              <- shorts, opens and moved pins, whatever the names
+    netlist-compare revisions Board.xlsx OrCAD HDL-1 HDL-2 ECO-1  <- every sheet against the first, in one pass
+    netlist-compare batch nightly.csv --workers 8
+    netlist-compare serve --port 8765                             <- keeps parsed netlists in memory between queries
+    netlist-compare interactive                                   <- the original prompts, reading from ./Data
+
+pandas and openpyxl are only imported by the code that reads or writes Excel files, so "--help" or an htm-only run never
+pays for them.
+'''
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="netlist-compare", description="Compare Allegro netlists.")
+    subparsers = parser.add_subparsers(dest="command", metavar="COMMAND")
+    subparsers.required = True
+
+    compare_parser = subparsers.add_parser("compare", help="compare two netlists without prompting",
+                                           description="Compare two sheets of a workbook, or two Net List Reports.")
+    compare_parser.add_argument("sources", nargs="+", metavar="SOURCE",
+                                help="WORKBOOK SHEET SHEET, or FIRST.htm SECOND.htm")
+    compare_parser.add_argument("-o", "--output", default=None,
+                                help="file to write the results to (defaults to adding them to the input workbook, or "
+                                     "to \"<first> vs <second>.<format>\")")
+    compare_parser.add_argument("-f", "--format", choices=result_writers.FORMATS, default=None,
+                                help="output format (defaults to the output file's extension, or xlsx)")
+    compare_parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="directory for the parsed netlist cache")
+    compare_parser.add_argument("--no-cache", action="store_true", help="always parse netlists from scratch")
+    compare_parser.add_argument("--reader", choices=compare.EXCEL_READERS, default=None,
+                                help="how to read Excel sheets (defaults to pandas if it is installed)")
+    compare_parser.add_argument("--no-renames", action="store_true", help="don't match up renamed nets")
+    compare_parser.add_argument("--store", metavar="DATABASE", default=None,
+                                help="load the netlists into an SQLite database and compare them there, for "
+                                     "netlists too big to hold in memory (kept between runs, so unchanged files "
+                                     "aren't loaded again)")
+    profiling.add_arguments(compare_parser)
+    compare_parser.set_defaults(func=run_compare)
+
+    connectivity_parser = subparsers.add_parser("connectivity", help="find merged nets, split nets and moved pins",
+                                                description="Compare which pins are connected in two netlists, "
+                                                            "regardless of net names.")
+    connectivity_parser.add_argument("sources", nargs="+", metavar="SOURCE",
+                                     help="WORKBOOK SHEET SHEET, or FIRST.htm SECOND.htm")
+    connectivity_parser.add_argument("-o", "--output", default=None,
+                                     help="file to write the results to (defaults to adding them to the input "
+                                          "workbook, or to \"<first> vs <second> connectivity.<format>\")")
+    connectivity_parser.add_argument("-f", "--format", choices=result_writers.FORMATS, default=None,
+                                     help="output format (defaults to the output file's extension, or xlsx)")
+    connectivity_parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR,
+                                     help="directory for the parsed netlist cache")
+    connectivity_parser.add_argument("--no-cache", action="store_true", help="always parse netlists from scratch")
+    connectivity_parser.add_argument("--reader", choices=compare.EXCEL_READERS, default=None,
+                                     help="how to read Excel sheets (defaults to pandas if it is installed)")
+    profiling.add_arguments(connectivity_parser)
+    connectivity_parser.set_defaults(func=run_connectivity)
+
+    revisions_parser = subparsers.add_parser("revisions", help="compare many revisions of a netlist at once",
+                                             description="Show where each net first diverged across revisions: sheets "
+                                                         "of a workbook, or Net List Reports.")
+    revisions_parser.add_argument("sources", nargs="+", metavar="SOURCE",
+                                  help="WORKBOOK SHEET SHEET [SHEET...], or FIRST.htm SECOND.htm [THIRD.htm...]")
+    revisions_parser.add_argument("-o", "--output", default=None,
+                                  help="file to write the results to (defaults to adding them to the input workbook, "
+                                       "or to \"<first> to <last>.<format>\")")
+    revisions_parser.add_argument("-f", "--format", choices=result_writers.FORMATS, default=None,
+                                  help="output format (defaults to the output file's extension, or xlsx)")
+    revisions_parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR,
+                                  help="directory for the parsed netlist cache")
+    revisions_parser.add_argument("--no-cache", action="store_true", help="always parse netlists from scratch")
+    revisions_parser.add_argument("--reader", choices=compare.EXCEL_READERS, default=None,
+                                  help="how to read Excel sheets (defaults to pandas if it is installed)")
+    profiling.add_arguments(revisions_parser)
+    revisions_parser.set_defaults(func=run_revisions)
+
+    batch_parser = subparsers.add_parser("batch", help="compare every pair listed in a manifest",
+                                         description="Compare many netlist pairs listed in a manifest.")
+    batch.add_arguments(batch_parser)
+    batch_parser.set_defaults(func=batch.run_from_args)
+
+    serve_parser = subparsers.add_parser("serve", help="run a local comparison server",
+                                         description="Serve comparisons over HTTP (see server.py), keeping parsed "
+                                                     "netlists in memory between requests.")
+    server.add_arguments(serve_parser)
+    serve_parser.set_defaults(func=server.run_from_args)
+
+    interactive_parser = subparsers.add_parser("interactive", help="pick the netlists to compare from ./Data")
+    profiling.add_arguments(interactive_parser)
+    interactive_parser.set_defaults(func=run_interactive)
+
+    args = parser.parse_args(argv)
+    try:
+        return args.func(args)
+    except IOError as e:
+        raise SystemExit(str(e))
+
+
+def run_compare(args):
+    sources, results_path = compare_sources(args.sources)
+    fmt, output_path = _output_format(args, sources, results_path, "results")
+    if args.store is not None:
+        return _run_store_compare(args, sources, output_path, fmt)
+    cache = None if args.no_cache else ParseCache(args.cache_dir)
+    with profiling.profile_from_args(args):
+        netlist1, netlist2 = compare.load_netlists(sources, cache=cache, reader=args.reader)
+        diff = compare.compare_sheets(netlist1, netlist2, detect_renames=not args.no_renames)
+        result_writers.write_results(diff, output_path, fmt, sources[0][0])
+    print(diff)
+    return 0
+
+
+def _run_store_compare(args, sources, output_path, fmt):
+    with profiling.profile_from_args(args), netlist_store.NetlistStore(args.store) as store:
+        first, second = [store.add(path, sheet_name) for path, sheet_name in sources]
+        diff = store.compare(first, second, detect_renames=not args.no_renames)
+        result_writers.write_results(diff, output_path, fmt, sources[0][0])
+    print(diff)
+    return 0
+
+
+def run_connectivity(args):
+    sources, results_path = compare_sources(args.sources)
+    if results_path is not None:
+        results_path = os.path.splitext(results_path)[0] + " connectivity.xlsx"
+    fmt, output_path = _output_format(args, sources, results_path, "connectivity")
+    cache = None if args.no_cache else ParseCache(args.cache_dir)
+    with profiling.profile_from_args(args):
+        netlist1, netlist2 = compare.load_netlists(sources, cache=cache, reader=args.reader)
+        diff = compare.compare_connectivity(netlist1, netlist2)
+        result_writers.write_results(diff, output_path, fmt, sources[0][0])
+    print(diff)
+    return 0
+
+
+def run_revisions(args):
+    sources, labels, results_path = revision_sources(args.sources)
+    fmt, output_path = _output_format(args, sources, results_path, "revisions")
+    cache = None if args.no_cache else ParseCache(args.cache_dir)
+    with profiling.profile_from_args(args):
+        netlists = compare.load_netlists(sources, cache=cache, reader=args.reader, fingerprints=True)
+        diff = compare.compare_revisions(netlists, labels)
+        result_writers.write_results(diff, output_path, fmt, sources[0][0])
+    print(diff)
+    return 0
+
+
+# Works out the output format and path from --format and --output. Without --output, results go to results_path (with
+# the format's extension) or, for a workbook, into the workbook itself - unless they aren't Excel, in which case they
+# go to "<workbook> <suffix>.<format>".
+def _output_format(args, sources, results_path, suffix):
+    fmt = args.format
+    if fmt is None:
+        fmt = result_writers.format_for_path(args.output) if args.output is not None else "xlsx"
+    result_writers.check_format(fmt)
+    output_path = args.output
+    if output_path is None:
+        if results_path is not None:
+            output_path = os.path.splitext(results_path)[0] + "." + fmt
+        # Only Excel results can be added to the input workbook
+        elif fmt != "xlsx":
+            output_path = "{} {}.{}".format(os.path.splitext(sources[0][0])[0], suffix, fmt)
+    return fmt, output_path
+
+
+# Turns the "compare" sources into [(path, sheet name)] for load_netlists, plus where the results go by default (None
+# for a workbook, whose results are added to it)
+def compare_sources(sources):
+    is_workbook = [os.path.splitext(source)[1].lower() in (".xls", ".xlsx") for source in sources]
+    if len(sources) == 3 and is_workbook[0]:
+        workbook, sheet1, sheet2 = sources
+        if sheet1 == sheet2:
+            raise SystemExit("Can't compare sheet {} with itself".format(sheet1))
+        return [(workbook, sheet1), (workbook, sheet2)], None
+    if len(sources) == 2 and not any(is_workbook):
+        first, second = sources
+        results_name = "{} vs {}.xlsx".format(os.path.splitext(os.path.basename(first))[0],
+                                              os.path.splitext(os.path.basename(second))[0])
+        return [(first, None), (second, None)], os.path.join(os.path.dirname(first), results_name)
+    raise SystemExit("compare takes WORKBOOK SHEET SHEET or FIRST.htm SECOND.htm")
+
+
+# Turns the "revisions" sources into [(path, sheet name)] for load_netlists, a label for each revision (the sheet names,
+# or the names of the htm files) and where the results go by default (None for a workbook)
+def revision_sources(sources):
+    if len(sources) >= 3 and os.path.splitext(sources[0])[1].lower() in (".xls", ".xlsx"):
+        workbook, sheets = sources[0], sources[1:]
+        if len(set(sheets)) != len(sheets):
+            raise SystemExit("Each sheet can only be listed once")
+        return [(workbook, sheet) for sheet in sheets], list(sheets), None
+    if len(sources) >= 2:
+        labels = [os.path.splitext(os.path.basename(source))[0] for source in sources]
+        # Same name in different directories
+        if len(set(labels)) != len(labels):
+            labels = list(sources)
+        if len(set(labels)) != len(labels):
+            raise SystemExit("Each file can only be listed once")
+        results_name = "{} to {}.xlsx".format(labels[0], labels[-1]) if labels[0] != sources[0] else "revisions.xlsx"
+        return [(source, None) for source in sources], labels, os.path.join(os.path.dirname(sources[0]), results_name)
+    raise SystemExit("revisions takes WORKBOOK SHEET SHEET [SHEET...] or FIRST.htm SECOND.htm [THIRD.htm...]")
+
+
+def run_interactive(args):
+    with profiling.profile_from_args(args):
+        compare.interactive()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
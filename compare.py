@@ -1,35 +1,68 @@
+import argparse
+import hashlib
+import itertools
+import operator
 import os
+import pickle
+from array import array
 
-import openpyxl
-import pandas as pd
-from openpyxl.styles import Font, Border, Side, NamedStyle
+import profiling
+from netlist_cache import ParseCache
+from report_parser import read_report
 
 '''
 @author Arjun Gupta
 @date 5/23/2018
 @version 1.0.1
 
-This program takes in two Allegro Netlists that have been converted to Excel format (copy and paste from .htm)
-and parses them to accurately and rapidly find all points at both the net and the pin level where there are 
+This program takes in two Allegro Netlists, either as the .htm reports Allegro writes out or converted to Excel format
+(copy and paste from .htm), and parses them to accurately and rapidly find all points at both the net and the pin level where there are 
 disagreements between the two netlists. The main purpose of this is to aide in the translation of schematics
 from one format (in my case, OrCAD) to another (Cadence HDL). 
 
 To do: 
-    -Go straight from htm to Excel upload (aka supporting more file formats)
-        -Goal of this is to streamline process - instead of having to copy & paste from htm file, you should just 
-        be able to drop in the htm files to the Data subfolder.
-    
     -Redesign with classes in mind - limit the amount of information reuse
         -Goal of this is to increase overall code readability and decrease runtime for large input files
     
     -Decide on one format - either Pandas or OpenPyxl
         -Goal of this is to reduce the amount of dependencies and O(N^2) passes through the list.
     
-Overall efficiency is O(N^2) but true efficiency is θ(12N^2) or higher where N is the amount of rows in the two 
-netlists.
+Comparing two netlists is O(N) where N is the amount of pins in the two netlists: each sheet is indexed once and
+nets are matched by name, so the order of the rows in either sheet does not matter.
 
 
 Changelist:
+Version 1.1.0:
+    -compare_sheets returns a SheetDiff (removed, added and changed nets) instead of pre-formatted strings, and no
+    longer drops nets when the two sheets differ in length or ordering
+    -Netlists are stored as interned integer IDs in CSR arrays (Netlist) and compared without string work
+    -Nets that were renamed between the two netlists (N12345 -> N67890) are matched up by their pins and reported as
+    renames instead of as one net missing from each sheet
+    -Both result sheets are written in one pass and the workbook is saved once; results can also go to a separate
+    (write-only, streamed) workbook so the input isn't rewritten
+    -Parsed netlists are kept in an on-disk cache keyed by the contents of the file and the sheet name, so re-reading
+    an unchanged workbook skips the Excel parse
+    -Every net's pins are fingerprinted once per file revision and the fingerprints are kept with the parsed netlist in
+    the cache, so compare_incremental only has to look at the nets whose fingerprints differ
+    -Excel sheets are read two columns at a time and split into pins with vectorized pandas operations, or streamed with
+    openpyxl's read-only mode (--reader openpyxl) without pandas at all
+    -Any number of revisions of a netlist can be compared at once (compare_revisions, "netlist-compare revisions"),
+    giving the revision each net first diverged in and its pin changes in every revision in one linear pass
+    -compare_connectivity ("netlist-compare connectivity") compares which pins are connected regardless of net names,
+    reporting merged nets (shorts), split nets (opens) and pins that moved between nets
+    -Netlists too big to hold in memory can be loaded into an SQLite database (netlist_store.py, --store) and compared
+    there with set-difference queries, the results being streamed back to the output file
+    -"netlist-compare serve" (server.py) runs a local HTTP service that keeps parsed netlists in an LRU cache in memory,
+    so repeated comparisons of the same netlists skip loading them, and reports cache and latency metrics
+    -Results can also be written as CSV, JSON lines or Parquet (result_writers.py, --format) for post-processing
+    -netlist-compare command (cli.py) with compare/batch/interactive subcommands; pandas and openpyxl are only
+    imported when an Excel file is actually read or written
+    -Each stage can be timed and memory profiled (--profile report.json), optionally under cProfile (--cprofile)
+    -benchmark.py times each stage on generated netlists of any size and writes the timings as JSON
+    -batch.py compares a manifest of netlist pairs without prompting, spread across worker processes
+    -Allegro .htm netlists can be dropped into the Data subfolder and compared directly, results are written to
+    "<first> vs <second>.xlsx"
+
 Version 1.0.2:
     -Added file selection prompt that searches from available files in the Data directory
 
@@ -42,37 +75,220 @@ Version 1.0:
 '''
 
 
-def main():
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare two Allegro netlists picked from the Data subfolder.")
+    profiling.add_arguments(parser)
+    args = parser.parse_args(argv)
 
-    file_path, data, xl = find_file()
+    with profiling.profile_from_args(args):
+        interactive()
 
-    # TODO: scrap pandas and use openpyxl instead to keep one consistent data structure
-    sheet1_data = data_frame_to_dict(data[0])
-    sheet2_data = data_frame_to_dict(data[1])
 
-    # Grabs two separate sets of info: one dict containing inconsistencies with the pins between the same net
+# Prompts for the netlists to compare from the Data subfolder and writes the results
+def interactive():
+    file_path, data, xl = find_file(ParseCache())
+    sheet1_data, sheet2_data = data
+
+    # Grabs two separate sets of info: inconsistencies with the pins between the same net
     # and the net names themselves
-    diff_dict_pins, diff_dict_nets = compare_sheets(sheet1_data, sheet2_data)
+    diff = compare_sheets(sheet1_data, sheet2_data)
+    export_results(diff, file_path)
+
+
+# Writes the "Compared Pin Results" and "Compared Net Results" sheets for a SheetDiff in a single pass and saves once.
+# By default the sheets are added to the workbook at file_path (replacing results from an earlier run, and creating the
+# workbook if it doesn't exist yet). Passing output_path writes only the results to a separate workbook instead, which
+# leaves the input untouched and avoids re-serializing its (possibly large) source sheets.
+def export_results(diff, file_path, output_path=None):
+    with profiling.stage("export") as counts:
+        _export_results(diff, file_path, output_path, counts)
+
+
+def _export_results(diff, file_path, output_path, counts):
+    results = [(PIN_RESULTS_SHEET, diff.pin_results()), (NET_RESULTS_SHEET, diff.net_results())]
+    counts["rows"] = sum(len(diff_dict) for _, diff_dict in results)
+
+    wb, save_path = _open_results_workbook(file_path, output_path)
+    for sheet_name, diff_dict in results:
+        export(diff_dict, sheet_name, wb)
+    _save_results_workbook(wb, save_path)
+
+    print("Export of \"{}\" and \"{}\" to \"{}\" is successful!".format(PIN_RESULTS_SHEET, NET_RESULTS_SHEET, save_path))
+
+
+# Writes the "Compared Revisions" sheet for a RevisionDiff: one row per net that diverged, with the revision it first
+# diverged in and how it differs from the first revision in each revision. file_path and output_path work the same way
+# as for export_results.
+def export_revisions(diff, file_path, output_path=None):
+    with profiling.stage("export") as counts:
+        wb, save_path = _open_results_workbook(file_path, output_path)
+        fields = diff.fields()
+        counts["rows"] = export_rows(["Net Name", "First Diverged"] + diff.labels,
+                                     lambda: ([record[field] or "" for field in fields] for record in diff.records()),
+                                     REVISION_RESULTS_SHEET, wb)
+        _save_results_workbook(wb, save_path)
+    print("Export of \"{}\" to \"{}\" is successful!".format(REVISION_RESULTS_SHEET, save_path))
+
+
+# Writes the "Compared Connectivity" sheet for a ConnectivityDiff: one row per merged net, split net and group of pins
+# that moved between the same two nets. file_path and output_path work the same way as for export_results.
+def export_connectivity(diff, file_path, output_path=None):
+    with profiling.stage("export") as counts:
+        wb, save_path = _open_results_workbook(file_path, output_path)
+        counts["rows"] = export_rows(["Change", "First Netlist", "Second Netlist", "Pins"],
+                                     lambda: ([record["kind"], " ".join(record["first_nets"]),
+                                               " ".join(record["second_nets"]), " ".join(record["pins"])]
+                                              for record in diff.records()),
+                                     CONNECTIVITY_RESULTS_SHEET, wb)
+        _save_results_workbook(wb, save_path)
+    print("Export of \"{}\" to \"{}\" is successful!".format(CONNECTIVITY_RESULTS_SHEET, save_path))
 
-    # Only need to load the workbook once to prevent overwriting data.
-    wb = openpyxl.load_workbook(filename=file_path)
+
+# Returns the workbook to write results into and the path to save it to
+def _open_results_workbook(file_path, output_path):
+    import openpyxl
+    save_path = file_path if output_path is None else output_path
+
+    # Only need to load the workbook once to prevent overwriting data. New workbooks are streamed in write-only mode.
+    if output_path is None and os.path.exists(file_path):
+        wb = openpyxl.load_workbook(filename=file_path)
+    else:
+        wb = openpyxl.Workbook(write_only=True)
 
     # NamedStyles belong to one workbook - no need to create the same NamedStyle twice
     if "BorderAndFont" not in wb.named_styles:
         wb.add_named_style(create_font_style())
+    return wb, save_path
+
+
+def _save_results_workbook(wb, save_path):
+    # NOTE: Program crashes when file that is being saved is open... Don't do that please
+    wb.save(filename=save_path)
+    wb.close()
+
+
+# Loads a single netlist without prompting: either a sheet of an Excel workbook (sheet_name required, and an already
+# open pd.ExcelFile can be passed in as xl) or an Allegro Net List Report (.htm).
+# With a ParseCache, a file that was parsed before is read back from the cache instead of being parsed again.
+# reader picks how Excel sheets are read (see EXCEL_READERS): pandas by default, or openpyxl's streaming read-only mode
+# which needs neither pandas nor memory for the whole sheet. None uses pandas if it is installed.
+# With fingerprints, the net fingerprints (Netlist.fingerprints) are worked out too and kept in the cache with the
+# netlist, for compare_incremental and compare_revisions.
+def load_netlist(path, sheet_name=None, names=None, xl=None, cache=None, reader=None, fingerprints=False):
+    reader = _excel_reader(reader) if xl is None else "pandas"
+    workbooks = {} if xl is None else {(reader, path): xl}
+    try:
+        return _load_netlist(path, sheet_name, names, workbooks, cache, reader, fingerprints)
+    finally:
+        _close_workbooks(workbooks, keep=xl)
+
+
+# Loads several (path, sheet name) netlists into one shared NameTable, opening each workbook only once (and not at all
+# if every sheet it is needed for is already in the cache)
+def load_netlists(sources, names=None, cache=None, reader=None, fingerprints=False):
+    names = names if names is not None else NameTable()
+    reader = _excel_reader(reader)
+    workbooks = {}
+    try:
+        return [_load_netlist(path, sheet_name, names, workbooks, cache, reader, fingerprints)
+                for path, sheet_name in sources]
+    finally:
+        _close_workbooks(workbooks)
 
-    sheet1_name = "Compared Pin Results"
-    sheet2_name = "Compared Net Results"
 
-    #
-    export(file_path, diff_dict_pins, sheet1_name, wb)
-    export(file_path, diff_dict_nets, sheet2_name, wb)
+# workbooks is a {(reader, path) -> pd.ExcelFile or read-only openpyxl Workbook} of workbooks that are already open; a
+# workbook is only opened (and added to it) when one of its sheets actually has to be parsed
+def _load_netlist(path, sheet_name, names, workbooks, cache, reader="pandas", fingerprints=False):
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in (".htm", ".html", ".xls", ".xlsx"):
+        raise IOError("Unsupported file type: {}".format(path))
+    if extension in (".xls", ".xlsx") and sheet_name is None:
+        raise IOError("A sheet name is needed to read a netlist from {}.".format(path))
+    if extension in (".htm", ".html") and sheet_name is not None:
+        raise IOError("{} is a Net List Report, it has no sheet {}.".format(path, sheet_name))
 
-    print("Export of \"{}\" and \"{}\" to \"{}\" is successful!".format(sheet1_name, sheet2_name, file_path))
+    key = None
+    if cache is not None:
+        key = cache.key(path, sheet_name)
+        with profiling.stage("cache_load") as counts:
+            data = cache.get(key)
+            netlist = None if data is None else Netlist.from_bytes(data, names)
+            counts.update(hit=netlist is not None, bytes=0 if data is None else len(data))
+        if netlist is not None:
+            _count_netlist(counts, netlist)
+            # Cached before anything asked for its fingerprints: they are stored now, so it only happens once
+            if fingerprints and netlist._fingerprints is None:
+                _fingerprint_netlist(netlist)
+                with profiling.stage("cache_store"):
+                    cache.put(key, netlist.to_bytes())
+            return netlist
 
+    if extension in (".htm", ".html"):
+        with profiling.stage("htm_to_dict") as counts:
+            netlist = htm_to_netlist(path, names)
+            _count_netlist(counts, netlist)
+    elif reader == "openpyxl" and extension == ".xlsx":
+        with profiling.stage("read_sheet") as counts:
+            wb = workbooks.get((reader, path))
+            if wb is None:
+                import openpyxl
+                wb = workbooks[(reader, path)] = openpyxl.load_workbook(path, read_only=True, data_only=True)
+            if sheet_name not in wb.sheetnames:
+                raise IOError("Sheet {} not found in {}.".format(sheet_name, path))
+            netlist = Netlist.from_items(_iter_sheet_nets(wb[sheet_name]), names)
+            _count_netlist(counts, netlist)
+    else:
+        with profiling.stage("excel_to_dataframe") as counts:
+            xl = workbooks.get(("pandas", path))
+            if xl is None:
+                import pandas as pd
+                xl = workbooks[("pandas", path)] = pd.ExcelFile(path)
+            if sheet_name not in xl.sheet_names:
+                raise IOError("Sheet {} not found in {}.".format(sheet_name, path))
+            frame = parse_sheet(xl, sheet_name)
+            counts["rows"] = len(frame)
+        with profiling.stage("data_frame_to_dict") as counts:
+            netlist = data_frame_to_netlist(frame, names)
+            _count_netlist(counts, netlist)
 
-# Ensures that the user is only able to input valid files/sheets
-def find_file():
+    if fingerprints:
+        _fingerprint_netlist(netlist)
+    if cache is not None:
+        with profiling.stage("cache_store"):
+            cache.put(key, netlist.to_bytes())
+    return netlist
+
+
+def _fingerprint_netlist(netlist):
+    with profiling.stage("fingerprints") as counts:
+        netlist.fingerprints()
+        counts["nets"] = len(netlist.net_ids)
+
+
+def _excel_reader(reader):
+    if reader is not None:
+        if reader not in EXCEL_READERS:
+            raise ValueError("Unknown Excel reader {!r}, expected one of {}".format(reader, EXCEL_READERS))
+        return reader
+    try:
+        import pandas
+        return "pandas"
+    except ImportError:
+        return "openpyxl"
+
+
+def _close_workbooks(workbooks, keep=None):
+    for workbook in workbooks.values():
+        if workbook is not keep:
+            workbook.close()
+
+
+def _count_netlist(counts, netlist):
+    counts.update(nets=len(netlist.net_ids), pins=len(netlist.pins))
+
+
+# Ensures that the user is only able to input valid files/sheets. Netlists are read through the given ParseCache, if any.
+def find_file(cache=None):
     subdir = "Data"
     path = os.path.normpath(os.path.join(os.getcwd(), subdir))
     os.chdir(path)
@@ -95,21 +311,32 @@ def find_file():
         while 0 < file_num <= len(files):
             file_num = int(input("Enter the number representing the file you want to read from: "))
     file = files[file_num - 1]
-    data_frames = None
+    netlists = None
+    # Both netlists intern their names into the same table so they can be compared by ID
+    names = NameTable()
     prev_path = path
     # Excel file
     xl = None
     # Validation of proper file entered
-    while data_frames is None:
+    while netlists is None:
         try:
             path = os.path.normpath(os.path.join(path, file))
             extension = file.split(".")
             # Ex: User enters a directory rather than a file
             if len(extension) > 1:
                 if extension[1] == "xls" or extension[1] == "xlsx":
-                    # convert xlsx to csv here
-                    xl, data_frames = excel_to_dataframe(path)
-                # TODO: Add support for htm
+                    # TODO: scrap pandas and use openpyxl instead to keep one consistent data structure
+                    xl, sheets = select_sheets(path)
+                    netlists = [load_netlist(path, sheet, names, xl, cache) for sheet in sheets]
+                # Each htm file holds a single netlist, so a second one is needed to compare against
+                elif extension[1] == "htm" or extension[1] == "html":
+                    file2 = find_second_htm(files, file)
+                    path2 = os.path.normpath(os.path.join(prev_path, file2))
+                    print("Files being compared are: {} and {}".format(file, file2))
+                    netlists = [load_netlist(path, None, names, cache=cache),
+                                load_netlist(path2, None, names, cache=cache)]
+                    results_name = "{} vs {}.xlsx".format(os.path.splitext(file)[0], os.path.splitext(file2)[0])
+                    path = os.path.normpath(os.path.join(prev_path, results_name))
                 else:
                     raise IOError("Unsupported file type selected.")
             else:
@@ -122,13 +349,42 @@ def find_file():
         except IOError:
             file = input("Enter the file name that you want to read from: ")
             path = prev_path
-    # Return the path, the populated dataframe, and the workbook
-    return path, data_frames, xl
+    # Return the path of the workbook to export to, the two parsed Netlists, and the Excel file (if one was read)
+    return path, netlists, xl
+
+
+# Prompts for the htm netlist to compare the first selected htm file against
+def find_second_htm(files, first_file):
+    htm_files = [f for f in files if f != first_file and os.path.splitext(f)[1].lower() in (".htm", ".html")]
+    if len(htm_files) == 0:
+        print("No other htm files to compare {} against.".format(first_file))
+        raise IOError("Unable to find a second htm file.")
+
+    print("Files available to compare against: ")
+    print("-------------------------------------------------------------")
+    for i in range(0, len(htm_files)):
+        print("{}. {}".format(i+1, htm_files[i]))
+    print("-------------------------------------------------------------")
+    while True:
+        try:
+            file_num = int(input("Enter the number representing the file to compare against: "))
+            if 0 < file_num <= len(htm_files):
+                return htm_files[file_num - 1]
+        except ValueError:
+            pass
+        print("Entered number is invalid.")
 
 
 # Parses the excel file and converts it into a Pandas DataFrame
 def excel_to_dataframe(path):
+    xl, sheets = select_sheets(path)
+    return xl, [parse_sheet(xl, sheets[0]), parse_sheet(xl, sheets[1])]
+
+
+# Prompts for the two sheets of the excel file to compare. Returns the opened pd.ExcelFile and the two sheet names.
+def select_sheets(path):
     # Path verified in above file conditioning
+    import pandas as pd
     xl = pd.ExcelFile(path)
     sheet_names = xl.sheet_names
 
@@ -169,128 +425,1006 @@ def excel_to_dataframe(path):
 
     print("Sheets being compared are: {} and {}".format(sheet1, sheet2))
 
-    sheet1_parsed = xl.parse(sheet1)
-    cols = ["Net Name", "Net Pins"]
-    scols = set(cols)
-    svals1 = set(sheet1_parsed.columns.values.tolist())
-    # Sometimes there will be extra text at the top of the sheet that isn't "Net Name" or "Net Pins"
-    # we need to delete this if its not
-    if not scols.issubset(svals1):
-        sheet1_parsed = sheet1_parsed.drop([0])
-        sheet1_parsed.columns = cols
+    return xl, [sheet1, sheet2]
 
-    sheet2_parsed = xl.parse(sheet2)
-    svals2 = set(sheet2_parsed.columns.values.tolist())
-    if not scols.issubset(svals2):
-        sheet2_parsed = sheet2_parsed.drop([0])
-        sheet2_parsed.columns = cols
 
-    return xl, [sheet1_parsed, sheet2_parsed]
+# Parses one sheet of the excel file into a DataFrame with "Net Name" and "Net Pins" columns, read as text. Sometimes
+# there will be extra text at the top of the sheet above the "Net Name" / "Net Pins" header, so the first few rows are
+# read on their own to find it; then only the two header columns are read, starting after the header row. A sheet
+# without the header is read from the top of its first two columns.
+def parse_sheet(xl, sheet_name):
+    head = xl.parse(sheet_name, header=None, nrows=HEADER_SEARCH_ROWS, dtype=str)
+    start, columns = _find_header(head.itertuples(index=False))
+    sheet_parsed = xl.parse(sheet_name, header=None, skiprows=start, usecols=list(columns), dtype=str)
+    # The columns come back in the order they are in the sheet
+    if columns[0] > columns[1]:
+        sheet_parsed = sheet_parsed[list(columns)]
+    sheet_parsed.columns = NETLIST_COLUMNS
+    return sheet_parsed
 
 
 # Converts Pandas dataframe to Dictionary with Key, Value format as follows: {Key -> String, Value -> [List-of String]}
 def data_frame_to_dict(frame):
-    frame_dict = {}
-    for row in frame.values:
-        if len(row) == 2:
+    frame = frame[frame["Net Name"].notna()]
+    # Need to split so that each individual pin can be compared
+    return dict(zip(frame["Net Name"].tolist(), frame["Net Pins"].fillna("").str.split().tolist()))
+
+
+# Same as data_frame_to_dict but builds a Netlist, interning names into the given NameTable. The pins are split with
+# vectorized string operations and flattened into one long column of pins in net order (the CSR pins array), which is
+# interned in bulk rather than net by net.
+def data_frame_to_netlist(frame, names=None):
+    frame = frame[frame["Net Name"].notna()]
+    pin_lists = frame["Net Pins"].fillna("").str.split().tolist()
+
+    netlist = Netlist(names)
+    netlist.net_ids = array('i', netlist.names.intern_many(frame["Net Name"].tolist()))
+    netlist.pins = array('i', netlist.names.intern_many(list(itertools.chain.from_iterable(pin_lists))))
+    netlist.offsets.extend(itertools.accumulate(map(len, pin_lists)))
+    return netlist
+
+
+# Yields (net name, [pins]) from a read-only openpyxl worksheet, one row at a time, skipping anything above the header.
+# Like parse_sheet, only the two header columns are read once the header has been found.
+def _iter_sheet_nets(ws):
+    start, (name_col, pins_col) = _find_header(ws.iter_rows(max_row=HEADER_SEARCH_ROWS, values_only=True))
+    for row in ws.iter_rows(min_row=start + 1, max_col=max(name_col, pins_col) + 1, values_only=True):
+        if len(row) <= name_col or row[name_col] is None:
+            continue
+        net_pins = row[pins_col] if len(row) > pins_col else None
+        yield str(row[name_col]), [] if net_pins is None else str(net_pins).split()
+
+
+# Looks for the "Net Name" / "Net Pins" header in the first HEADER_SEARCH_ROWS rows of a sheet. Returns the number of
+# rows up to and including it and the (net name, net pins) columns, or (0, (0, 1)) if there is no header.
+def _find_header(rows):
+    for i, row in enumerate(itertools.islice(rows, HEADER_SEARCH_ROWS)):
+        row = list(row)
+        if NETLIST_COLUMNS[0] in row and NETLIST_COLUMNS[1] in row:
+            return i + 1, (row.index(NETLIST_COLUMNS[0]), row.index(NETLIST_COLUMNS[1]))
+    return 0, (0, 1)
+
+
+# Parses an Allegro Net List Report (.htm) into the same {Key -> String, Value -> [List-of String]} format as
+# data_frame_to_dict. The report is streamed a row at a time so memory use doesn't grow with the size of the file.
+def htm_to_dict(path):
+    return dict(_iter_htm_nets(path))
+
+
+# Same as htm_to_dict but builds a Netlist, interning names into the given NameTable
+def htm_to_netlist(path, names=None):
+    return Netlist.from_items(_iter_htm_nets(path), names)
+
+
+# Yields (net name, [pins]) for every net of a netlist without building the netlist as a whole. Net List Reports and
+# .xlsx sheets (through openpyxl's read-only mode) are streamed a row at a time; .xls sheets can only be read whole, by
+# pandas.
+def iter_nets(path, sheet_name=None):
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".htm", ".html"):
+        yield from _iter_htm_nets(path)
+        return
+    if extension not in (".xls", ".xlsx"):
+        raise IOError("Unsupported file type: {}".format(path))
+    if sheet_name is None:
+        raise IOError("A sheet name is needed to read a netlist from {}.".format(path))
+    if extension == ".xlsx":
+        import openpyxl
+        wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+        try:
+            if sheet_name not in wb.sheetnames:
+                raise IOError("Sheet {} not found in {}.".format(sheet_name, path))
+            yield from _iter_sheet_nets(wb[sheet_name])
+        finally:
+            wb.close()
+    else:
+        import pandas as pd
+        with pd.ExcelFile(path) as xl:
+            if sheet_name not in xl.sheet_names:
+                raise IOError("Sheet {} not found in {}.".format(sheet_name, path))
+            frame = parse_sheet(xl, sheet_name)
+        frame = frame[frame["Net Name"].notna()]
+        yield from zip(frame["Net Name"].tolist(), frame["Net Pins"].fillna("").str.split().tolist())
+
+
+def _iter_htm_nets(path):
+    header_found = False
+    net_name = None
+    net_pins = None
+    for row in read_report(path, "Net List Report"):
+        if len(row) < 2:
+            continue
+        if not header_found:
+            # Anything above the "Net Name" / "Net Pins" header row is report information
+            header_found = row[0] == "Net Name" and row[1] == "Net Pins"
+            continue
+        if row[0]:
+            if net_name is not None:
+                yield net_name, net_pins
             net_name = row[0]
-            # Need to split so that each individual pin can be compared
-            split_ref_des = row[1].split(" ")
-            frame_dict[net_name] = split_ref_des
-    return frame_dict
+            net_pins = row[1].split()
+        # Pins that wrap onto the next row belong to the previous net
+        elif net_name is not None:
+            net_pins.extend(row[1].split())
+    if not header_found:
+        raise IOError("Unable to find the Net Name/Net Pins table in {}.".format(path))
+    if net_name is not None:
+        yield net_name, net_pins
+
+
+NETLIST_COLUMNS = ["Net Name", "Net Pins"]
+# How far down a sheet the "Net Name" / "Net Pins" header is looked for
+HEADER_SEARCH_ROWS = 10
+EXCEL_READERS = ["pandas", "openpyxl"]
+
+PIN_RESULTS_SHEET = "Compared Pin Results"
+NET_RESULTS_SHEET = "Compared Net Results"
+REVISION_RESULTS_SHEET = "Compared Revisions"
+CONNECTIVITY_RESULTS_SHEET = "Compared Connectivity"
+CONNECTIVITY_FIELDS = ["kind", "first_nets", "second_nets", "pins"]
+
+FINGERPRINT_MASK = (1 << 64) - 1
+
+# Minimum Jaccard similarity between the pins of a removed and an added net for them to be reported as a rename
+RENAME_THRESHOLD = 0.5
+
+
+# Interns net and pin names to integer IDs. Netlists that share a NameTable give the same name the same ID, so they
+# can be compared on integers alone and only translated back to names when reporting.
+class NameTable(object):
+    def __init__(self):
+        self.ids = {}
+        self.names = []
+        self._hashes = array('Q')
+
+    def __len__(self):
+        return len(self.names)
+
+    def intern(self, name):
+        name_id = self.ids.get(name)
+        if name_id is None:
+            name_id = len(self.names)
+            self.ids[name] = name_id
+            self.names.append(name)
+        return name_id
+
+    # IDs of many names at once, interning the ones that are new
+    def intern_many(self, names):
+        ids = self.ids
+        new_names = [name for name in dict.fromkeys(names) if name not in ids]
+        ids.update(zip(new_names, range(len(self.names), len(self.names) + len(new_names))))
+        self.names.extend(new_names)
+        return list(map(ids.__getitem__, names))
+
+    def lookup(self, names):
+        return [self.names[name_id] for name_id in names]
+
+    # 64 bit hash of every name, by ID. Unlike hash() these are the same from one run to the next, so fingerprints built
+    # from them can be saved. Each name is only hashed once.
+    def hashes(self):
+        if len(self._hashes) < len(self.names):
+            blake2b = hashlib.blake2b
+            from_bytes = int.from_bytes
+            self._hashes.extend([from_bytes(blake2b(str(name).encode(), digest_size=8).digest(), 'little')
+                                 for name in self.names[len(self._hashes):]])
+        return self._hashes
+
+
+# Compact netlist stored in CSR form: net i is named names.names[net_ids[i]] and its pins are the IDs in
+# pins[offsets[i]:offsets[i + 1]]. Each pin costs 4 bytes instead of a Python string plus a list slot.
+class Netlist(object):
+    def __init__(self, names=None):
+        self.names = names if names is not None else NameTable()
+        self.net_ids = array('i')
+        self.offsets = array('q', [0])
+        self.pins = array('i')
+        self._index = None
+        self._fingerprints = None
+
+    @classmethod
+    def from_items(cls, items, names=None):
+        netlist = cls(names)
+        for net_name, pins in items:
+            netlist.add_net(net_name, pins)
+        return netlist
+
+    # Builds a Netlist from a {net name -> [pins]} dict
+    @classmethod
+    def from_dict(cls, netlist, names=None):
+        return cls.from_items(netlist.items(), names)
+
+    def __len__(self):
+        return len(self.net_ids)
+
+    def __repr__(self):
+        return "Netlist(nets={}, pins={})".format(len(self.net_ids), len(self.pins))
+
+    def add_net(self, net_name, pins):
+        intern = self.names.intern
+        self.net_ids.append(intern(net_name))
+        self.pins.extend(intern(pin) for pin in pins)
+        self.offsets.append(len(self.pins))
+        self._index = None
+        self._fingerprints = None
+
+    # Serializes the netlist on its own: only the names it uses are stored, renumbered from 0, with the CSR arrays and
+    # the net fingerprints if they have been worked out (they don't depend on the IDs, so they stay valid)
+    def to_bytes(self):
+        local_ids = {}
+        for name_id in self.net_ids:
+            local_ids.setdefault(name_id, len(local_ids))
+        for name_id in self.pins:
+            local_ids.setdefault(name_id, len(local_ids))
+        local_names = self.names.lookup(local_ids)
+        net_ids = array('i', [local_ids[name_id] for name_id in self.net_ids])
+        pins = array('i', [local_ids[name_id] for name_id in self.pins])
+        return pickle.dumps((local_names, net_ids, self.offsets, pins, self._fingerprints),
+                            protocol=pickle.HIGHEST_PROTOCOL)
+
+    # Inverse of to_bytes, interning the stored names into the given NameTable
+    @classmethod
+    def from_bytes(cls, data, names=None):
+        local_names, net_ids, offsets, pins, fingerprints = pickle.loads(data)
+        netlist = cls(names)
+        intern = netlist.names.intern
+        name_ids = [intern(name) for name in local_names]
+        # A fresh NameTable hands out the same IDs the names were stored with, so the arrays can be used as they are
+        if name_ids != list(range(len(name_ids))):
+            net_ids = array('i', [name_ids[i] for i in net_ids])
+            pins = array('i', [name_ids[i] for i in pins])
+        netlist.net_ids = net_ids
+        netlist.offsets = offsets
+        netlist.pins = pins
+        netlist._fingerprints = fingerprints
+        return netlist
+
+    def net_pins(self, row):
+        return self.pins[self.offsets[row]:self.offsets[row + 1]]
+
+    # {net ID -> row}, built once on first use. A net listed twice maps to its last row.
+    def index(self):
+        if self._index is None:
+            self._index = dict(zip(self.net_ids, range(len(self.net_ids))))
+        return self._index
+
+    # Yields (net name, [pins]) for every net
+    def items(self):
+        names = self.names.names
+        for row in range(len(self.net_ids)):
+            yield names[self.net_ids[row]], self.names.lookup(self.net_pins(row))
+
+    def to_dict(self):
+        return dict(self.items())
+
+    # Fingerprint of each net's pin set, by row: the sum of the hashes of its pins, so the order (and repeats) of the
+    # pins don't matter. Nets with the same pins get the same fingerprint in any netlist, in any run. Worked out once
+    # and kept, including in the parse cache (see load_netlist's fingerprints option).
+    def fingerprints(self):
+        if self._fingerprints is None:
+            get_hash = self.names.hashes().__getitem__
+            pins = self.pins
+            ends = itertools.islice(self.offsets, 1, None)
+            self._fingerprints = array('Q', [sum(map(get_hash, set(pins[start:end]))) & FINGERPRINT_MASK
+                                             for start, end in zip(self.offsets, ends)])
+        return self._fingerprints
+
+    # Returns this netlist with its names interned in the given NameTable (itself if it already uses that table)
+    def rebind(self, names):
+        if names is self.names:
+            return self
+        netlist = Netlist.from_items(self.items(), names)
+        netlist._fingerprints = self._fingerprints
+        return netlist
+
+
+# Pin level differences for a net that exists in both sheets
+class NetDiff(object):
+    def __init__(self, net_name, removed_pins, added_pins):
+        self.net_name = net_name
+        # Pins only found on the net in the first sheet
+        self.removed_pins = removed_pins
+        # Pins only found on the net in the second sheet
+        self.added_pins = added_pins
+
+    def __repr__(self):
+        return "NetDiff({!r}, removed={!r}, added={!r})".format(self.net_name, self.removed_pins, self.added_pins)
+
+
+# A net in the first sheet that shows up under a different name in the second sheet, possibly with a few pins changed
+class NetRename(object):
+    def __init__(self, old_name, new_name, removed_pins, added_pins):
+        self.old_name = old_name
+        self.new_name = new_name
+        # Pins only found on the old net
+        self.removed_pins = removed_pins
+        # Pins only found on the new net
+        self.added_pins = added_pins
+
+    def __repr__(self):
+        return "NetRename({!r} -> {!r}, removed={!r}, added={!r})".format(
+            self.old_name, self.new_name, self.removed_pins, self.added_pins)
 
 
-# Compares the two sheets and outputs two different dictionaries representing inconsistencies between
-# the net pins and net names
-def compare_sheets(sheet1, sheet2):
+# Result of comparing two sheets. Nets keep the order they were listed in within their own sheet. Everything is held
+# as IDs from the sheets' shared NameTable; the removed_nets, added_nets and changed_nets properties and the
+# *_results methods translate back to names.
+class SheetDiff(object):
+    def __init__(self, names):
+        self.names = names
+        # [(net ID, pin IDs)] for nets only in the first sheet
+        self.removed = []
+        # [(net ID, pin IDs)] for nets only in the second sheet
+        self.added = []
+        # [(net ID, removed pin IDs, added pin IDs)] for nets in both sheets whose pins disagree
+        self.changed = []
+        # [(old net ID, new net ID, new net's pin IDs, removed pin IDs, added pin IDs)] for nets that were renamed
+        # between the sheets
+        self.renamed = []
+
+    def __bool__(self):
+        return bool(self.removed or self.added or self.changed or self.renamed)
+
+    def __repr__(self):
+        return "SheetDiff(removed={}, added={}, changed={}, renamed={})".format(
+            len(self.removed), len(self.added), len(self.changed), len(self.renamed))
+
+    # {net name -> [pins]} for nets only in the first sheet
+    @property
+    def removed_nets(self):
+        return self._nets_by_name(self.removed)
+
+    # {net name -> [pins]} for nets only in the second sheet
+    @property
+    def added_nets(self):
+        return self._nets_by_name(self.added)
+
+    # {net name -> NetDiff} for nets in both sheets whose pins disagree
+    @property
+    def changed_nets(self):
+        names = self.names
+        return {names.names[net_id]: NetDiff(names.names[net_id], names.lookup(removed), names.lookup(added))
+                for net_id, removed, added in self.changed}
+
+    # {old net name -> NetRename} for nets that were renamed between the sheets
+    @property
+    def renamed_nets(self):
+        names = self.names
+        return {names.names[old_id]: NetRename(names.names[old_id], names.names[new_id],
+                                               names.lookup(removed), names.lookup(added))
+                for old_id, new_id, _, removed, added in self.renamed}
+
+    def _nets_by_name(self, nets):
+        names = self.names
+        return {names.names[net_id]: names.lookup(pins) for net_id, pins in nets}
+
+    # Yields one dict per difference, in a flat form for machine readable output (see result_writers): "kind" is
+    # "changed", "removed", "added" or "renamed", "net" the net name (the old name for renames), "new_net" the new name of
+    # a renamed net, "pins" the pins of removed/added/renamed nets and "removed_pins"/"added_pins" the pin differences
+    # of changed and renamed nets. Names are only looked up as each record is produced.
+    def records(self):
+        names = self.names.names
+        lookup = self.names.lookup
+        for net_id, removed, added in self.changed:
+            yield {"kind": "changed", "net": names[net_id], "new_net": None, "pins": [],
+                   "removed_pins": lookup(removed), "added_pins": lookup(added)}
+        for kind, nets in (("removed", self.removed), ("added", self.added)):
+            for net_id, pins in nets:
+                yield {"kind": kind, "net": names[net_id], "new_net": None, "pins": lookup(pins),
+                       "removed_pins": [], "added_pins": []}
+        for old_id, new_id, pins, removed, added in self.renamed:
+            yield {"kind": "renamed", "net": names[old_id], "new_net": names[new_id], "pins": lookup(pins),
+                   "removed_pins": lookup(removed), "added_pins": lookup(added)}
+
+    # Rows for "Compared Pin Results": each removed pin is shown next to an added pin as "[ first v second ]",
+    # with "-" standing in when one side has more pins than the other
+    def pin_results(self):
+        results = {}
+        for net_name, net_diff in self.changed_nets.items():
+            results[net_name] = _pin_pairs(net_diff.removed_pins, net_diff.added_pins)
+        return results
+
+    # Rows for "Compared Net Results". Renamed nets list their pins, or their pin differences if any pins moved.
+    def net_results(self):
+        results = {}
+        for net_name, pins in self.removed_nets.items():
+            results["{} not in second sheet".format(net_name)] = pins
+        for net_name, pins in self.added_nets.items():
+            results["{} not in first sheet".format(net_name)] = pins
+        names = self.names
+        for old_id, new_id, pins, removed, added in self.renamed:
+            old_name, new_name = names.names[old_id], names.names[new_id]
+            if removed or added:
+                key = "{} renamed to {} with pin changes".format(old_name, new_name)
+                results[key] = _pin_pairs(names.lookup(removed), names.lookup(added))
+            else:
+                results["{} renamed to {}".format(old_name, new_name)] = names.lookup(pins)
+        return results
+
+
+def _pin_pairs(removed, added):
+    pairs = []
+    for i in range(max(len(removed), len(added))):
+        pin1 = removed[i] if i < len(removed) else "-"
+        pin2 = added[i] if i < len(added) else "-"
+        pairs.append("[ {} v {} ]".format(pin1, pin2))
+    return pairs
+
+
+# Compares the two sheets and returns a SheetDiff holding the nets that were removed, added or changed between them.
+# Sheets can be given as {net name -> [pins]} dicts or as Netlists; either way both end up sharing one NameTable and
+# the comparison runs on integer IDs. Each sheet is indexed once so the comparison is linear in the number of pins,
+# and does not depend on the order (or count) of the nets in either sheet.
+# With detect_renames, removed and added nets whose pins mostly agree (see match_renamed_nets) are reported as renames.
+def compare_sheets(sheet1, sheet2, detect_renames=True, rename_threshold=RENAME_THRESHOLD):
     if sheet1 is None or sheet2 is None:
         raise IOError("Unable to parse due to an error.")
 
-    if (not isinstance(sheet1, dict)) or (not isinstance(sheet2, dict)):
-        raise IOError("Unable to parse something that is not a dictionary")
-
-    diff_dict_pins = {}
-    diff_dict_nets = {}
-    for net_name1, net_name2 in zip(sheet1, sheet2):
-        if net_name1 in sheet2:
-            # Create a tuple of (Sheet1CellValue, Sheet2CellValue)
-            # This is used to easily show the differences between the two sheets
-            for val1, val2 in zip(sheet1[net_name1], sheet2[net_name1]):
-                if val1 not in sheet2[net_name1]:
-                    if net_name1 not in diff_dict_pins:
-                        diff_dict_pins[net_name1] = []
-                    diff_dict_pins[net_name1].append("[ {} v {} ]".format(val1, val2))
-        # Triggers if a net name in the first compared sheet is not in the second compared sheet
-        else:
-            # change to make more elegant...
-            diff_dict_nets["{} not in second sheet".format(net_name1)] = sheet1[net_name1]
-            if net_name2 not in sheet1:
-                diff_dict_nets["{} not in first sheet".format(net_name2)] = sheet2[net_name2]
+    if (not isinstance(sheet1, (dict, Netlist))) or (not isinstance(sheet2, (dict, Netlist))):
+        raise IOError("Unable to parse something that is not a dictionary or Netlist")
+
+    with profiling.stage("compare_sheets") as counts:
+        names = sheet1.names if isinstance(sheet1, Netlist) else NameTable()
+        netlist1 = _as_netlist(sheet1, names)
+        netlist2 = _as_netlist(sheet2, names)
+
+        diff = SheetDiff(names)
+        index1 = netlist1.index()
+        index2 = netlist2.index()
+        for row1, net_id in enumerate(netlist1.net_ids):
+            row2 = index2.get(net_id)
+            # Triggers if a net name in the first compared sheet is not in the second compared sheet
+            if row2 is None:
+                diff.removed.append((net_id, netlist1.net_pins(row1)))
+                continue
+            changed = _diff_pins(netlist1.net_pins(row1), netlist2.net_pins(row2))
+            if changed is not None:
+                diff.changed.append((net_id,) + changed)
+
+        for row2, net_id in enumerate(netlist2.net_ids):
+            if net_id not in index1:
+                diff.added.append((net_id, netlist2.net_pins(row2)))
 
-            # print("Key: {} \t Value: {}".format(net_name, diff_dict_nets[net_name]))
-    return diff_dict_pins, diff_dict_nets
+        if detect_renames:
+            with profiling.stage("match_renamed_nets"):
+                match_renamed_nets(diff, rename_threshold)
+        _count_diff(counts, netlist1, netlist2, diff)
+        return diff
 
 
-# Exports the dictionary to the Excel Spreadsheet under the given sheet name
-def export(file_path, diff_dict, sheet_name, wb):
-    if sheet_name not in wb.sheetnames:
-        wb.create_sheet(title=sheet_name)
-        print(wb.sheetnames)
-    ws = wb[sheet_name]
+def _count_diff(counts, netlist1, netlist2, diff):
+    counts.update(nets=len(netlist1.net_ids) + len(netlist2.net_ids), pins=len(netlist1.pins) + len(netlist2.pins),
+                  removed=len(diff.removed), added=len(diff.added), changed=len(diff.changed),
+                  renamed=len(diff.renamed))
+
+
+# Returns the (removed, added) pins between two versions of a net, or None if they hold the same pins
+def _diff_pins(pins1, pins2):
+    if pins1 == pins2:
+        return None
+    pin_set1 = set(pins1)
+    pin_set2 = set(pins2)
+    if pin_set1 == pin_set2:
+        return None
+    removed = array('i', [pin for pin in pins1 if pin not in pin_set2])
+    added = array('i', [pin for pin in pins2 if pin not in pin_set1])
+    return removed, added
+
+
+# Same result as compare_sheets, in time that grows with the size of the change rather than the size of the board. Nets
+# are matched up by name and their fingerprints (Netlist.fingerprints) compared a whole netlist at a time, without going
+# through the nets one by one in Python; pins are only compared for the nets whose fingerprints differ, plus removed
+# and added nets. This only pays off once the fingerprints are known: load netlists with fingerprints=True so they are
+# worked out once per file revision and kept in the parse cache. Nets whose pins differ but whose fingerprints collide
+# (a one in 2^64 chance) are taken to be unchanged.
+def compare_incremental(sheet1, sheet2, detect_renames=True, rename_threshold=RENAME_THRESHOLD):
+    if sheet1 is None or sheet2 is None:
+        raise IOError("Unable to parse due to an error.")
 
-    # Bolds the font for the "Net Name" and "Net Pins" Column (Col A1 and B1 respectively)
+    if (not isinstance(sheet1, (dict, Netlist))) or (not isinstance(sheet2, (dict, Netlist))):
+        raise IOError("Unable to parse something that is not a dictionary or Netlist")
+
+    with profiling.stage("compare_incremental") as counts:
+        names = sheet1.names if isinstance(sheet1, Netlist) else NameTable()
+        netlist1 = _as_netlist(sheet1, names)
+        netlist2 = _as_netlist(sheet2, names)
+        index1 = netlist1.index()
+        index2 = netlist2.index()
+
+        # Row in the second netlist of every net of the first, and the fingerprint of that row, with a row past the end
+        # (whose fingerprint matches nothing) standing in for nets that aren't in the second netlist
+        missing = len(netlist2.net_ids)
+        rows2 = list(map(index2.get, netlist1.net_ids, itertools.repeat(missing)))
+        fingerprints1 = netlist1.fingerprints()
+        fingerprints2 = netlist2.fingerprints().tolist()
+        fingerprints2.append(-1)
+        matched = map(fingerprints2.__getitem__, rows2)
+        differing = itertools.compress(range(len(fingerprints1)), map(operator.ne, fingerprints1, matched))
+
+        diff = SheetDiff(names)
+        compared = 0
+        for row1 in differing:
+            net_id = netlist1.net_ids[row1]
+            row2 = rows2[row1]
+            if row2 == missing:
+                diff.removed.append((net_id, netlist1.net_pins(row1)))
+                continue
+            compared += 1
+            changed = _diff_pins(netlist1.net_pins(row1), netlist2.net_pins(row2))
+            if changed is not None:
+                diff.changed.append((net_id,) + changed)
+
+        added = itertools.compress(range(missing), map(operator.not_, map(index1.__contains__, netlist2.net_ids)))
+        for row2 in added:
+            diff.added.append((netlist2.net_ids[row2], netlist2.net_pins(row2)))
+
+        if detect_renames:
+            with profiling.stage("match_renamed_nets"):
+                match_renamed_nets(diff, rename_threshold)
+        _count_diff(counts, netlist1, netlist2, diff)
+        counts["compared"] = compared
+        return diff
+
+
+# Pairs up nets that were removed from the first sheet with nets that were added in the second sheet when they connect
+# (nearly) the same pins, e.g. auto-generated names like N12345 -> N67890. Matched pairs are moved from diff.removed
+# and diff.added to diff.renamed.
+#   1. Exact: every removed net is keyed by its pin set, so an added net with the same pins is found with one lookup.
+#   2. Near: every pin of the remaining removed nets points back at its net. An added net counts how many of its pins
+#      land on each removed net, which gives the exact Jaccard similarity of every overlapping pair without comparing
+#      unrelated nets. Pairs at or above the threshold are matched greedily, most similar first.
+# A pin sits on one net per netlist, so both steps are linear in the number of pins on removed/added nets.
+def match_renamed_nets(diff, threshold=RENAME_THRESHOLD):
+    if not diff.removed or not diff.added:
+        return diff
+
+    removed_sets = [frozenset(pins) for _, pins in diff.removed]
+    added_sets = [frozenset(pins) for _, pins in diff.added]
+    matched_removed = set()
+    matched_added = set()
+    pairs = []
+
+    by_pin_set = {}
+    for i, pin_set in enumerate(removed_sets):
+        # Nets without pins can't be told apart by their pins
+        if pin_set:
+            by_pin_set.setdefault(pin_set, []).append(i)
+    for j, pin_set in enumerate(added_sets):
+        candidates = by_pin_set.get(pin_set)
+        if candidates:
+            i = candidates.pop(0)
+            matched_removed.add(i)
+            matched_added.add(j)
+            pairs.append((i, j))
+
+    if threshold <= 1:
+        pin_owner = {}
+        for i, pin_set in enumerate(removed_sets):
+            if i not in matched_removed:
+                for pin in pin_set:
+                    pin_owner[pin] = i
+        candidates = []
+        for j, pin_set in enumerate(added_sets):
+            if j in matched_added:
+                continue
+            overlaps = {}
+            for pin in pin_set:
+                i = pin_owner.get(pin)
+                if i is not None:
+                    overlaps[i] = overlaps.get(i, 0) + 1
+            for i, overlap in overlaps.items():
+                similarity = overlap / (len(removed_sets[i]) + len(pin_set) - overlap)
+                if similarity >= threshold:
+                    candidates.append((-similarity, i, j))
+        candidates.sort()
+        for _, i, j in candidates:
+            if i not in matched_removed and j not in matched_added:
+                matched_removed.add(i)
+                matched_added.add(j)
+                pairs.append((i, j))
+
+    for i, j in sorted(pairs):
+        old_id, old_pins = diff.removed[i]
+        new_id, new_pins = diff.added[j]
+        removed = array('i', [pin for pin in old_pins if pin not in added_sets[j]])
+        added = array('i', [pin for pin in new_pins if pin not in removed_sets[i]])
+        diff.renamed.append((old_id, new_id, new_pins, removed, added))
+    diff.removed = [net for i, net in enumerate(diff.removed) if i not in matched_removed]
+    diff.added = [net for j, net in enumerate(diff.added) if j not in matched_added]
+    return diff
+
+
+def _as_netlist(sheet, names):
+    if isinstance(sheet, Netlist):
+        return sheet.rebind(names)
+    return Netlist.from_dict(sheet, names)
+
+
+# Result of compare_revisions: how every net looks across K revisions of a netlist. Like SheetDiff, everything is held
+# as IDs from the revisions' shared NameTable.
+class RevisionDiff(object):
+    def __init__(self, names, labels):
+        self.names = names
+        # Name of each revision, in order
+        self.labels = labels
+        # {net ID -> (variant per revision)} for every net in any revision, in the order the nets were first seen. Each
+        # distinct set of pins a net has is numbered from 0 in the order they were seen, and None means the net isn't in
+        # that revision, so a net whose variants are all 0 is the same in every revision.
+        self.variants = {}
+        # {net ID -> {pin ID -> revision bitmask}} for the nets that diverged: bit k is set if the pin is on the net in
+        # revision k. Pins are in the order they were first seen.
+        self.membership = {}
+
+    def __repr__(self):
+        return "RevisionDiff(revisions={}, nets={}, diverged={})".format(
+            len(self.labels), len(self.variants), len(self.membership))
+
+    # IDs of the nets that aren't the same in every revision
+    @property
+    def diverged(self):
+        return list(self.membership)
+
+    # Index of the first revision where the net differs from the first revision (appears, disappears or has other
+    # pins), or None if it is the same in every revision
+    def first_diverged(self, net_id):
+        variants = self.variants[net_id]
+        for k in range(1, len(variants)):
+            if variants[k] != variants[0]:
+                return k
+        return None
+
+    # Pin IDs on a net that diverged in the given revision
+    def net_pins(self, net_id, revision):
+        bit = 1 << (revision % len(self.labels))
+        return array('i', [pin for pin, mask in self.membership[net_id].items() if mask & bit])
+
+    # SheetDiff between two of the revisions, read out of the membership bitmasks without going back to the netlists.
+    # Nets are listed in the order they were first seen in any revision.
+    def sheet_diff(self, first=0, second=-1, detect_renames=True, rename_threshold=RENAME_THRESHOLD):
+        diff = SheetDiff(self.names)
+        for net_id in self.membership:
+            variants = self.variants[net_id]
+            if variants[first] == variants[second]:
+                continue
+            if variants[first] is None:
+                diff.added.append((net_id, self.net_pins(net_id, second)))
+            elif variants[second] is None:
+                diff.removed.append((net_id, self.net_pins(net_id, first)))
+            else:
+                changed = _diff_pins(self.net_pins(net_id, first), self.net_pins(net_id, second))
+                if changed is not None:
+                    diff.changed.append((net_id,) + changed)
+        if detect_renames:
+            match_renamed_nets(diff, rename_threshold)
+        return diff
+
+    # Field names of records(): "net", "first_diverged" and then the label of each revision
+    def fields(self):
+        return ["net", "first_diverged"] + self.labels
+
+    # Yields one dict per net that diverged, for export_revisions and result_writers: "net" is the net name,
+    # "first_diverged" the label of the revision it first diverged in, and under each revision's label is how the net
+    # differs there from the first revision: "missing" if it isn't in that revision, otherwise the pins it gained and
+    # lost as "+pin -pin" (empty if it has the same pins).
+    def records(self):
+        names = self.names.names
+        labels = self.labels
+        for net_id, membership in self.membership.items():
+            variants = self.variants[net_id]
+            record = {"net": names[net_id], "first_diverged": labels[self.first_diverged(net_id)]}
+            for k, label in enumerate(labels):
+                if variants[k] is None:
+                    record[label] = "missing"
+                    continue
+                bit = 1 << k
+                added = ["+{}".format(names[pin]) for pin, mask in membership.items() if mask & bit and not mask & 1]
+                removed = ["-{}".format(names[pin]) for pin, mask in membership.items() if mask & 1 and not mask & bit]
+                record[label] = " ".join(added + removed)
+            yield record
+
+
+# Compares K revisions of a netlist at once and returns a RevisionDiff. Revisions can be given as {net name -> [pins]}
+# dicts or as Netlists; either way they all end up sharing one NameTable (load_netlists reads them that way already).
+# Every net's pins are fingerprinted once per revision (and kept in the parse cache when loaded with fingerprints=True).
+# Intersecting the (net, fingerprint) pairs of all the revisions, a whole revision at a time, splits the nets into those
+# that are the same everywhere and those that diverged, and only the nets that diverged are then gone through one by
+# one, gathering their pins into a bitmask of the revisions each pin is on. Getting the same picture pairwise takes
+# K * (K - 1) / 2 calls to compare_sheets; any of those pairs can still be had from RevisionDiff.sheet_diff.
+# labels name the revisions, "Revision 1", "Revision 2", ... by default.
+def compare_revisions(sheets, labels=None):
+    if len(sheets) < 2:
+        raise IOError("At least two netlists are needed to compare.")
+
+    if any(sheet is None for sheet in sheets):
+        raise IOError("Unable to parse due to an error.")
+
+    if not all(isinstance(sheet, (dict, Netlist)) for sheet in sheets):
+        raise IOError("Unable to parse something that is not a dictionary or Netlist")
+
+    if labels is None:
+        labels = ["Revision {}".format(k + 1) for k in range(len(sheets))]
+    elif len(labels) != len(sheets) or len(set(labels)) != len(labels):
+        raise ValueError("Expected {} different labels, got {!r}".format(len(sheets), labels))
+
+    with profiling.stage("compare_revisions") as counts:
+        names = sheets[0].names if isinstance(sheets[0], Netlist) else NameTable()
+        netlists = [_as_netlist(sheet, names) for sheet in sheets]
+        # Row of each net in each revision (its last row if it is listed twice), and the fingerprint of each row with a
+        # row past the end (whose fingerprint matches nothing) standing in for nets that aren't in that revision
+        indexes = [netlist.index() for netlist in netlists]
+        fingerprints = []
+        for netlist in netlists:
+            fingerprints.append(netlist.fingerprints().tolist())
+            fingerprints[-1].append(-1)
+
+        # Nets of the first revision with the same fingerprint in each of the others, narrowed down a revision at a time
+        same_ids = list(indexes[0])
+        same_fingerprints = list(map(fingerprints[0].__getitem__, indexes[0].values()))
+        for netlist, index, revision in zip(netlists[1:], indexes[1:], fingerprints[1:]):
+            rows = map(index.get, same_ids, itertools.repeat(len(netlist.net_ids)))
+            keep = list(map(operator.eq, map(revision.__getitem__, rows), same_fingerprints))
+            same_ids = list(itertools.compress(same_ids, keep))
+            same_fingerprints = list(itertools.compress(same_fingerprints, keep))
+        unchanged = set(same_ids)
+
+        diff = RevisionDiff(names, list(labels))
+        # Every net, in the order they were first seen, starts out the same in every revision
+        diff.variants = dict.fromkeys(itertools.chain.from_iterable(netlist.net_ids for netlist in netlists),
+                                      (0,) * len(netlists))
+        for net_id in itertools.filterfalse(unchanged.__contains__, list(diff.variants)):
+            net_rows = [index.get(net_id) for index in indexes]
+            seen = {}
+            diff.variants[net_id] = tuple(None if row is None else seen.setdefault(revision[row], len(seen))
+                                          for row, revision in zip(net_rows, fingerprints))
+            membership = {}
+            for k, row in enumerate(net_rows):
+                if row is not None:
+                    bit = 1 << k
+                    for pin in netlists[k].net_pins(row):
+                        membership[pin] = membership.get(pin, 0) | bit
+            diff.membership[net_id] = membership
+
+        counts.update(revisions=len(netlists), nets=sum(len(netlist.net_ids) for netlist in netlists),
+                      pins=sum(len(netlist.pins) for netlist in netlists), diverged=len(diff.membership))
+        return diff
+
+
+# Result of compare_connectivity: how the pins of the first netlist were regrouped into the nets of the second, whatever
+# the nets are called. Held as IDs from the netlists' shared NameTable.
+class ConnectivityDiff(object):
+    def __init__(self, names):
+        self.names = names
+        # [(net ID, [net IDs])] for each net of the second netlist that most of the pins of two or more nets of the
+        # first went to (a short), with the nets it joins. Sorted by name.
+        self.merged = []
+        # [(net ID, [net IDs])] for each net of the first netlist that two or more nets of the second got most of their
+        # pins from (an open), with the nets it was split into. Sorted by name.
+        self.split = []
+        # [(net ID, net ID, [pin IDs])] for pins that moved from a net of the first netlist to a net of the second that
+        # isn't the same net or part of a merge or split with it, grouped by the net they left and the net they joined
+        # and sorted by their names
+        self.moved = []
+
+    def __bool__(self):
+        return bool(self.merged or self.split or self.moved)
+
+    def __repr__(self):
+        return "ConnectivityDiff(merged={}, split={}, moved={})".format(
+            len(self.merged), len(self.split), sum(len(pins) for _, _, pins in self.moved))
+
+    # Yields one dict per change, for export_connectivity and result_writers (see CONNECTIVITY_FIELDS): "kind" is
+    # "merged", "split" or "moved", "first_nets" and "second_nets" the nets involved in the first and second netlist and
+    # "pins" the pins that moved (empty for merged and split nets).
+    def records(self):
+        names = self.names.names
+        lookup = self.names.lookup
+        for net_id, old_ids in self.merged:
+            yield {"kind": "merged", "first_nets": lookup(old_ids), "second_nets": [names[net_id]], "pins": []}
+        for net_id, new_ids in self.split:
+            yield {"kind": "split", "first_nets": [names[net_id]], "second_nets": lookup(new_ids), "pins": []}
+        for old_id, new_id, pins in self.moved:
+            yield {"kind": "moved", "first_nets": [names[old_id]], "second_nets": [names[new_id]],
+                   "pins": lookup(pins)}
+
+
+# Compares how the pins are connected in two netlists, regardless of net names, and returns a ConnectivityDiff of the
+# nets that were merged (shorts), split (opens) and the pins that moved between nets. Takes the same sheets as
+# compare_sheets.
+# Every net of both netlists is a node in a union-find, and each pin on a net in both netlists joins its two nets. A
+# net whose pins all stay together ends up in a group of two (itself and its counterpart, renamed or not), so only the
+# larger groups need to be looked at (see _regroup_pins): there each net is paired with at most one net on the other
+# side, the one it shares most pins with, as the same net. Several nets that each send most of their pins to one net,
+# without carrying on as a net of their own, were merged into it; a net whose pins make up most of several nets was
+# split into them. Any other pin that ended up away from its net's pair has moved. None of this depends on the order
+# the nets are listed in. Pins that are only in one of the netlists aren't connectivity changes and are left to
+# compare_sheets. All of this is near-linear in the number of pins.
+def compare_connectivity(sheet1, sheet2):
+    if sheet1 is None or sheet2 is None:
+        raise IOError("Unable to parse due to an error.")
+
+    if (not isinstance(sheet1, (dict, Netlist))) or (not isinstance(sheet2, (dict, Netlist))):
+        raise IOError("Unable to parse something that is not a dictionary or Netlist")
+
+    with profiling.stage("compare_connectivity") as counts:
+        names = sheet1.names if isinstance(sheet1, Netlist) else NameTable()
+        netlist1 = _as_netlist(sheet1, names)
+        netlist2 = _as_netlist(sheet2, names)
+        count1 = len(netlist1.net_ids)
+
+        # Row of the net each pin is on in the second netlist, by pin ID (a pin listed on several nets counts as being
+        # on the last one)
+        pin_rows2 = array('i', [-1]) * len(names)
+        offsets2 = netlist2.offsets
+        for row2 in range(len(netlist2.net_ids)):
+            for pin in netlist2.pins[offsets2[row2]:offsets2[row2 + 1]]:
+                pin_rows2[pin] = row2
+
+        # Nodes are the rows of the first netlist followed by the rows of the second
+        parent = array('i', range(count1 + len(netlist2.net_ids)))
+        size = array('i', [1]) * len(parent)
+        for row1 in range(count1):
+            last_row2 = -1
+            for pin in netlist1.net_pins(row1):
+                row2 = pin_rows2[pin]
+                # Most pins of a net are on the same net as the pin before them, which is already joined
+                if row2 < 0 or row2 == last_row2:
+                    continue
+                last_row2 = row2
+                root1 = _find(parent, row1)
+                root2 = _find(parent, count1 + row2)
+                if root1 != root2:
+                    if size[root1] < size[root2]:
+                        root1, root2 = root2, root1
+                    parent[root2] = root1
+                    size[root1] += size[root2]
+
+        groups = {}
+        for node in range(len(parent)):
+            root = _find(parent, node)
+            if size[root] > 2:
+                groups.setdefault(root, []).append(node)
+
+        diff = ConnectivityDiff(names)
+        moved = {}
+        for nodes in groups.values():
+            _regroup_pins(netlist1, netlist2, pin_rows2, [node for node in nodes if node < count1], diff, moved)
+
+        # Nets were collected by row above, and are reported by ID in name order
+        net_name = names.names.__getitem__
+        diff.merged = sorted(((netlist2.net_ids[row2], sorted([netlist1.net_ids[row1] for row1 in rows1], key=net_name))
+                              for row2, rows1 in diff.merged), key=lambda merge: net_name(merge[0]))
+        diff.split = sorted(((netlist1.net_ids[row1], sorted([netlist2.net_ids[row2] for row2 in rows2], key=net_name))
+                             for row1, rows2 in diff.split), key=lambda split: net_name(split[0]))
+        diff.moved = sorted(((netlist1.net_ids[row1], netlist2.net_ids[row2], pins)
+                             for (row1, row2), pins in moved.items()),
+                            key=lambda move: (net_name(move[0]), net_name(move[1])))
+        counts.update(nets=count1 + len(netlist2.net_ids), pins=len(netlist1.pins) + len(netlist2.pins),
+                      groups=len(groups), merged=len(diff.merged), split=len(diff.split),
+                      moved=sum(len(pins) for _, _, pins in diff.moved))
+        return diff
+
+
+def _find(parent, node):
+    while parent[node] != node:
+        # Path halving: every other node on the way up is pointed at its grandparent
+        parent[node] = parent[parent[node]]
+        node = parent[node]
+    return node
+
+
+# Works out the merges, splits and moved pins within one group of nets that share pins (see compare_connectivity).
+# Merges and splits are added to diff by row; moved pins are collected in moved, {(row1, row2) -> pin IDs}.
+def _regroup_pins(netlist1, netlist2, pin_rows2, rows1, diff, moved):
+    # {(row1, row2) -> number of pins they share}
+    shared = {}
+    for row1 in rows1:
+        for pin in netlist1.net_pins(row1):
+            row2 = pin_rows2[pin]
+            if row2 >= 0:
+                shared[(row1, row2)] = shared.get((row1, row2), 0) + 1
+
+    # Each net is paired with at most one net on the other side as the same net, the pairs sharing the most pins first.
+    # Ties go to a net that kept its name, then by name, so the order the nets are listed in doesn't matter.
+    net_names = netlist1.names.names
+
+    def pairing_order(item):
+        (row1, row2), count = item
+        net_id1, net_id2 = netlist1.net_ids[row1], netlist2.net_ids[row2]
+        return -count, net_id1 != net_id2, net_names[net_id1], net_names[net_id2], row1, row2
+
+    pair1 = {}
+    pair2 = {}
+    for (row1, row2), _ in sorted(shared.items(), key=pairing_order):
+        if row1 not in pair2 and row2 not in pair1:
+            pair2[row1] = row2
+            pair1[row2] = row1
+
+    # Pins each net shares with the other netlist
+    total1 = {}
+    total2 = {}
+    for (row1, row2), count in shared.items():
+        total1[row1] = total1.get(row1, 0) + count
+        total2[row2] = total2.get(row2, 0) + count
+
+    # A net takes part in a merge (split) if it sends (gets) a majority of its shared pins, and at least two, to (from)
+    # the same net, and isn't paired with another net, i.e. it doesn't carry on as a net of its own
+    merged = {}
+    split = {}
+    for (row1, row2), count in shared.items():
+        if count < 2:
+            continue
+        if count * 2 > total1[row1] and pair2.get(row1, row2) == row2:
+            merged.setdefault(row2, []).append(row1)
+        if count * 2 > total2[row2] and pair1.get(row2, row1) == row1:
+            split.setdefault(row1, []).append(row2)
+    regrouped = set()
+    for row2, rows in merged.items():
+        if len(rows) > 1:
+            diff.merged.append((row2, rows))
+            regrouped.update((row1, row2) for row1 in rows)
+    for row1, rows in split.items():
+        if len(rows) > 1:
+            diff.split.append((row1, rows))
+            regrouped.update((row1, row2) for row2 in rows)
+
+    for row1 in rows1:
+        for pin in netlist1.net_pins(row1):
+            row2 = pin_rows2[pin]
+            if row2 >= 0 and pair2.get(row1) != row2 and (row1, row2) not in regrouped:
+                moved.setdefault((row1, row2), array('i')).append(pin)
+
+
+# Exports the dictionary to the Excel Spreadsheet under the given sheet name. Any existing sheet with that name is
+# replaced. Saving is left to the caller.
+def export(diff_dict, sheet_name, wb):
+    # Can only have hashable values (Strings, integers, etc., NOT lists) as values in a cell
+    export_rows(["Net Name", "Net Pins"], lambda: ([key, " ".join(pins)] for key, pins in diff_dict.items()),
+                sheet_name, wb)
+
+
+# Writes a header and rows of strings to a new sheet, replacing any existing sheet with that name, and returns the
+# number of rows written. make_rows returns a fresh iterator over the rows each time it is called. A write-only sheet
+# needs its column widths before its first row, so the rows are gone through twice: once to size the columns and once
+# to append them. That builds every row twice, but only one row is held in memory at a time, so the sheet is streamed
+# straight into the workbook.
+def export_rows(header, make_rows, sheet_name, wb):
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+    from openpyxl.utils import get_column_letter
+
+    index = None
+    if sheet_name in wb.sheetnames:
+        index = wb.sheetnames.index(sheet_name)
+        wb.remove(wb[sheet_name])
+    ws = wb.create_sheet(title=sheet_name, index=index)
+
+    # Bolds the font for the header row ("Net Name" and "Net Pins" in A1 and B1 for the comparison results)
     font_column = Font(name='Times New Roman',
                        size=10,
                        bold=True)
 
-    ws['A1'] = "Net Name"
-    ws['B1'] = "Net Pins"
-    ws['A1'].style = "BorderAndFont"
-    ws['B1'].style = "BorderAndFont"
-    ws['A1'].font = font_column
-    ws['B1'].font = font_column
-    row = 1
-    col = 1
-
-    # Assigns the specific net name and pins matching to the corresponding cell
-    for key in diff_dict.keys():
-        row += 1
-        # assigning the specific cell that is going be mutated
-        net_name = ws.cell(row=row, column=col)
-        net_pins = ws.cell(row=row, column=col+1)
-        net_name.value = key
-        # Can only have hashable values (Strings, integers, etc., NOT lists) as values in a cell
-        net_pins.value = " ".join(diff_dict[key])
-
-        net_name.style = "BorderAndFont"
-        net_pins.style = "BorderAndFont"
-
-        # print("Key: {} \t Value: {}".format(key, diff_dict[key]))
-
-    # file_name = ""
-    # for line in file_path:
-    #     drive, path = os.path.splitdrive(line)
-    #     path, file_name = os.path.split(path)
-
-    # Trying to make  the column width and row height easy to view
-    # Need to update...
-    dims = {}
-    for row in ws.rows:
-        for cell in row:
-            if cell.value:
-                width = max((dims.get(cell.column, 0), len(cell.value)))
-                # Padding row dimensions, look into executing a vba script
-                if width >= 125:
-                    factor = width // 125
-                    ws.row_dimensions[cell.row].height = 15 * factor
-                    continue
-                dims[cell.column] = width
-    for col, value in dims.items():
-        ws.column_dimensions[col].width = value
+    # Trying to make the column width and row height easy to view: columns are as wide as their widest value, values
+    # that are too long to fit (125+ characters) wrap and grow the height of their row instead
+    header = list(header)
+    widths = [len(value) for value in header]
+    for row in make_rows():
+        for col, value in enumerate(row):
+            if widths[col] < len(value) < 125:
+                widths[col] = len(value)
+    for col, width in enumerate(widths):
+        ws.column_dimensions[get_column_letter(col + 1)].width = width
 
-    # NOTE: Program crashes when file that is being saved is open... Don't do that please
-    wb.save(filename=file_path)
-    wb.close()
+    for row_num, row in enumerate(itertools.chain([header], make_rows()), 1):
+        for value in row:
+            if len(value) >= 125:
+                ws.row_dimensions[row_num].height = 15 * (len(value) // 125)
+        cells = []
+        for value in row:
+            cell = WriteOnlyCell(ws, value=value)
+            cell.style = "BorderAndFont"
+            if row_num == 1:
+                cell.font = font_column
+            cells.append(cell)
+        ws.append(cells)
 
     # TODO: Look into a solution for this? PermissionError raised but I don't know where
     # try:
@@ -300,9 +1434,12 @@ def export(file_path, diff_dict, sheet_name, wb):
     #     print(os.access("temp.xlsx", os.W_OK))
     #     while not os.access(file_path, (os.F_OK ^ os.R_OK ^ os.W_OK)):
     #         input("Waiting for user to close {}. Press Enter once done!".format(file_name))
+    return row_num - 1
 
 
 def create_font_style():
+    from openpyxl.styles import Font, Border, Side, NamedStyle
+
     border_style = NamedStyle(name="BorderAndFont")
     border_style.font = Font(name='Times New Roman',
                              size=10,
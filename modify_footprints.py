@@ -1,44 +1,146 @@
+import argparse
 import os
 import glob
-from bs4 import BeautifulSoup
 import shutil
 
-
-def main():
-    file1, file2 = find_files()
-
-    dict1 = parse_to_dict(file1)
-    dict2 = parse_to_dict(file2)
-
-    # We are comparing file 1 to file 2 and replacing the packages in dir2 with the ones in dir1.
-    file_mapping = find_dirs(file1, file2)
-    print(file_mapping)
-
-    create_new_symbols(dict1, dict2, file_mapping)
-
-
+import profiling
+from netlist_cache import DEFAULT_CACHE_DIR
+from report_parser import read_report
+from symbol_library import SymbolIndex, LINK_MODES, find_duplicates, sync_symbols
+
+
+'''
+Copies the footprints for the packages of one Component Report over to the package names of another (installed as
+"modify-footprints").
+
+    modify-footprints sync old.htm new.htm Data/new_symbols           <- Data/symbols_updated, without prompting
+    modify-footprints sync old.htm new.htm lib --target out --dedup   <- into out, identical symbols stored once
+    modify-footprints duplicates Data/old_symbols Data/new_symbols    <- identical symbol files across libraries
+    modify-footprints interactive                                     <- the original prompts, reading from ./Data
+'''
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="modify-footprints",
+                                     description="Copy the footprints for the packages of one Component Report over "
+                                                 "to the package names of another.")
+    subparsers = parser.add_subparsers(dest="command", metavar="COMMAND")
+    subparsers.required = True
+
+    sync_parser = subparsers.add_parser("sync", help="update the symbols without prompting",
+                                        description="Copy the footprints in LIBRARY_DIR for the packages of NEW_REPORT "
+                                                    "over to the package names of OLD_REPORT.")
+    sync_parser.add_argument("old_report", metavar="OLD_REPORT", help="Component Report with the package names to use")
+    sync_parser.add_argument("new_report", metavar="NEW_REPORT", help="Component Report the footprints are for")
+    sync_parser.add_argument("library", metavar="LIBRARY_DIR", help="symbol library of NEW_REPORT's packages")
+    sync_parser.add_argument("--target", default=None,
+                             help="directory for the renamed symbols (defaults to symbols_updated next to LIBRARY_DIR)")
+    _add_sync_arguments(sync_parser)
+    sync_parser.set_defaults(func=run_sync)
+
+    duplicates_parser = subparsers.add_parser("duplicates", help="find identical symbol files across libraries",
+                                              description="List the symbol files with identical contents across "
+                                                          "libraries and how much space they take up twice.")
+    duplicates_parser.add_argument("directories", nargs="+", metavar="DIR", help="symbol library directory")
+    duplicates_parser.add_argument("-j", "--workers", type=int, default=None, help="number of threads hashing symbols")
+    profiling.add_arguments(duplicates_parser)
+    duplicates_parser.set_defaults(func=run_duplicates)
+
+    interactive_parser = subparsers.add_parser("interactive", help="pick the reports and libraries from ./Data")
+    _add_sync_arguments(interactive_parser)
+    interactive_parser.set_defaults(func=run_interactive)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+def _add_sync_arguments(parser):
+    parser.add_argument("--full-copy", action="store_true",
+                        help="empty the target and copy every symbol again instead of only the ones that changed")
+    parser.add_argument("--link", choices=LINK_MODES, default=None,
+                        help="hardlink or reflink symbols into the target instead of copying them")
+    parser.add_argument("--checksum", action="store_true",
+                        help="compare file contents, not just size and modification time, to find changed symbols")
+    parser.add_argument("--dedup", action="store_true",
+                        help="store symbols with identical contents once in the target, hardlinking the rest")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="number of threads copying symbols")
+    profiling.add_arguments(parser)
+
+
+def _sync_options(args):
+    return {"full_copy": args.full_copy, "link": args.link, "checksum": args.checksum, "dedup": args.dedup,
+            "workers": args.workers}
+
+
+def run_sync(args):
+    library = os.path.abspath(args.library)
+    if not os.path.isdir(library):
+        raise SystemExit("Symbol library {} is not a directory".format(args.library))
+    target = os.path.abspath(args.target) if args.target is not None else os.path.join(os.path.dirname(library),
+                                                                                       'symbols_updated')
+    with profiling.profile_from_args(args):
+        with profiling.stage("parse_to_dict") as counts:
+            dict1, dict2 = parse_reports([args.old_report, args.new_report])
+            counts["components"] = len(dict1) + len(dict2)
+        update_symbols(dict1, dict2, library, target, **_sync_options(args))
+    return 0
+
+
+def run_duplicates(args):
+    with profiling.profile_from_args(args):
+        print_duplicates(args.directories, args.workers)
+    return 0
+
+
+def run_interactive(args):
+    with profiling.profile_from_args(args):
+        file1, file2 = find_files()
+
+        with profiling.stage("parse_to_dict") as counts:
+            dict1, dict2 = parse_reports([file1, file2])
+            counts["components"] = len(dict1) + len(dict2)
+
+        # We are comparing file 1 to file 2 and replacing the packages in dir2 with the ones in dir1.
+        file_mapping = find_dirs(file1, file2)
+        print(file_mapping)
+
+        create_new_symbols(dict1, dict2, file_mapping, **_sync_options(args))
+    return 0
+
+
+# Parses several Component Reports at the same time, one worker process each. Returns their dicts in the same order.
+def parse_reports(files):
+    if len(files) < 2:
+        return [parse_to_dict(file) for file in files]
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=len(files)) as executor:
+        return list(executor.map(parse_to_dict, files))
+
+
+# Reads a Component Report into a {refdes -> package} dict. The report is streamed a row at a time and only the refdes
+# (column 0) and package (column 4) cells are kept, so memory use doesn't grow with the size of the report.
 def parse_to_dict(file):
     extension = os.path.splitext(file)[1]
-    file_content = open(file, 'r').read()
     print(extension)
     if extension not in [".htm", ".html"]:
         print("Invalid file selected. Unable to parse a document that is not a htm or html file.")
         raise SystemExit
-    soup = BeautifulSoup(file_content, "html.parser")
-    title = soup.title.string
-    if title != "Component Report":
+    dict = {}
+    try:
+        rows = read_report(file, "Component Report", columns=(0, 4))
+        # first "tr" contains column name definitions
+        next(rows, None)
+        for cells in rows:
+            if len(cells) > 4:
+                dict[cells[0]] = cells[4]
+    except IOError as e:
+        # A file that couldn't be read at all, as opposed to one that isn't a Component Report
+        if e.errno is not None:
+            print("\nUnable to read {}: {}\n".format(file, e.strerror))
+            raise SystemExit
         print("\nInvalid file selected. Unable to parse a document that is not a Component Report.")
         print("File selected was: {}\n".format(file))
         raise SystemExit
-    table = soup.find("table")
-    dict = {}
-    # first "tr" contains column name definitions
-    for row in table.find_all('tr')[1:]:
-        cells = row.find_all('td')
-        if len(cells) > 0:
-            ref_des = cells[0].text.strip()
-            package_name = cells[4].text.strip()
-            dict[ref_des] = package_name
     return dict
 
 
@@ -113,20 +215,29 @@ def check_for_dupes(file1, file2, files):
     return file1, file2
 
 
-def create_new_symbols(dict1, dict2, file_mapping):
+def create_new_symbols(dict1, dict2, file_mapping, **sync_options):
     prev_path = os.getcwd()
     dir_values = list(file_mapping.values())
-    first_dir = dir_values[0]
     second_dir = dir_values[1]
     second_path = os.path.normpath(os.path.join(prev_path, second_dir))
     new_path = create_new_path(prev_path)
+    update_symbols(dict1, dict2, second_path, new_path, **sync_options)
+
+
+# Fills new_path with the symbols in second_path for the packages of dict2, named after the packages of dict1 they
+# replace. Both paths must be absolute, as the working directory is changed along the way.
+def update_symbols(dict1, dict2, second_path, new_path, **sync_options):
+    if not os.path.exists(new_path):
+        os.makedirs(new_path)
 
     # CHECK WHAT NEW SYMBOLS MATCH UP TO OLD SYMBOLS. Returns a dict
     new_mapping = get_old_to_new_mapping(dict1, dict2)
 
     # go into second path, look for .fsm, .dra, .bsm, .psm files
-    old_dir_files = search_for_files(new_mapping, second_path)
-    change_and_add_files(old_dir_files, second_path, new_path)
+    with profiling.stage("search_for_files") as counts:
+        old_dir_files = search_for_files(new_mapping, second_path)
+        counts.update(symbols=len(old_dir_files), files=sum(len(files) for files in old_dir_files.values()))
+    change_and_add_files(old_dir_files, second_path, new_path, **sync_options)
 
 
 def create_new_path(prev_path):
@@ -136,53 +247,94 @@ def create_new_path(prev_path):
     return new_path
 
 
+# Returns the {old package -> new package} mapping between two {refdes -> package} dicts, printing which components
+# couldn't be matched up and which old packages became more than one new package (see match_components)
 def get_old_to_new_mapping(dict1, dict2):
-    mapping = {}
-    dict1.pop("H3") # temp fix... unsure how to handle but leave it for now
-    for (refdes1, refdes2) in zip(dict1, dict2):
-        if refdes1 == refdes2:
-            if dict1[refdes1] == dict2[refdes2]:
-                mapping[dict1[refdes1]] = dict1[refdes1]
-            else:
-                mapping[dict1[refdes1]] = dict2[refdes2]
-        else:
-            print("Error parsing. Need to quit!")
-            raise SystemExit
-    return mapping
+    match = match_components(dict1, dict2)
+    for refdes in match.only_in_first:
+        print("{} ({}) is not in the second report".format(refdes, dict1[refdes]))
+    for refdes in match.only_in_second:
+        print("{} ({}) is not in the first report".format(refdes, dict2[refdes]))
+    for old_package, new_packages in match.conflicts.items():
+        print("{} became {}; using {}".format(
+            old_package, ", ".join("{} ({})".format(new_package, " ".join(refdes))
+                                   for new_package, refdes in new_packages.items()), match.mapping[old_package]))
+    return match.mapping
+
+
+# Components of the two reports joined on refdes
+class ComponentMatch(object):
+    def __init__(self):
+        # {old package -> new package}
+        self.mapping = {}
+        # Refdes only found in one of the reports
+        self.only_in_first = []
+        self.only_in_second = []
+        # {old package -> {new package -> [refdes]}} for old packages whose components didn't all become the same new
+        # package. The mapping uses the new package most of them became.
+        self.conflicts = {}
+
+    def __repr__(self):
+        return "ComponentMatch(packages={}, only_in_first={}, only_in_second={}, conflicts={})".format(
+            len(self.mapping), len(self.only_in_first), len(self.only_in_second), len(self.conflicts))
+
+
+# Matches up the components of two {refdes -> package} dicts by refdes, so the order they are listed in and components
+# that were added or removed don't matter. Linear in the number of components.
+def match_components(dict1, dict2):
+    match = ComponentMatch()
+    # {old package -> {new package -> [refdes]}}, new packages in the order they were first seen
+    packages = {}
+    for refdes, old_package in dict1.items():
+        new_package = dict2.get(refdes)
+        if new_package is None:
+            match.only_in_first.append(refdes)
+            continue
+        packages.setdefault(old_package, {}).setdefault(new_package, []).append(refdes)
+    match.only_in_second = [refdes for refdes in dict2 if refdes not in dict1]
+
+    for old_package, new_packages in packages.items():
+        # max keeps the first of equally common packages
+        match.mapping[old_package] = max(new_packages, key=lambda package: len(new_packages[package]))
+        if len(new_packages) > 1:
+            match.conflicts[old_package] = new_packages
+    return match
 
 
-def search_for_files(symbol_mapping, path):
+# Maps every symbol to the files of the package it becomes. The library in path is indexed in one pass (and the index
+# reused while the directory is unchanged, see SymbolIndex), so each symbol is found with a single lookup.
+def search_for_files(symbol_mapping, path, cache_dir=DEFAULT_CACHE_DIR):
     os.chdir(path)
-    file_types = ['*.dra', '*.fsm', '*.psm', '*.bsm', '*.osm', '*.ssm']
-    files_grabbed = []
-    for files in file_types:
-        files_grabbed.extend(os.path.basename(x) for x in glob.glob(files))
-    symbol_to_file_map = {}
-    num_files = _check_copied_structure(os.getcwd())
-    for file in files_grabbed:
+    index = SymbolIndex.load(os.getcwd(), cache_dir)
+    for file in index.file_names():
         split_file = file.split('.')[0]
         if split_file not in symbol_mapping:
             symbol_mapping[split_file] = split_file
 
-    for symbol in symbol_mapping.keys():
-        value = symbol_mapping[symbol]
-        if symbol not in symbol_to_file_map:
-            symbol_to_file_map[symbol] = []
-        for file in files_grabbed:
-            if file in symbol_to_file_map[symbol]:
-                continue
-            filename, extension = os.path.splitext(file)
-            # print("Filename: {}\t Value: {}".format(filename, value))
-            if value.lower() == filename.lower():
-                symbol_to_file_map[symbol].append(file)
+    symbol_to_file_map = {}
+    for symbol, value in symbol_mapping.items():
+        symbol_to_file_map[symbol] = list(index.lookup(value))
 
     return symbol_to_file_map
 
 
-def change_and_add_files(symbol_to_file_map, path, new_path):
+# Fills new_path with the symbol files, renamed to their new package names. By default only new or changed files are
+# copied and only files that are no longer wanted are removed (see sync_files); full_copy empties new_path and copies
+# everything again.
+def change_and_add_files(symbol_to_file_map, path, new_path, full_copy=False, link=None, checksum=False, dedup=False,
+                         workers=None):
     os.chdir(path)
-    remove_files(new_path)
-    num_files = add_files(symbol_to_file_map, new_path)
+    if not full_copy:
+        with profiling.stage("sync_files") as counts:
+            result = sync_files(symbol_to_file_map, new_path, link, checksum, workers, dedup)
+            counts.update(files_copied=len(result.copied), files_linked=len(result.linked),
+                          files_removed=len(result.removed), files_unchanged=len(result.unchanged))
+        return
+    with profiling.stage("remove_files") as counts:
+        counts["files_removed"] = remove_files(new_path)
+    with profiling.stage("add_files") as counts:
+        num_files = add_files(symbol_to_file_map, new_path)
+        counts["files_copied"] = sum(len(files) for files in symbol_to_file_map.values())
 
 
 def remove_files(path):
@@ -196,11 +348,12 @@ def remove_files(path):
 
     print("Removed {} file{} from directory.".format(count, 's' if count > 1 else '')
           if count > 0 else "No files in directory!")
+    return count
 
 
 def add_files(mapping, new_path):
     for key, value in mapping.items():
-        changed_file_names = list(map(lambda x: '.'.join([key, x.split('.')[1]]), value))
+        changed_file_names = _changed_file_names(key, value)
         for old_file, new_file in zip(value, changed_file_names):
             new_file_path = os.path.join(new_path, new_file)
             shutil.copy2(old_file, new_file_path)
@@ -209,6 +362,47 @@ def add_files(mapping, new_path):
     return num_files
 
 
+# Brings new_path in line with the mapping: the same files add_files would copy, but only the ones that are missing or
+# out of date are copied (on a pool of threads) and only files that aren't part of the mapping are removed. With dedup,
+# files with the same contents are copied once and hardlinked to each other.
+def sync_files(mapping, new_path, link=None, checksum=False, workers=None, dedup=False):
+    wanted = {}
+    for key, value in mapping.items():
+        for old_file, new_file in zip(value, _changed_file_names(key, value)):
+            wanted[new_file] = os.path.abspath(old_file)
+    result = sync_symbols(wanted, new_path, workers, link, checksum, dedup)
+    linked = ""
+    if result.linked:
+        linked = ", linked {} duplicate{}".format(len(result.linked), '' if len(result.linked) == 1 else 's')
+    print("Copied {} file{}{}, removed {}, {} already up to date.".format(
+        len(result.copied), '' if len(result.copied) == 1 else 's', linked, len(result.removed), len(result.unchanged)))
+    return result
+
+
+# Prints every set of identical symbol files across the library directories, and how much space they take up twice.
+# Hard links to the same file (from a sync with --dedup) are marked as such and only count once.
+def print_duplicates(directories, workers=None):
+    with profiling.stage("find_duplicates") as counts:
+        groups = find_duplicates(directories, workers=workers)
+        counts.update(groups=len(groups), files=sum(len(group) for group in groups))
+    wasted = 0
+    for group in groups:
+        # {(device, inode) -> first path linked to it}
+        inodes = {}
+        print("{} identical files:".format(len(group)))
+        for path in group:
+            stat = os.stat(path)
+            first = inodes.setdefault((stat.st_dev, stat.st_ino), path)
+            print("    {}".format(path) if first == path else "    {} (linked to {})".format(path, first))
+        wasted += os.path.getsize(group[0]) * (len(inodes) - 1)
+    print("{} set{} of identical symbol files, {} bytes stored more than once.".format(
+        len(groups), '' if len(groups) == 1 else 's', wasted))
+
+
+def _changed_file_names(key, files):
+    return ['.'.join([key, file.split('.')[1]]) for file in files]
+
+
 def _check_copied_structure(file_path):
     file_types = ['*.dra', '*.fsm', '*.psm', '*.bsm', '*.osm', '*.ssm']
     lens = {}
@@ -219,4 +413,4 @@ def _check_copied_structure(file_path):
 
 
 if __name__ == '__main__':
-    main()
+    raise SystemExit(main())
@@ -0,0 +1,118 @@
+import hashlib
+import os
+import tempfile
+
+'''
+Content-addressed on-disk cache for parsed netlists.
+
+Entries are keyed by a hash of the source file's contents plus the sheet that was read from it, so a workbook that is
+moved, renamed or touched without being changed still hits, and any edit to it misses. Each entry is a single file in
+the cache directory holding whatever bytes the caller stored (compare.py stores Netlist.to_bytes(), which includes the
+net fingerprints once they have been worked out). Reading an entry bumps its modification time, and once the directory
+grows past max_bytes the least recently used entries are deleted.
+'''
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "netlist-compare")
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+# Bump when the stored format changes so old entries are never read back
+FORMAT_VERSION = 2
+HASH_CHUNK_SIZE = 1024 * 1024
+ENTRY_SUFFIX = ".netlist"
+
+
+class ParseCache(object):
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        # {path -> (size, mtime, content hash)} so a workbook read for two sheets is only hashed once
+        self._file_hashes = {}
+
+    def __repr__(self):
+        return "ParseCache({!r}, hits={}, misses={})".format(self.directory, self.hits, self.misses)
+
+    # Cache key for one sheet of a file (sheet_name is None for files that hold a single netlist, e.g. htm reports)
+    def key(self, path, sheet_name=None):
+        digest = hashlib.sha256(self.file_hash(path).encode())
+        digest.update("\0{}\0{}".format(FORMAT_VERSION, "" if sheet_name is None else sheet_name).encode())
+        return digest.hexdigest()
+
+    def file_hash(self, path):
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        cached = self._file_hashes.get(path)
+        if cached is not None and cached[:2] == (stat.st_size, stat.st_mtime):
+            return cached[2]
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+                digest.update(chunk)
+        self._file_hashes[path] = (stat.st_size, stat.st_mtime, digest.hexdigest())
+        return digest.hexdigest()
+
+    # Returns the stored bytes for key, or None on a miss
+    def get(self, key):
+        entry = self._entry_path(key)
+        try:
+            with open(entry, 'rb') as f:
+                data = f.read()
+        except OSError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        # Marks the entry as recently used for eviction
+        try:
+            os.utime(entry)
+        except OSError:
+            pass
+        return data
+
+    def put(self, key, data):
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        # Written to a temporary file first so a reader never sees half an entry
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, self._entry_path(key))
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        self.evict()
+
+    # Deletes the least recently used entries until the cache fits in max_bytes. Returns the number of entries removed.
+    def evict(self):
+        entries = []
+        total = 0
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(ENTRY_SUFFIX) and entry.is_file():
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+        entries.sort()
+        removed = 0
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        return removed
+
+    def clear(self):
+        if not os.path.exists(self.directory):
+            return
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(ENTRY_SUFFIX):
+                    os.remove(entry.path)
+
+    def _entry_path(self, key):
+        return os.path.join(self.directory, key + ENTRY_SUFFIX)
@@ -0,0 +1,365 @@
+import hashlib
+import itertools
+import os
+from array import array
+
+import compare
+import profiling
+
+'''
+SQLite-backed store for netlists too big to compare in memory.
+
+NetlistStore bulk-loads netlists into an indexed SQLite database as (net, pin) rows. Nets are streamed from the source
+file (compare.iter_nets) and inserted in batches, so a netlist is never held in memory as a whole. Each net is stored
+with a fingerprint of its pins (the same sum of 64 bit pin hashes as Netlist.fingerprints), so the nets that changed
+between two netlists come out of one indexed join.
+
+compare() works out the removed, added, changed and renamed nets as set-difference queries into temporary tables, and
+StoreDiff.records() streams the results back a chunk of rows at a time in the same form as SheetDiff.records(). That
+goes straight into the CSV, JSON lines and Parquet writers of result_writers. Memory use grows with the size of the
+differences, never with the size of the netlists; only the Excel results are built in memory (as a SheetDiff holding
+just the differences), since their layout needs every row up front.
+
+Netlists are keyed by a hash of the source file's contents plus the sheet name, like ParseCache, so a store that is kept
+between runs only loads a file again once it changes.
+
+    with NetlistStore("boards.db") as store:
+        first = store.add("rev_a.htm")
+        second = store.add("rev_b.htm")
+        result_writers.write_results(store.compare(first, second), "a vs b.csv")
+'''
+
+# Bump when the tables change so netlists loaded by an older version are never read back
+SCHEMA_VERSION = 1
+# Rows per executemany() when loading, and per fetchmany() when streaming results
+INSERT_BATCH_SIZE = 50000
+FETCH_SIZE = 10000
+# Page cache limit in KiB (negative, as PRAGMA cache_size expects), so memory stays bounded on any size of netlist
+CACHE_KIB = 64 * 1024
+HASH_CHUNK_SIZE = 1024 * 1024
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS netlists (
+    id INTEGER PRIMARY KEY,
+    key TEXT UNIQUE NOT NULL,
+    source TEXT NOT NULL,
+    sheet TEXT,
+    nets INTEGER NOT NULL,
+    pins INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS nets (
+    netlist INTEGER NOT NULL,
+    row INTEGER NOT NULL,
+    net TEXT NOT NULL,
+    pin_count INTEGER NOT NULL,
+    fingerprint INTEGER NOT NULL,
+    PRIMARY KEY (netlist, row)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS pins (
+    netlist INTEGER NOT NULL,
+    row INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    pin TEXT NOT NULL,
+    PRIMARY KEY (netlist, row, position)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS nets_by_name ON nets (netlist, net, row);
+CREATE INDEX IF NOT EXISTS nets_by_fingerprint ON nets (netlist, fingerprint);
+CREATE INDEX IF NOT EXISTS pins_by_name ON pins (netlist, pin);
+'''
+
+
+class NetlistStore(object):
+    def __init__(self, path):
+        import sqlite3
+
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self._diffs = 0
+        version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+        if version not in (0, SCHEMA_VERSION):
+            raise IOError("{} was written by a different version of netlist_store.".format(path))
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.execute("PRAGMA synchronous = NORMAL")
+        self.connection.execute("PRAGMA cache_size = {}".format(-CACHE_KIB))
+        self.connection.executescript(_SCHEMA)
+        self.connection.execute("PRAGMA user_version = {}".format(SCHEMA_VERSION))
+
+    def __repr__(self):
+        return "NetlistStore({!r})".format(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    # Loads one netlist (a sheet of a workbook, or a Net List Report) and returns its ID in the store. A file that is
+    # already in the store with the same contents isn't read again.
+    def add(self, path, sheet_name=None):
+        key = source_key(path, sheet_name)
+        found = self.connection.execute("SELECT id FROM netlists WHERE key = ?", (key,)).fetchone()
+        if found is not None:
+            return found[0]
+
+        with profiling.stage("store_load") as counts:
+            # One transaction, so a load that fails part way leaves nothing behind
+            with self.connection:
+                netlist_id = self.connection.execute(
+                    "INSERT INTO netlists (key, source, sheet, nets, pins) VALUES (?, ?, ?, 0, 0)",
+                    (key, os.path.abspath(path), sheet_name)).lastrowid
+                net_rows = []
+                pin_rows = []
+                nets = pins = 0
+                for row, (net_name, net_pins) in enumerate(compare.iter_nets(path, sheet_name)):
+                    pin_set = set(net_pins)
+                    net_rows.append((netlist_id, row, net_name, len(pin_set), fingerprint(pin_set)))
+                    pin_rows.extend((netlist_id, row, position, pin) for position, pin in enumerate(net_pins))
+                    nets += 1
+                    pins += len(net_pins)
+                    if len(pin_rows) >= INSERT_BATCH_SIZE:
+                        self._insert(net_rows, pin_rows)
+                        net_rows = []
+                        pin_rows = []
+                self._insert(net_rows, pin_rows)
+                self.connection.execute("UPDATE netlists SET nets = ?, pins = ? WHERE id = ?",
+                                        (nets, pins, netlist_id))
+            counts.update(nets=nets, pins=pins)
+        return netlist_id
+
+    def _insert(self, net_rows, pin_rows):
+        self.connection.executemany("INSERT INTO nets VALUES (?, ?, ?, ?, ?)", net_rows)
+        self.connection.executemany("INSERT INTO pins VALUES (?, ?, ?, ?)", pin_rows)
+
+    # Deletes a netlist from the store
+    def remove(self, netlist_id):
+        with self.connection:
+            for table, column in (("pins", "netlist"), ("nets", "netlist"), ("netlists", "id")):
+                self.connection.execute("DELETE FROM {} WHERE {} = ?".format(table, column), (netlist_id,))
+
+    # [(ID, source path, sheet name, nets, pins)] for every netlist in the store
+    def netlists(self):
+        return self.connection.execute("SELECT id, source, sheet, nets, pins FROM netlists ORDER BY id").fetchall()
+
+    # Compares two netlists in the store, with the same results as compare.compare_sheets, and returns a StoreDiff
+    def compare(self, first, second, detect_renames=True, rename_threshold=compare.RENAME_THRESHOLD):
+        self._diffs += 1
+        return StoreDiff(self, first, second, "diff{}".format(self._diffs), detect_renames, rename_threshold)
+
+
+# Result of NetlistStore.compare. The differences live in temporary tables of the store's connection (named after
+# prefix), which records() streams from, so the store has to stay open while the results are written.
+class StoreDiff(object):
+    def __init__(self, store, first, second, prefix, detect_renames=True, rename_threshold=compare.RENAME_THRESHOLD):
+        self.store = store
+        self.first = first
+        self.second = second
+        self.tables = {kind: "{}_{}".format(prefix, kind) for kind in ("removed", "added", "changed", "renamed")}
+        with profiling.stage("store_compare") as counts:
+            with store.connection:
+                self._find_differences()
+            if detect_renames:
+                with profiling.stage("match_renamed_nets"):
+                    self._match_renamed_nets(rename_threshold)
+            self.counts = {kind: self._execute("SELECT COUNT(*) FROM {}".format(table)).fetchone()[0]
+                           for kind, table in self.tables.items()}
+            counts.update(self.counts)
+
+    def __bool__(self):
+        return any(self.counts.values())
+
+    def __repr__(self):
+        return "StoreDiff(removed={removed}, added={added}, changed={changed}, renamed={renamed})".format(**self.counts)
+
+    def _execute(self, sql, parameters=()):
+        return self.store.connection.execute(sql.format(**self.tables), parameters)
+
+    def _find_differences(self):
+        first, second = self.first, self.second
+        self._execute("CREATE TEMP TABLE {removed} (row INTEGER PRIMARY KEY)")
+        self._execute("CREATE TEMP TABLE {added} (row INTEGER PRIMARY KEY)")
+        self._execute("CREATE TEMP TABLE {changed} (row1 INTEGER PRIMARY KEY, row2 INTEGER)")
+        self._execute("CREATE TEMP TABLE {renamed} (row1 INTEGER, row2 INTEGER, PRIMARY KEY (row1, row2))")
+        self._execute('''
+            INSERT INTO {removed}
+            SELECT n.row FROM nets n
+            WHERE n.netlist = ? AND NOT EXISTS (SELECT 1 FROM nets m WHERE m.netlist = ? AND m.net = n.net)''',
+                      (first, second))
+        self._execute('''
+            INSERT INTO {added}
+            SELECT m.row FROM nets m
+            WHERE m.netlist = ? AND NOT EXISTS (SELECT 1 FROM nets n WHERE n.netlist = ? AND n.net = m.net)''',
+                      (second, first))
+        # A net listed more than once in the second netlist is compared against the last of them, as in compare_sheets.
+        # Nets with the same fingerprint have the same pins.
+        self._execute('''
+            INSERT INTO {changed}
+            SELECT n.row, m.row FROM nets n
+            JOIN nets m ON m.netlist = :second
+                AND m.row = (SELECT MAX(row) FROM nets WHERE netlist = :second AND net = n.net)
+            WHERE n.netlist = :first AND m.fingerprint != n.fingerprint''', {"first": first, "second": second})
+
+    # Same matching as compare.match_renamed_nets, with the candidate pairs found by queries: exact matches share a
+    # fingerprint, and near matches count the pins they share with a join on the pin names. Only the candidates (one
+    # per overlapping pair of removed and added nets) are held in memory.
+    def _match_renamed_nets(self, threshold):
+        first, second = self.first, self.second
+        matched_removed = set()
+        matched_added = set()
+        pairs = []
+        exact = self._execute('''
+            SELECT a.row, r.row FROM {added} a
+            JOIN nets m ON m.netlist = ? AND m.row = a.row
+            JOIN nets n ON n.netlist = ? AND n.fingerprint = m.fingerprint AND n.pin_count > 0
+            JOIN {removed} r ON r.row = n.row
+            ORDER BY a.row, r.row''', (second, first))
+        for row2, row1 in _fetch_rows(exact):
+            if row2 not in matched_added and row1 not in matched_removed:
+                matched_removed.add(row1)
+                matched_added.add(row2)
+                pairs.append((row1, row2))
+
+        if threshold <= 1:
+            candidates = []
+            overlaps = self._execute('''
+                SELECT r.row, a.row, COUNT(DISTINCT p.pin), n.pin_count, m.pin_count FROM {removed} r
+                JOIN pins p ON p.netlist = :first AND p.row = r.row
+                JOIN pins q ON q.netlist = :second AND q.pin = p.pin
+                JOIN {added} a ON a.row = q.row
+                JOIN nets n ON n.netlist = :first AND n.row = r.row
+                JOIN nets m ON m.netlist = :second AND m.row = a.row
+                GROUP BY r.row, a.row''', {"first": first, "second": second})
+            for row1, row2, overlap, pin_count1, pin_count2 in _fetch_rows(overlaps):
+                if row1 in matched_removed or row2 in matched_added:
+                    continue
+                similarity = overlap / (pin_count1 + pin_count2 - overlap)
+                if similarity >= threshold:
+                    candidates.append((-similarity, row1, row2))
+            candidates.sort()
+            for _, row1, row2 in candidates:
+                if row1 not in matched_removed and row2 not in matched_added:
+                    matched_removed.add(row1)
+                    matched_added.add(row2)
+                    pairs.append((row1, row2))
+
+        with self.store.connection:
+            self.store.connection.executemany("INSERT INTO {} VALUES (?, ?)".format(self.tables["renamed"]), pairs)
+            self._execute("DELETE FROM {removed} WHERE row IN (SELECT row1 FROM {renamed})")
+            self._execute("DELETE FROM {added} WHERE row IN (SELECT row2 FROM {renamed})")
+
+    # Yields one dict per difference, streamed from the store in the same order and form as SheetDiff.records()
+    def records(self):
+        for row1, net_name, _, _, removed, added in self._pairs("changed", new_pins=False):
+            yield {"kind": "changed", "net": net_name, "new_net": None, "pins": [],
+                   "removed_pins": removed, "added_pins": added}
+        for kind, netlist in (("removed", self.first), ("added", self.second)):
+            rows = self._execute('''
+                SELECT d.row, n.net, p.pin FROM {%s} d
+                JOIN nets n ON n.netlist = :netlist AND n.row = d.row
+                LEFT JOIN pins p ON p.netlist = :netlist AND p.row = d.row
+                ORDER BY d.row, p.position''' % kind, {"netlist": netlist})
+            for (_, net_name), group in itertools.groupby(_fetch_rows(rows), key=lambda row: row[:2]):
+                yield {"kind": kind, "net": net_name, "new_net": None,
+                       "pins": [pin for _, _, pin in group if pin is not None], "removed_pins": [], "added_pins": []}
+        for _, old_name, new_name, pins, removed, added in self._pairs("renamed", new_pins=True):
+            yield {"kind": "renamed", "net": old_name, "new_net": new_name, "pins": pins,
+                   "removed_pins": removed, "added_pins": added}
+
+    # Yields (row1, old net name, new net name, [new net's pins], [removed pins], [added pins]) for each pair of nets in
+    # the changed or renamed table, ordered by row1. Each list comes from its own query, and the queries are walked
+    # side by side.
+    def _pairs(self, kind, new_pins):
+        parameters = {"first": self.first, "second": self.second}
+        pairs = self._execute('''
+            SELECT d.row1, n.net, m.net FROM {%s} d
+            JOIN nets n ON n.netlist = :first AND n.row = d.row1
+            JOIN nets m ON m.netlist = :second AND m.row = d.row2
+            ORDER BY d.row1, d.row2''' % kind, parameters)
+        removed = self._execute('''
+            SELECT d.row1, d.row2, p.pin FROM {%s} d
+            JOIN pins p ON p.netlist = :first AND p.row = d.row1
+            WHERE NOT EXISTS (SELECT 1 FROM pins q WHERE q.netlist = :second AND q.row = d.row2 AND q.pin = p.pin)
+            ORDER BY d.row1, d.row2, p.position''' % kind, parameters)
+        added = self._execute('''
+            SELECT d.row1, d.row2, q.pin FROM {%s} d
+            JOIN pins q ON q.netlist = :second AND q.row = d.row2
+            WHERE NOT EXISTS (SELECT 1 FROM pins p WHERE p.netlist = :first AND p.row = d.row1 AND p.pin = q.pin)
+            ORDER BY d.row1, d.row2, q.position''' % kind, parameters)
+        streams = [_PinGroups(removed), _PinGroups(added)]
+        if new_pins:
+            streams.append(_PinGroups(self._execute('''
+                SELECT d.row1, d.row2, q.pin FROM {%s} d
+                JOIN pins q ON q.netlist = :second AND q.row = d.row2
+                ORDER BY d.row1, d.row2, q.position''' % kind, parameters)))
+        # Renamed pairs are unique on (row1, row2), changed pairs on row1
+        for row1, old_name, new_name in _fetch_rows(pairs):
+            pin_lists = [stream.take(row1) for stream in streams]
+            new_pin_list = pin_lists[2] if new_pins else []
+            yield row1, old_name, new_name, new_pin_list, pin_lists[0], pin_lists[1]
+
+    # The differences as an in-memory SheetDiff (with its own NameTable holding only the names in it), e.g. for the
+    # Excel results
+    def to_sheet_diff(self):
+        names = compare.NameTable()
+        diff = compare.SheetDiff(names)
+        intern = names.intern
+        for record in self.records():
+            kind = record["kind"]
+            if kind == "changed":
+                diff.changed.append((intern(record["net"]), array('i', names.intern_many(record["removed_pins"])),
+                                     array('i', names.intern_many(record["added_pins"]))))
+            elif kind == "renamed":
+                diff.renamed.append((intern(record["net"]), intern(record["new_net"]),
+                                     array('i', names.intern_many(record["pins"])),
+                                     array('i', names.intern_many(record["removed_pins"])),
+                                     array('i', names.intern_many(record["added_pins"]))))
+            else:
+                getattr(diff, kind).append((intern(record["net"]), array('i', names.intern_many(record["pins"]))))
+        return diff
+
+
+# Walks a query of (row1, row2, pin) rows ordered by row1, handing out the pins of one row1 at a time
+class _PinGroups(object):
+    def __init__(self, cursor):
+        self._rows = _fetch_rows(cursor)
+        self._next = next(self._rows, None)
+
+    # Pins of row1, which must be asked for in increasing order; empty if it has none
+    def take(self, row1):
+        pins = []
+        while self._next is not None and self._next[0] <= row1:
+            if self._next[0] == row1:
+                pins.append(self._next[2])
+            self._next = next(self._rows, None)
+        return pins
+
+
+# Yields the rows of a query FETCH_SIZE at a time
+def _fetch_rows(cursor):
+    while True:
+        rows = cursor.fetchmany(FETCH_SIZE)
+        if not rows:
+            return
+        yield from rows
+
+
+# Store key for one sheet of a file (sheet_name is None for files that hold a single netlist)
+def source_key(path, sheet_name=None):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    digest.update("\0{}\0{}".format(SCHEMA_VERSION, "" if sheet_name is None else sheet_name).encode())
+    return digest.hexdigest()
+
+
+# Fingerprint of a set of pin names, as a signed 64 bit integer for SQLite: the sum of the same blake2b hashes
+# NameTable.hashes uses, so it matches Netlist.fingerprints
+def fingerprint(pin_set):
+    total = 0
+    for pin in pin_set:
+        total += int.from_bytes(hashlib.blake2b(str(pin).encode(), digest_size=8).digest(), 'little')
+    total &= compare.FINGERPRINT_MASK
+    return total - (1 << 64) if total >= 1 << 63 else total
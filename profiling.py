@@ -0,0 +1,156 @@
+import json
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+'''
+Per-stage instrumentation for compare.py and modify_footprints.py.
+
+Pipeline functions wrap their work in "with profiling.stage(name) as counts:" and fill in counts (nets, pins, rows,
+files, ...). Nothing is recorded unless a Profiler has been started, in which case each stage records its wall time,
+the peak memory allocated while it ran (tracemalloc) and its counts, and one stage can also be run under cProfile.
+tracemalloc slows Python down noticeably, so only turn it on when a report is wanted.
+
+    profiler = profiling.start(cprofile_stage="compare_sheets", cprofile_path="compare_sheets.prof")
+    ...
+    profiling.stop().write("profile.json")
+
+Scripts get this as --profile/--cprofile with add_arguments() and profile_from_args().
+'''
+
+# Where the report goes when --cprofile is given without --profile
+DEFAULT_REPORT = "profile.json"
+
+_active = None
+
+
+class Profiler(object):
+    def __init__(self, trace_memory=True, cprofile_stage=None, cprofile_path=None):
+        self.trace_memory = trace_memory
+        self.cprofile_stage = cprofile_stage
+        self.cprofile_path = cprofile_path
+        # Finished stages in the order they started: {"name", "depth", "seconds", "peak_bytes", "counts"}
+        self.stages = []
+        self._stack = []
+        self._cprofile = None
+        self._start = None
+        self._started_tracing = False
+
+    def start(self):
+        self._start = time.perf_counter()
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        return self
+
+    def stop(self):
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        return self
+
+    @contextmanager
+    def stage(self, name):
+        record = {"name": name, "depth": len(self._stack), "seconds": None, "peak_bytes": None, "counts": {}}
+        self.stages.append(record)
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            # The enclosing stage keeps the peak it reached so far, since the peak is shared
+            if self._stack:
+                parent = self._stack[-1]
+                parent["_peak"] = max(parent["_peak"], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        record["_peak"] = 0
+        self._stack.append(record)
+
+        profile = None
+        if name == self.cprofile_stage and self._cprofile is None:
+            import cProfile
+            profile = self._cprofile = cProfile.Profile()
+            profile.enable()
+        start = time.perf_counter()
+        try:
+            yield record["counts"]
+        finally:
+            record["seconds"] = round(time.perf_counter() - start, 6)
+            if profile is not None:
+                profile.disable()
+                if self.cprofile_path is not None:
+                    profile.dump_stats(self.cprofile_path)
+            self._stack.pop()
+            peak = record.pop("_peak")
+            if tracing:
+                peak = max(peak, tracemalloc.get_traced_memory()[1])
+                record["peak_bytes"] = peak
+                if self._stack:
+                    self._stack[-1]["_peak"] = max(self._stack[-1]["_peak"], peak)
+                tracemalloc.reset_peak()
+
+    def report(self):
+        total = None if self._start is None else round(time.perf_counter() - self._start, 6)
+        return {"total_seconds": total, "cprofile_stage": self.cprofile_stage, "cprofile_path": self.cprofile_path,
+                "stages": [{key: value for key, value in record.items() if not key.startswith("_")}
+                           for record in self.stages]}
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2)
+
+
+# Starts recording stages into a new Profiler, which is returned
+def start(trace_memory=True, cprofile_stage=None, cprofile_path=None):
+    global _active
+    _active = Profiler(trace_memory, cprofile_stage, cprofile_path).start()
+    return _active
+
+
+# Stops recording and returns the Profiler that was recording, if any
+def stop():
+    global _active
+    profiler, _active = _active, None
+    return profiler.stop() if profiler is not None else None
+
+
+# Context manager around one stage of the pipeline. Yields the stage's counts dict (thrown away when not profiling).
+def stage(name):
+    if _active is None:
+        return _null_stage()
+    return _active.stage(name)
+
+
+@contextmanager
+def _null_stage():
+    yield {}
+
+
+# Adds --profile and --cprofile to a script's ArgumentParser
+def add_arguments(parser):
+    parser.add_argument("--profile", metavar="REPORT", default=None,
+                        help="write the time, peak memory and item counts of each stage to REPORT as JSON")
+    parser.add_argument("--cprofile", metavar="STAGE", default=None,
+                        help="also run STAGE under cProfile and dump it next to the report (implies --profile "
+                             "{} if --profile isn't given)".format(DEFAULT_REPORT))
+
+
+# Profiles everything run inside it when --profile was given, writing the report (and cProfile dump) on the way out
+@contextmanager
+def profile_from_args(args):
+    report = args.profile
+    if report is None and args.cprofile is not None:
+        report = DEFAULT_REPORT
+    if report is None:
+        yield None
+        return
+    # Resolved now, as the code being profiled may change the working directory (modify_footprints does)
+    report_path = os.path.abspath(report)
+    cprofile_path = None
+    if args.cprofile is not None:
+        cprofile_path = "{}.{}.prof".format(os.path.splitext(report_path)[0], args.cprofile)
+    profiler = start(cprofile_stage=args.cprofile, cprofile_path=cprofile_path)
+    try:
+        yield profiler
+    finally:
+        stop()
+        profiler.write(report_path)
+        print("Profile written to {}".format(report))
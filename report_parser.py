@@ -0,0 +1,132 @@
+import collections
+from html.parser import HTMLParser
+
+'''
+Streaming reader for the .htm reports that Allegro writes out (Net List Report, Component Report, ...).
+
+The report is fed through html.parser in fixed size chunks and the rows of the first table are handed back one at a
+time, so only the row currently being parsed is held in memory - no DOM is built no matter how big the report is.
+Allegro does not always close its <td>/<tr> tags, so a new cell or row implicitly closes the previous one.
+'''
+
+CHUNK_SIZE = 64 * 1024
+
+
+class _TableRowParser(HTMLParser):
+    def __init__(self, columns=None):
+        super().__init__(convert_charrefs=True)
+        # Only the text of these cell indices is kept (None keeps every cell)
+        self.columns = None if columns is None else frozenset(columns)
+        self.title = None
+        self.rows = collections.deque()
+        self._in_title = False
+        self._title_parts = []
+        # Depth of nested tables and whether the first table has already been read
+        self._table_depth = 0
+        self._table_done = False
+        self._row = None
+        self._cell = None
+        self._cell_index = -1
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "title":
+            self._in_title = True
+        elif tag == "table":
+            self._table_depth += 1
+        elif self._table_depth != 1 or self._table_done:
+            return
+        elif tag == "tr":
+            self._end_row()
+            self._row = []
+            self._cell_index = -1
+        elif tag in ("td", "th"):
+            if self._row is None:
+                self._row = []
+                self._cell_index = -1
+            self._end_cell()
+            self._cell_index += 1
+            self._cell = []
+
+    def handle_endtag(self, tag):
+        if tag == "title" and self._in_title:
+            self._in_title = False
+            self.title = "".join(self._title_parts).strip()
+        elif tag == "table":
+            if self._table_depth == 1 and not self._table_done:
+                self._end_row()
+                self._table_done = True
+            self._table_depth = max(self._table_depth - 1, 0)
+        elif self._table_depth != 1 or self._table_done:
+            return
+        elif tag == "tr":
+            self._end_row()
+        elif tag in ("td", "th"):
+            self._end_cell()
+
+    def handle_data(self, data):
+        if self._in_title:
+            self._title_parts.append(data)
+        elif self._cell is not None and (self.columns is None or self._cell_index in self.columns):
+            self._cell.append(data)
+
+    def _end_cell(self):
+        if self._cell is not None:
+            self._row.append("".join(self._cell).strip())
+            self._cell = None
+
+    def _end_row(self):
+        if self._row is not None:
+            self._end_cell()
+            if self._row:
+                self.rows.append(self._row)
+            self._row = None
+
+    def close(self):
+        super().close()
+        self._end_row()
+
+
+# Reads one report file. Iterating yields the rows of the first table in the report as lists of cell text (cells
+# outside of "columns" come back as empty strings). The page title is available as soon as the first row is returned.
+class ReportReader(object):
+    def __init__(self, path, columns=None, chunk_size=CHUNK_SIZE):
+        self.path = path
+        self.columns = columns
+        self.chunk_size = chunk_size
+        self.title = None
+
+    def __iter__(self):
+        parser = _TableRowParser(self.columns)
+        with open(self.path, 'r', errors='replace') as f:
+            while True:
+                chunk = f.read(self.chunk_size)
+                if not chunk:
+                    break
+                parser.feed(chunk)
+                self.title = parser.title
+                while parser.rows:
+                    yield parser.rows.popleft()
+                if parser._table_done:
+                    break
+        parser.close()
+        self.title = parser.title
+        while parser.rows:
+            yield parser.rows.popleft()
+
+
+# Yields the rows of a report, raising an IOError if the report's title is not the one expected
+def read_report(path, title, columns=None, chunk_size=CHUNK_SIZE):
+    reader = ReportReader(path, columns, chunk_size)
+    checked = False
+    for row in reader:
+        if not checked:
+            _check_title(path, reader.title, title)
+            checked = True
+        yield row
+    if not checked:
+        _check_title(path, reader.title, title)
+
+
+def _check_title(path, found, expected):
+    if found != expected:
+        raise IOError("{} is not a {} (title is {!r}).".format(path, expected, found))
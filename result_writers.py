@@ -0,0 +1,121 @@
+import csv
+import json
+import os
+
+import compare
+import netlist_store
+import profiling
+
+'''
+Output formats for comparison results besides the default Excel workbook.
+
+The CSV and JSON lines writers stream SheetDiff.records() (or StoreDiff.records(), from an SQLite netlist_store)
+straight to the file one difference at a time. Parquet needs pyarrow, which is optional: records are gathered into
+column batches and written a row group at a time.
+
+Every format holds the same columns: kind (changed / removed / added / renamed), net, new_net, pins, removed_pins and
+added_pins. CSV joins pin lists with spaces; JSON lines and Parquet keep them as lists. A RevisionDiff
+(compare_revisions) is written the same way with its own columns: net, first_diverged and one per revision, and so is
+a ConnectivityDiff (compare_connectivity): kind (merged / split / moved), first_nets, second_nets and pins.
+'''
+
+FORMATS = ["xlsx", "csv", "jsonl", "parquet"]
+FIELDS = ["kind", "net", "new_net", "pins", "removed_pins", "added_pins"]
+PIN_FIELDS = ["pins", "removed_pins", "added_pins"]
+CONNECTIVITY_LIST_FIELDS = ["first_nets", "second_nets", "pins"]
+PARQUET_BATCH_SIZE = 64 * 1024
+
+
+# Picks the format from the output file's extension, defaulting to xlsx
+def format_for_path(path):
+    extension = os.path.splitext(path)[1].lower().lstrip(".")
+    if extension == "ndjson":
+        return "jsonl"
+    return extension if extension in FORMATS else "xlsx"
+
+
+# Raises if results can't be written in fmt here, so a run can fail before doing any work
+def check_format(fmt):
+    if fmt not in FORMATS:
+        raise ValueError("Unknown output format {!r}, expected one of {}".format(fmt, FORMATS))
+    if fmt == "parquet":
+        _import_pyarrow()
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("Writing Parquet results needs pyarrow (pip install pyarrow).")
+    return pyarrow, pyarrow.parquet
+
+
+# Writes a SheetDiff, RevisionDiff or ConnectivityDiff to output_path in the given format (taken from output_path's
+# extension if None). xlsx goes through compare.export_results / export_revisions / export_connectivity, with
+# source_path being the workbook the results are added to when output_path is None.
+def write_results(diff, output_path, fmt=None, source_path=None):
+    if fmt is None:
+        fmt = format_for_path(output_path if output_path is not None else source_path)
+    check_format(fmt)
+    if fmt == "xlsx" and isinstance(diff, netlist_store.StoreDiff):
+        # The Excel sheets are laid out from every row at once, so the differences are gathered up in memory
+        diff = diff.to_sheet_diff()
+    if isinstance(diff, compare.RevisionDiff):
+        export, fields, pin_fields = compare.export_revisions, diff.fields(), []
+    elif isinstance(diff, compare.ConnectivityDiff):
+        export, fields, pin_fields = compare.export_connectivity, compare.CONNECTIVITY_FIELDS, CONNECTIVITY_LIST_FIELDS
+    else:
+        export, fields, pin_fields = compare.export_results, FIELDS, PIN_FIELDS
+    if fmt == "xlsx":
+        return export(diff, source_path if source_path is not None else output_path, output_path)
+    if output_path is None:
+        raise IOError("An output file is needed to write {} results.".format(fmt))
+    with profiling.stage("export") as counts:
+        if fmt == "jsonl":
+            counts["rows"] = write_jsonl(diff.records(), output_path)
+        else:
+            writer = {"csv": write_csv, "parquet": write_parquet}[fmt]
+            counts["rows"] = writer(diff.records(), output_path, fields, pin_fields)
+    print("Export of {} results to \"{}\" is successful!".format(fmt, output_path))
+
+
+# Each writer takes an iterable of records and returns how many it wrote. fields are the columns to write, in order, and
+# pin_fields the ones that hold lists (of pins, or nets); everything else is a string.
+def write_csv(records, path, fields=FIELDS, pin_fields=PIN_FIELDS):
+    count = 0
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(fields)
+        for record in records:
+            writer.writerow([" ".join(record[field]) if field in pin_fields else record[field] for field in fields])
+            count += 1
+    return count
+
+
+def write_jsonl(records, path):
+    count = 0
+    with open(path, 'w') as f:
+        for record in records:
+            f.write(json.dumps(record))
+            f.write("\n")
+            count += 1
+    return count
+
+
+def write_parquet(records, path, fields=FIELDS, pin_fields=PIN_FIELDS):
+    pa, pq = _import_pyarrow()
+    schema = pa.schema([(field, pa.list_(pa.string()) if field in pin_fields else pa.string()) for field in fields])
+    count = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        batch = {field: [] for field in fields}
+        for record in records:
+            for field in fields:
+                batch[field].append(record[field])
+            count += 1
+            if len(batch[fields[0]]) >= PARQUET_BATCH_SIZE:
+                writer.write_table(pa.table(batch, schema=schema))
+                batch = {field: [] for field in fields}
+        if batch[fields[0]] or count == 0:
+            writer.write_table(pa.table(batch, schema=schema))
+    return count
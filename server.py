@@ -0,0 +1,429 @@
+import json
+import os
+import sys
+import time
+from collections import OrderedDict, deque
+
+import compare
+import result_writers
+from netlist_cache import ParseCache, DEFAULT_CACHE_DIR
+
+'''
+Long-running local comparison service ("netlist-compare serve"), for workflows that compare the same netlists over and
+over: parsed netlists stay in memory between requests, so a query only pays for the comparison itself.
+
+The server speaks plain HTTP/1.1 with JSON bodies, over TCP on localhost or over a Unix socket, using nothing but
+asyncio. Connections are handled concurrently on the event loop; the comparisons run on a single worker thread, since
+the netlists share one NameTable and the GIL would serialize the work anyway. asyncio is only imported once serving
+starts, so having the "serve" command doesn't slow down the start of every other one.
+
+    POST /compare   {"first": "rev_a.htm", "second": "rev_b.htm"}
+                    {"first": ["Board.xlsx", "OrCAD"], "second": ["Board.xlsx", "Cadence"], "renames": false}
+                    Responds with the counts and SheetDiff.records() of the differences, or, with "output" (and
+                    optionally "format"), writes them to that file name in --results-dir through result_writers and
+                    responds with the counts. Without --results-dir the server never writes results files.
+    GET  /metrics   Cache hits, misses and evictions and request latencies.
+
+    curl -s localhost:8765/compare -d '{"first": "rev_a.htm", "second": "rev_b.htm"}'
+
+Netlists are kept in a NetlistLRU bounded by the memory they take up, the names they share included, keyed like
+ParseCache (file contents plus sheet name), so an edited file is parsed again and an unchanged one never is. A miss
+still goes through the on-disk ParseCache before parsing. Results of recent comparisons are kept too, within a budget
+of their own, so repeating a query is a dictionary lookup.
+'''
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+RESULT_CACHE_SIZE = 64
+DEFAULT_MAX_RESULT_BYTES = 64 * 1024 * 1024
+# Latencies kept per endpoint for the percentiles in /metrics
+LATENCY_SAMPLES = 1024
+# Evicted netlists leave their names behind in the shared NameTable. It's rebuilt from the cached netlists when those
+# names are all that stands between the cache and its limit, or once it holds this many times more names than the
+# cached netlists could be using.
+NAME_COMPACT_FACTOR = 4
+# What the NameTable holds for each name besides the string itself: the entry in its dict of IDs, the int ID, the list
+# slot and the 64 bit hash. Measured with tracemalloc, rounded up.
+NAME_ENTRY_BYTES = 96
+# An int object as allocated
+INT_BYTES = 32
+MAX_BODY_BYTES = 1024 * 1024
+
+
+# Parsed netlists by cache key, least recently used first. Every netlist is interned into the same NameTable so any two
+# of them can be compared without translating names. Each netlist is charged for its arrays and index and for the
+# names it added to the NameTable; the names of evicted netlists stay in memory (dead_bytes) until the NameTable is
+# rebuilt, so they count towards max_bytes too.
+class NetlistLRU(object):
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.names = compare.NameTable()
+        # Memory of the cached netlists plus every name in the NameTable
+        self.bytes = 0
+        # Memory of the names only evicted netlists were charged for
+        self.dead_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.compactions = 0
+        self._netlists = OrderedDict()
+        # {key -> (bytes of the netlist itself, bytes of the names it was charged for)}
+        self._sizes = {}
+        # Number of names in self.names already charged to a netlist
+        self._charged = 0
+
+    def __repr__(self):
+        return "NetlistLRU(netlists={}, bytes={}, hits={}, misses={})".format(
+            len(self._netlists), self.bytes, self.hits, self.misses)
+
+    def __len__(self):
+        return len(self._netlists)
+
+    def get(self, key):
+        netlist = self._netlists.get(key)
+        if netlist is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._netlists.move_to_end(key)
+        return netlist
+
+    # Adds a netlist (interned into self.names) and evicts the least recently used ones, or rebuilds the NameTable
+    # without the names they left behind, until the rest fit. Returns the netlist as it is now held, which is a copy if
+    # the NameTable had to be rebuilt (renumbering every name).
+    def put(self, key, netlist):
+        if key in self._netlists:
+            self._remove(key)
+        self._add(key, netlist)
+        while self.bytes > self.max_bytes:
+            # The newest netlist is always kept, even on its own over the limit
+            if self.bytes - self.dead_bytes > self.max_bytes and len(self._netlists) > 1:
+                self._remove(next(iter(self._netlists)))
+                self.evictions += 1
+            elif self.dead_bytes:
+                self._compact()
+            else:
+                break
+        live_names = sum(len(netlist.net_ids) + len(netlist.pins) for netlist in self._netlists.values())
+        if self.dead_bytes and len(self.names) > NAME_COMPACT_FACTOR * max(live_names, 1):
+            self._compact()
+        return self._netlists[key]
+
+    # Caches a netlist, charging it for the names interned since the last one was added. Every comparison needs the
+    # index, so it's built now and counted.
+    def _add(self, key, netlist):
+        netlist.index()
+        new_names = self.names.names[self._charged:]
+        self._charged = len(self.names)
+        size = (netlist_bytes(netlist), sum(map(sys.getsizeof, new_names)) + NAME_ENTRY_BYTES * len(new_names))
+        self._netlists[key] = netlist
+        self._sizes[key] = size
+        self.bytes += sum(size)
+
+    # Drops a netlist. Its arrays are freed but its names stay in the NameTable.
+    def _remove(self, key):
+        del self._netlists[key]
+        netlist_size, names_size = self._sizes.pop(key)
+        self.bytes -= netlist_size
+        self.dead_bytes += names_size
+
+    def _compact(self):
+        netlists = self._netlists
+        self._netlists = OrderedDict()
+        self._sizes = {}
+        self.names = compare.NameTable()
+        self._charged = 0
+        self.bytes = 0
+        self.dead_bytes = 0
+        for key, netlist in netlists.items():
+            self._add(key, netlist.rebind(self.names))
+        self.compactions += 1
+
+    def metrics(self):
+        return {"netlists": len(self._netlists), "bytes": self.bytes, "dead_bytes": self.dead_bytes,
+                "max_bytes": self.max_bytes, "names": len(self.names), "hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions, "compactions": self.compactions}
+
+
+# Memory taken up by a netlist's arrays, fingerprints and index (its names live in the shared NameTable)
+def netlist_bytes(netlist):
+    size = sum(map(sys.getsizeof, (netlist.net_ids, netlist.offsets, netlist.pins)))
+    if netlist._fingerprints is not None:
+        size += sys.getsizeof(netlist._fingerprints)
+    if netlist._index is not None:
+        size += sys.getsizeof(netlist._index) + 2 * INT_BYTES * len(netlist._index)
+    return size
+
+
+# Memory taken up by a SheetDiff's lists of differences (their names live in the shared NameTable)
+def diff_bytes(diff):
+    size = sys.getsizeof(diff)
+    for entries in (diff.removed, diff.added, diff.changed, diff.renamed):
+        size += sys.getsizeof(entries) + sum(sys.getsizeof(entry) + sum(map(sys.getsizeof, entry)) for entry in entries)
+    return size
+
+
+# Latency of each request, by endpoint
+class RequestMetrics(object):
+    def __init__(self):
+        self.started = time.time()
+        # {endpoint -> {"count", "errors", "seconds", "max", "samples"}}
+        self._endpoints = {}
+
+    def record(self, endpoint, seconds, error=False):
+        stats = self._endpoints.get(endpoint)
+        if stats is None:
+            stats = self._endpoints[endpoint] = {"count": 0, "errors": 0, "seconds": 0.0, "max": 0.0,
+                                                 "samples": deque(maxlen=LATENCY_SAMPLES)}
+        stats["count"] += 1
+        stats["errors"] += int(error)
+        stats["seconds"] += seconds
+        stats["max"] = max(stats["max"], seconds)
+        stats["samples"].append(seconds)
+
+    def metrics(self):
+        requests = {}
+        for endpoint, stats in self._endpoints.items():
+            samples = sorted(stats["samples"])
+            requests[endpoint] = {"count": stats["count"], "errors": stats["errors"], "latency_ms": {
+                "mean": round(1000 * stats["seconds"] / stats["count"], 3),
+                "p50": round(1000 * _percentile(samples, 0.5), 3),
+                "p95": round(1000 * _percentile(samples, 0.95), 3),
+                "max": round(1000 * stats["max"], 3)}}
+        return {"uptime_seconds": round(time.time() - self.started, 3), "requests": requests}
+
+
+def _percentile(samples, fraction):
+    return samples[min(len(samples) - 1, int(fraction * len(samples)))] if samples else 0.0
+
+
+# The comparisons behind the server: netlists come from the NetlistLRU, then the on-disk ParseCache (cache_dir, None
+# to skip it), then the file itself. Not thread-safe; the server calls it from one thread.
+class CompareService(object):
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, cache_dir=DEFAULT_CACHE_DIR, reader=None,
+                 max_result_bytes=DEFAULT_MAX_RESULT_BYTES, results_dir=None):
+        self.netlists = NetlistLRU(max_bytes)
+        # The only directory requests may write results to (None for none)
+        self.results_dir = results_dir
+        # Also used without cache_dir, for its memo of file hashes
+        self.keys = ParseCache(cache_dir if cache_dir is not None else DEFAULT_CACHE_DIR)
+        self.disk_cache = self.keys if cache_dir is not None else None
+        self.reader = reader
+        # {(first key, second key, renames) -> (SheetDiff, diff_bytes)}, least recently used first. At most
+        # RESULT_CACHE_SIZE of them are kept, taking up at most max_result_bytes.
+        self.results = OrderedDict()
+        self.max_result_bytes = max_result_bytes
+        self.result_bytes = 0
+        self.result_hits = 0
+        self.result_misses = 0
+
+    def netlist(self, path, sheet_name=None):
+        key = self.keys.key(path, sheet_name)
+        netlist = self.netlists.get(key)
+        if netlist is None:
+            names = self.netlists.names
+            netlist = compare.load_netlist(path, sheet_name, names, cache=self.disk_cache, reader=self.reader)
+            netlist = self.netlists.put(key, netlist)
+            # Cached results hold IDs from the old NameTable
+            if self.netlists.names is not names:
+                self.results.clear()
+                self.result_bytes = 0
+        return key, netlist
+
+    # Compares two netlists, each given as a path or a [path, sheet name] pair, and returns the SheetDiff
+    def compare(self, first, second, detect_renames=True):
+        (path1, sheet1), (path2, sheet2) = _source(first), _source(second)
+        key1, netlist1 = self.netlist(path1, sheet1)
+        key2, netlist2 = self.netlist(path2, sheet2)
+        # Loading the second netlist may have evicted the first or rebuilt the NameTable
+        if netlist1.names is not netlist2.names:
+            key1, netlist1 = self.netlist(path1, sheet1)
+
+        result_key = (key1, key2, detect_renames)
+        cached = self.results.get(result_key)
+        if cached is not None:
+            self.result_hits += 1
+            self.results.move_to_end(result_key)
+            return cached[0]
+        self.result_misses += 1
+        diff = compare.compare_sheets(netlist1, netlist2, detect_renames=detect_renames)
+        size = diff_bytes(diff)
+        # A result too big for the cache on its own isn't kept at all
+        if size <= self.max_result_bytes:
+            self.results[result_key] = (diff, size)
+            self.result_bytes += size
+            while self.result_bytes > self.max_result_bytes or len(self.results) > RESULT_CACHE_SIZE:
+                self.result_bytes -= self.results.popitem(last=False)[1][1]
+        return diff
+
+    # Handles the body of a POST /compare and returns the response body
+    def handle_compare(self, request):
+        if not isinstance(request, dict) or "first" not in request or "second" not in request:
+            raise ValueError("Expected {\"first\": ..., \"second\": ...}")
+        diff = self.compare(request["first"], request["second"], bool(request.get("renames", True)))
+        response = {"removed": len(diff.removed), "added": len(diff.added), "changed": len(diff.changed),
+                    "renamed": len(diff.renamed)}
+        output = request.get("output")
+        if output is not None:
+            output = self._output_path(output)
+            fmt = request.get("format")
+            result_writers.write_results(diff, output, fmt, _source(request["first"])[0])
+            response["output"] = output
+        else:
+            response["records"] = list(diff.records())
+        return response
+
+    # Where a request's "output" goes: a plain file name, inside results_dir
+    def _output_path(self, output):
+        if self.results_dir is None:
+            raise ValueError("This server doesn't write results files (start it with --results-dir)")
+        if not isinstance(output, str) or output in ("", ".", "..") or os.path.basename(output) != output:
+            raise ValueError("\"output\" is a file name within the results directory, not {!r}".format(output))
+        return os.path.join(self.results_dir, output)
+
+    def metrics(self):
+        return {"netlist_cache": self.netlists.metrics(),
+                "result_cache": {"entries": len(self.results), "bytes": self.result_bytes,
+                                 "max_bytes": self.max_result_bytes, "hits": self.result_hits,
+                                 "misses": self.result_misses},
+                "disk_cache": None if self.disk_cache is None else {"hits": self.disk_cache.hits,
+                                                                    "misses": self.disk_cache.misses}}
+
+
+def _source(source):
+    if isinstance(source, str):
+        return source, None
+    if isinstance(source, (list, tuple)) and len(source) == 2:
+        if os.path.splitext(source[0])[1].lower() not in (".xls", ".xlsx"):
+            raise ValueError("Only Excel workbooks have sheets, not {}".format(source[0]))
+        return source[0], source[1]
+    raise ValueError("A netlist is a path or a [path, sheet name] pair, not {!r}".format(source))
+
+
+class CompareServer(object):
+    def __init__(self, service):
+        self.service = service
+        self.metrics = RequestMetrics()
+        self._executor = None
+
+    # Serves until cancelled, on TCP host:port or on the Unix socket socket_path
+    async def serve(self, host=DEFAULT_HOST, port=DEFAULT_PORT, socket_path=None):
+        import asyncio
+        from concurrent.futures import ThreadPoolExecutor
+
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        try:
+            if socket_path is not None:
+                server = await asyncio.start_unix_server(self._handle_connection, path=socket_path)
+                print("Serving on {}".format(socket_path))
+            else:
+                server = await asyncio.start_server(self._handle_connection, host, port)
+                print("Serving on http://{}:{}".format(host, port))
+            async with server:
+                await server.serve_forever()
+        finally:
+            self._executor.shutdown(wait=False)
+
+    async def _handle_connection(self, reader, writer):
+        import asyncio
+        try:
+            while True:
+                request = await _read_request(reader)
+                if request is None:
+                    break
+                method, target, headers, body = request
+                start = time.perf_counter()
+                endpoint = target.split("?", 1)[0]
+                status, payload = await self._dispatch(method, endpoint, body)
+                writer.write(_response(status, payload))
+                await writer.drain()
+                self.metrics.record(endpoint, time.perf_counter() - start, status >= 400)
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except ValueError as e:
+            writer.write(_response(400, {"error": str(e)}))
+        finally:
+            writer.close()
+
+    async def _dispatch(self, method, endpoint, body):
+        if endpoint == "/metrics" and method == "GET":
+            metrics = self.metrics.metrics()
+            metrics.update(self.service.metrics())
+            return 200, metrics
+        if endpoint == "/compare" and method == "POST":
+            import asyncio
+            try:
+                request = json.loads(body.decode() or "null")
+                loop = asyncio.get_running_loop()
+                return 200, await loop.run_in_executor(self._executor, self.service.handle_compare, request)
+            except (ValueError, IOError) as e:
+                return 400, {"error": "{}: {}".format(type(e).__name__, e)}
+            except Exception as e:
+                return 500, {"error": "{}: {}".format(type(e).__name__, e)}
+        if endpoint in ("/metrics", "/compare"):
+            return 405, {"error": "Method not allowed"}
+        return 404, {"error": "Not found"}
+
+
+# Returns (method, target, {header -> value}, body) for the next request on the connection, or None once it's closed.
+# Raises ValueError for a request that can't be read.
+async def _read_request(reader):
+    request_line = await reader.readline()
+    if not request_line.strip():
+        return None
+    parts = request_line.decode("latin-1").split()
+    if len(parts) != 3:
+        raise ValueError("Malformed request line")
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get("content-length") or 0)
+    if length > MAX_BODY_BYTES:
+        raise ValueError("Request body too large")
+    body = await reader.readexactly(length) if length else b""
+    return parts[0].upper(), parts[1], headers, body
+
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 500: "Internal Server Error"}
+
+
+def _response(status, payload):
+    body = json.dumps(payload).encode()
+    head = "HTTP/1.1 {} {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\n\r\n".format(
+        status, _REASONS.get(status, ""), len(body))
+    return head.encode("latin-1") + body
+
+
+# Adds the "serve" options to an ArgumentParser
+def add_arguments(parser):
+    parser.add_argument("--host", default=DEFAULT_HOST, help="address to listen on")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="port to listen on")
+    parser.add_argument("--socket", default=None, help="listen on this Unix socket instead of TCP")
+    parser.add_argument("--max-memory", type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024), metavar="MB",
+                        help="memory to keep parsed netlists in before the least recently used are dropped")
+    parser.add_argument("--max-result-memory", type=int, default=DEFAULT_MAX_RESULT_BYTES // (1024 * 1024),
+                        metavar="MB", help="memory to keep the results of recent comparisons in")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="directory for the parsed netlist cache")
+    parser.add_argument("--no-cache", action="store_true", help="don't use the on-disk parsed netlist cache")
+    parser.add_argument("--results-dir", default=None,
+                        help="directory that requests may write results files to (by default they can't)")
+    parser.add_argument("--reader", choices=compare.EXCEL_READERS, default=None,
+                        help="how to read Excel sheets (defaults to pandas if it is installed)")
+
+
+def run_from_args(args):
+    import asyncio
+    service = CompareService(args.max_memory * 1024 * 1024, None if args.no_cache else args.cache_dir, args.reader,
+                             args.max_result_memory * 1024 * 1024, args.results_dir)
+    try:
+        asyncio.run(CompareServer(service).serve(args.host, args.port, args.socket))
+    except KeyboardInterrupt:
+        pass
+    return 0
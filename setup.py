@@ -2,11 +2,19 @@ from setuptools import setup
 
 setup(
     name='Netlist-Compare',
-    version='1.0.1',
-    packages=[''],
+    version='1.1.0',
+    py_modules=['batch', 'benchmark', 'cli', 'compare', 'modify_footprints', 'netlist_cache', 'netlist_store',
+                'profiling', 'report_parser', 'result_writers', 'server', 'symbol_library'],
     url='',
     license='',
     author='agupta',
     author_email='',
-    description='', install_requires=['openpyxl', 'pandas', 'xlrd', 'beautifulsoup4']
+    description='', install_requires=['openpyxl', 'pandas', 'xlrd'],
+    extras_require={'parquet': ['pyarrow']},
+    entry_points={
+        'console_scripts': [
+            'netlist-compare=cli:main',
+            'modify-footprints=modify_footprints:main',
+        ],
+    },
 )
@@ -0,0 +1,386 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+
+from netlist_cache import DEFAULT_CACHE_DIR
+
+'''
+Index of the footprint symbol files (.dra, .fsm, .psm, .bsm, .osm, .ssm) in a library directory.
+
+The directory is listed once with os.scandir and every symbol file is filed under its case-folded name, so looking up
+the files for a package is a single dict lookup instead of a pass over the whole library. Indexes are saved as JSON in
+the cache directory (not the library, which may be shared or read-only) and reused until the library directory's
+modification time changes, which happens whenever a file is added, removed or renamed in it.
+
+sync_symbols() brings a directory in line with a set of wanted files: only files that are new or differ from their
+source are copied (across a thread pool, optionally as hardlinks or reflinks), and only files that are no longer wanted
+are removed.
+
+Many package names are byte-identical footprints. ContentIndex remembers the hash of every symbol file it has read,
+along with the size and modification time the file had then, so a file is only read again after it changes. With it,
+find_duplicates() groups identical footprints across libraries, and sync_symbols(dedup=True) copies each distinct
+content once and hardlinks every other file with the same content to that copy.
+'''
+
+SYMBOL_EXTENSIONS = ['.dra', '.fsm', '.psm', '.bsm', '.osm', '.ssm']
+INDEX_VERSION = 1
+# Directory mtimes can be this coarse (FAT, SMB), so an index built within this many seconds of the last change to the
+# directory might miss a change made in the same tick and isn't saved
+MTIME_RESOLUTION = 2
+HASH_CHUNK_SIZE = 1024 * 1024
+CONTENT_INDEX_VERSION = 1
+CONTENT_INDEX_NAME = "symbol-hashes.json"
+LINK_MODES = ["hardlink", "reflink"]
+# FICLONE from linux/fs.h
+_FICLONE = 0x40049409
+
+
+class SymbolIndex(object):
+    def __init__(self, directory, mtime=None, files=None):
+        self.directory = os.path.abspath(directory)
+        self.mtime = mtime
+        # {case-folded stem -> [file names]}, each list ordered by SYMBOL_EXTENSIONS and then by name
+        self.files = files if files is not None else {}
+
+    def __repr__(self):
+        return "SymbolIndex({!r}, symbols={})".format(self.directory, len(self.files))
+
+    def __len__(self):
+        return len(self.files)
+
+    # Lists the directory and indexes every symbol file in it
+    @classmethod
+    def build(cls, directory):
+        mtime = os.stat(directory).st_mtime_ns
+        by_extension = {extension: [] for extension in SYMBOL_EXTENSIONS}
+        with os.scandir(directory) as it:
+            for entry in it:
+                extension = os.path.splitext(entry.name)[1].lower()
+                if extension in by_extension and entry.is_file():
+                    by_extension[extension].append(entry.name)
+        files = {}
+        for extension in SYMBOL_EXTENSIONS:
+            for name in sorted(by_extension[extension]):
+                files.setdefault(os.path.splitext(name)[0].lower(), []).append(name)
+        return cls(directory, mtime, files)
+
+    # Returns the saved index for directory if it is still current, otherwise builds (and saves) a new one. With
+    # cache_dir None the index is always built and never saved.
+    @classmethod
+    def load(cls, directory, cache_dir=DEFAULT_CACHE_DIR):
+        if cache_dir is None:
+            return cls.build(directory)
+        directory = os.path.abspath(directory)
+        index_path = cls.index_path(directory, cache_dir)
+        try:
+            with open(index_path, 'r') as f:
+                data = json.load(f)
+            if (data.get("version") == INDEX_VERSION and data.get("directory") == directory
+                    and data.get("mtime") == os.stat(directory).st_mtime_ns):
+                return cls(directory, data["mtime"], data["files"])
+        except (OSError, ValueError, KeyError):
+            pass
+        index = cls.build(directory)
+        if time.time() - index.mtime / 1e9 > MTIME_RESOLUTION:
+            try:
+                index.save(index_path)
+            except OSError:
+                pass
+        return index
+
+    @staticmethod
+    def index_path(directory, cache_dir=DEFAULT_CACHE_DIR):
+        key = hashlib.sha256(os.path.abspath(directory).encode()).hexdigest()
+        return os.path.join(cache_dir, "symbols-{}.json".format(key))
+
+    def save(self, path):
+        cache_dir = os.path.dirname(path)
+        if cache_dir and not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        temp_path = path + ".tmp"
+        with open(temp_path, 'w') as f:
+            json.dump({"version": INDEX_VERSION, "directory": self.directory, "mtime": self.mtime,
+                       "files": self.files}, f)
+        os.replace(temp_path, path)
+
+    # Symbol files for a package name (any case), or an empty list
+    def lookup(self, symbol):
+        return self.files.get(symbol.lower(), [])
+
+    # Every indexed file name
+    def file_names(self):
+        for names in self.files.values():
+            yield from names
+
+    # {"*.dra" -> number of .dra files, ...} in the same form _check_copied_structure prints
+    def counts(self):
+        counts = {"*" + extension: 0 for extension in SYMBOL_EXTENSIONS}
+        for name in self.file_names():
+            counts["*" + os.path.splitext(name)[1].lower()] += 1
+        return counts
+
+
+# sha256 of files by absolute path, remembered with the size and modification time each file had when it was read. A
+# file whose size and modification time still match isn't read again. Saved as JSON in the cache directory.
+class ContentIndex(object):
+    def __init__(self, path=None, files=None):
+        # Where the index is saved, None to keep it in memory only
+        self.path = path
+        # {absolute path -> [size, mtime in ns, sha256]}
+        self.files = files if files is not None else {}
+        # How many files were read / had their hash reused
+        self.hashed = 0
+        self.reused = 0
+
+    def __repr__(self):
+        return "ContentIndex(files={}, hashed={}, reused={})".format(len(self.files), self.hashed, self.reused)
+
+    # Returns the index saved in cache_dir, or an empty one. With cache_dir None the index is never saved.
+    @classmethod
+    def load(cls, cache_dir=DEFAULT_CACHE_DIR):
+        if cache_dir is None:
+            return cls()
+        path = os.path.join(cache_dir, CONTENT_INDEX_NAME)
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+            if data.get("version") == CONTENT_INDEX_VERSION:
+                return cls(path, data["files"])
+        except (OSError, ValueError, KeyError):
+            pass
+        return cls(path)
+
+    # Saves the index, leaving out files that no longer exist
+    def save(self):
+        if self.path is None:
+            return
+        self.files = {path: entry for path, entry in self.files.items() if os.path.exists(path)}
+        cache_dir = os.path.dirname(self.path)
+        if cache_dir and not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        temp_path = self.path + ".tmp"
+        with open(temp_path, 'w') as f:
+            json.dump({"version": CONTENT_INDEX_VERSION, "files": self.files}, f)
+        os.replace(temp_path, self.path)
+
+    # sha256 of each of the files, in the same order. Files that are new or changed are read on a pool of threads.
+    def hashes(self, paths, workers=None):
+        paths = [os.path.abspath(path) for path in paths]
+        digests = [None] * len(paths)
+        to_hash = []
+        for i, path in enumerate(paths):
+            stat = os.stat(path)
+            entry = self.files.get(path)
+            if entry is not None and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+                digests[i] = entry[2]
+                self.reused += 1
+            else:
+                to_hash.append((i, stat))
+        if to_hash:
+            from concurrent.futures import ThreadPoolExecutor
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                hashed = list(executor.map(lambda job: file_hash(paths[job[0]]), to_hash))
+            now = time.time()
+            for (i, stat), digest in zip(to_hash, hashed):
+                digests[i] = digest
+                self.hashed += 1
+                # A file changed again within the mtime resolution could keep its size and mtime, so it's rehashed
+                if now - stat.st_mtime > MTIME_RESOLUTION:
+                    self.files[paths[i]] = [stat.st_size, stat.st_mtime_ns, digest]
+        return digests
+
+
+# Groups the symbol files of the given library directories by content: a list of the paths of every set of two or more
+# identical files, largest sets first. Hashes are kept in the ContentIndex in cache_dir, so only files that changed
+# since the last call are read.
+def find_duplicates(directories, cache_dir=DEFAULT_CACHE_DIR, workers=None):
+    paths = []
+    for directory in directories:
+        index = SymbolIndex.load(directory, cache_dir)
+        paths.extend(os.path.join(index.directory, name) for name in index.file_names())
+    content = ContentIndex.load(cache_dir)
+    groups = {}
+    for path, digest in zip(paths, content.hashes(paths, workers)):
+        groups.setdefault(digest, []).append(path)
+    content.save()
+    return sorted((group for group in groups.values() if len(group) > 1), key=len, reverse=True)
+
+
+# What sync_symbols did: lists of target file names
+class SyncResult(object):
+    def __init__(self):
+        self.copied = []
+        # Hardlinked to another target with the same contents (dedup)
+        self.linked = []
+        self.removed = []
+        self.unchanged = []
+
+    def __repr__(self):
+        return "SyncResult(copied={}, linked={}, removed={}, unchanged={})".format(
+            len(self.copied), len(self.linked), len(self.removed), len(self.unchanged))
+
+
+# Makes target_dir hold exactly the files in wanted, a {target file name -> source path} dict. A target that already
+# matches its source (same size and modification time, or same contents with checksum) is left alone, new and changed
+# files are copied across a pool of threads, and any other file in target_dir is removed.
+# link is None to copy, "hardlink" to link targets to their sources (falling back to a copy across devices) or
+# "reflink" to clone them on filesystems that support it (falling back to a copy).
+# With dedup, targets whose sources have the same contents are stored once: one of them is copied (or linked) and the
+# rest are hardlinked to it. Contents are compared by hash (which checksum also uses), taken from the ContentIndex in
+# cache_dir so unchanged files are never read twice. Targets are always replaced rather than written to, but editing a
+# deduplicated file in place changes every file linked to it.
+def sync_symbols(wanted, target_dir, workers=None, link=None, checksum=False, dedup=False,
+                 cache_dir=DEFAULT_CACHE_DIR):
+    if link is not None and link not in LINK_MODES:
+        raise ValueError("Unknown link mode {!r}, expected one of {}".format(link, LINK_MODES))
+    if not os.path.exists(target_dir):
+        os.makedirs(target_dir)
+
+    result = SyncResult()
+    existing = {}
+    with os.scandir(target_dir) as it:
+        for entry in it:
+            if entry.is_file(follow_symlinks=False):
+                existing[entry.name] = entry.stat()
+
+    for name in existing:
+        if name not in wanted:
+            os.unlink(os.path.join(target_dir, name))
+            result.removed.append(name)
+
+    content = None
+    hashes = None
+    if checksum or dedup:
+        content = ContentIndex.load(cache_dir)
+        paths = list(dict.fromkeys(wanted.values()))
+        paths.extend(os.path.join(target_dir, name) for name in wanted if name in existing)
+        hashes = dict(zip(paths, content.hashes(paths, workers)))
+
+    to_copy = []
+    to_link = []
+    if dedup:
+        _plan_deduplicated(wanted, target_dir, existing, hashes, link, result, to_copy, to_link)
+    else:
+        for name, source in wanted.items():
+            target_stat = existing.get(name)
+            if target_stat is not None and _up_to_date(source, os.path.join(target_dir, name), target_stat, hashes,
+                                                       link):
+                result.unchanged.append(name)
+            else:
+                to_copy.append((source, os.path.join(target_dir, name), target_stat is not None))
+                result.copied.append(name)
+
+    if to_copy:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # list() so an error in any copy is raised here
+            list(executor.map(lambda job: _place_file(job[0], job[1], job[2], link), to_copy))
+    for original, target, exists in to_link:
+        _link_file(original, target, exists)
+    if content is not None:
+        content.save()
+    return result
+
+
+# Works out which targets to copy and which to hardlink to another target with the same contents, adding them to
+# to_copy as (source, target, exists) and to_link as (target to link to, target, exists)
+def _plan_deduplicated(wanted, target_dir, existing, hashes, link, result, to_copy, to_link):
+    # {content hash -> [target names]}
+    by_content = {}
+    for name, source in wanted.items():
+        by_content.setdefault(hashes[source], []).append(name)
+
+    for names in by_content.values():
+        # An existing target that is already up to date is kept as the one the others link to
+        original = None
+        original_stat = None
+        for name in names:
+            target_stat = existing.get(name)
+            if target_stat is not None and _up_to_date(wanted[name], os.path.join(target_dir, name), target_stat,
+                                                       hashes, link):
+                original = name
+                original_stat = target_stat
+                result.unchanged.append(name)
+                break
+        if original is None:
+            original = names[0]
+            to_copy.append((wanted[original], os.path.join(target_dir, original), original in existing))
+            result.copied.append(original)
+
+        for name in names:
+            if name == original:
+                continue
+            target_stat = existing.get(name)
+            if (target_stat is not None and original_stat is not None
+                    and (target_stat.st_dev, target_stat.st_ino) == (original_stat.st_dev, original_stat.st_ino)):
+                result.unchanged.append(name)
+            else:
+                to_link.append((os.path.join(target_dir, original), os.path.join(target_dir, name),
+                                target_stat is not None))
+                result.linked.append(name)
+
+
+# hashes is a {path -> content hash} of the source and target to compare contents, or None to go by size and mtime
+def _up_to_date(source, target, target_stat, hashes, link=None):
+    source_stat = os.stat(source)
+    if (source_stat.st_dev, source_stat.st_ino) == (target_stat.st_dev, target_stat.st_ino):
+        return True
+    # Relinking a copy costs nothing, so a target that could be a hardlink but isn't is redone
+    if link == "hardlink" and source_stat.st_dev == target_stat.st_dev:
+        return False
+    if source_stat.st_size != target_stat.st_size:
+        return False
+    if hashes is not None:
+        return hashes[source] == hashes[target]
+    # copy2 carries the modification time over, but not always at full precision
+    return abs(source_stat.st_mtime - target_stat.st_mtime) < MTIME_RESOLUTION
+
+
+def _place_file(source, target, exists, link):
+    # The old target may be a hardlink to a library file, which must not be written through
+    if exists:
+        os.unlink(target)
+    if link == "hardlink":
+        try:
+            os.link(source, target)
+            return
+        except OSError:
+            pass
+    elif link == "reflink" and _reflink(source, target):
+        return
+    shutil.copy2(source, target)
+
+
+# Hardlinks target to another target with the same contents, falling back to a copy where hardlinks aren't supported
+def _link_file(original, target, exists):
+    if exists:
+        os.unlink(target)
+    try:
+        os.link(original, target)
+    except OSError:
+        shutil.copy2(original, target)
+
+
+# Clones source to target sharing the same blocks (btrfs, XFS, ...). Returns False if the filesystem can't.
+def _reflink(source, target):
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    try:
+        with open(source, 'rb') as src, open(target, 'wb') as dst:
+            fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+    except OSError:
+        return False
+    shutil.copystat(source, target)
+    return True
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
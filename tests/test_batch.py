@@ -0,0 +1,31 @@
+import pytest
+
+import batch
+import compare
+
+'''
+Checks that manifests and sources that can't mean what they say are rejected rather than compared.
+'''
+
+
+@pytest.mark.parametrize("row", ["a.htm,b.htm,c.htm", "board.xlsx,OrCAD,OrCAD"])
+def test_bad_manifest_rows(tmp_path, row):
+    manifest = tmp_path / "manifest.csv"
+    manifest.write_text("# comment\n{}\n".format(row))
+    with pytest.raises(IOError, match="Line 2"):
+        batch.read_manifest(str(manifest))
+
+
+def test_manifest_rows(tmp_path):
+    manifest = tmp_path / "manifest.csv"
+    manifest.write_text("board.xlsx,OrCAD,Cadence\nrev_a.htm,rev_b.htm\n")
+    jobs = batch.read_manifest(str(manifest))
+    assert [(job.name, job.first_sheet, job.second_sheet) for job in jobs] == [
+        ("board OrCAD vs Cadence", "OrCAD", "Cadence"), ("rev_a vs rev_b", None, None)]
+
+
+def test_htm_has_no_sheets(tmp_path):
+    path = tmp_path / "rev_a.htm"
+    path.write_text("<html></html>")
+    with pytest.raises(IOError, match="no sheet"):
+        compare.load_netlist(str(path), "OrCAD")
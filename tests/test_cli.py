@@ -0,0 +1,42 @@
+import json
+import random
+
+import pytest
+
+import benchmark
+import cli
+import profiling
+
+'''
+Checks that command lines which can't mean what they say exit with a message instead of comparing a file with itself.
+'''
+
+
+@pytest.mark.parametrize("sources", [["a.htm", "b.htm", "c.htm"], ["b.xlsx", "OrCAD"], ["b.xlsx", "OrCAD", "OrCAD"]])
+def test_bad_compare_sources(sources):
+    with pytest.raises(SystemExit):
+        cli.compare_sources(sources)
+
+
+def test_compare_sources():
+    assert cli.compare_sources(["b.xlsx", "OrCAD", "Cadence"]) == ([("b.xlsx", "OrCAD"), ("b.xlsx", "Cadence")], None)
+    sources, results_path = cli.compare_sources(["rev_a.htm", "rev_b.htm"])
+    assert sources == [("rev_a.htm", None), ("rev_b.htm", None)]
+    assert results_path == "rev_a vs rev_b.xlsx"
+
+
+def test_missing_file_is_a_message(tmp_path):
+    with pytest.raises(SystemExit) as excinfo:
+        cli.main(["compare", str(tmp_path / "a.htm"), str(tmp_path / "b.htm"), "--no-cache"])
+    assert "No such file" in str(excinfo.value.code)
+
+
+def test_cprofile_implies_profile(tmp_path, monkeypatch):
+    netlist = benchmark.generate_netlist(50, 3.5, 10, random.Random(0))
+    benchmark.write_net_list_report(str(tmp_path / "rev_a.htm"), netlist)
+    benchmark.write_net_list_report(str(tmp_path / "rev_b.htm"), netlist)
+    monkeypatch.chdir(tmp_path)
+    cli.main(["compare", "rev_a.htm", "rev_b.htm", "--no-cache", "-o", "out.csv", "--cprofile", "compare_sheets"])
+    report = json.loads((tmp_path / profiling.DEFAULT_REPORT).read_text())
+    assert "compare_sheets" in json.dumps(report)
+    assert (tmp_path / "profile.compare_sheets.prof").exists()
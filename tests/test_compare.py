@@ -0,0 +1,101 @@
+import pytest
+
+import compare
+
+'''
+Hand-written cases for compare_sheets and match_renamed_nets, with the expected differences spelled out.
+'''
+
+
+def diff_of(sheet1, sheet2, detect_renames=False):
+    return compare.compare_sheets(sheet1, sheet2, detect_renames=detect_renames)
+
+
+def test_reordered_nets_and_pins_are_the_same():
+    sheet1 = {"GND": ["U1.1", "U2.1", "C1.2"], "VCC": ["U1.8", "C1.1"], "CLK": ["U1.3", "U2.5"]}
+    sheet2 = {"CLK": ["U2.5", "U1.3"], "GND": ["C1.2", "U1.1", "U2.1"], "VCC": ["C1.1", "U1.8"]}
+    diff = diff_of(sheet1, sheet2)
+    assert not diff
+    assert (diff.removed_nets, diff.added_nets, diff.changed_nets) == ({}, {}, {})
+
+
+def test_unequal_sheet_lengths():
+    sheet1 = {"GND": ["U1.1", "U2.1"], "VCC": ["U1.8"]}
+    sheet2 = {"GND": ["U1.1", "U2.1"], "VCC": ["U1.8"], "RESET": ["U1.4", "R1.1"], "SDA": ["U1.5", "U2.2"]}
+    diff = diff_of(sheet1, sheet2)
+    assert diff.removed_nets == {} and diff.changed_nets == {}
+    assert diff.added_nets == {"RESET": ["U1.4", "R1.1"], "SDA": ["U1.5", "U2.2"]}
+
+    diff = diff_of(sheet2, sheet1)
+    assert diff.added_nets == {} and diff.changed_nets == {}
+    assert diff.removed_nets == {"RESET": ["U1.4", "R1.1"], "SDA": ["U1.5", "U2.2"]}
+
+
+def test_added_removed_and_changed_nets():
+    sheet1 = {"GND": ["U1.1", "U2.1", "C1.2"], "OLD": ["U1.6", "R2.2"], "VCC": ["U1.8", "C1.1"]}
+    sheet2 = {"GND": ["U1.1", "C1.2", "C2.2"], "VCC": ["U1.8", "C1.1"], "NEW": ["U2.7", "R3.1"]}
+    diff = diff_of(sheet1, sheet2)
+    assert diff.removed_nets == {"OLD": ["U1.6", "R2.2"]}
+    assert diff.added_nets == {"NEW": ["U2.7", "R3.1"]}
+    changed = diff.changed_nets
+    assert list(changed) == ["GND"]
+    assert (changed["GND"].removed_pins, changed["GND"].added_pins) == (["U2.1"], ["C2.2"])
+    assert diff.net_results() == {"OLD not in second sheet": ["U1.6", "R2.2"],
+                                  "NEW not in first sheet": ["U2.7", "R3.1"]}
+
+
+def test_pure_rename():
+    sheet1 = {"GND": ["U1.1", "U2.1"], "N12345": ["U1.3", "R1.1", "C4.2"]}
+    sheet2 = {"GND": ["U1.1", "U2.1"], "N67890": ["C4.2", "U1.3", "R1.1"]}
+    diff = diff_of(sheet1, sheet2, detect_renames=True)
+    assert diff.removed_nets == {} and diff.added_nets == {} and diff.changed_nets == {}
+    rename = diff.renamed_nets["N12345"]
+    assert (rename.new_name, rename.removed_pins, rename.added_pins) == ("N67890", [], [])
+
+
+def test_rename_with_one_pin_changed():
+    # 3 shared pins out of 5: a Jaccard similarity of 0.6, above the threshold
+    sheet1 = {"N100": ["U1.1", "U1.2", "U1.3", "U1.4"]}
+    sheet2 = {"N200": ["U1.1", "U1.2", "U1.3", "U1.5"]}
+    diff = diff_of(sheet1, sheet2, detect_renames=True)
+    assert diff.removed_nets == {} and diff.added_nets == {}
+    rename = diff.renamed_nets["N100"]
+    assert (rename.new_name, rename.removed_pins, rename.added_pins) == ("N200", ["U1.4"], ["U1.5"])
+
+
+def test_near_miss_is_not_a_rename():
+    # 2 shared pins out of 6: a Jaccard similarity of 1/3, below the threshold
+    sheet1 = {"N100": ["U1.1", "U1.2", "U1.3", "U1.4"]}
+    sheet2 = {"N200": ["U1.1", "U1.2", "U1.5", "U1.6"]}
+    diff = diff_of(sheet1, sheet2, detect_renames=True)
+    assert diff.renamed_nets == {}
+    assert diff.removed_nets == {"N100": ["U1.1", "U1.2", "U1.3", "U1.4"]}
+    assert diff.added_nets == {"N200": ["U1.1", "U1.2", "U1.5", "U1.6"]}
+    # Lowering the threshold far enough does match them
+    diff = compare.match_renamed_nets(diff_of(sheet1, sheet2), threshold=0.3)
+    assert list(diff.renamed_nets) == ["N100"]
+
+
+def test_renames_pair_up_most_similar_first():
+    sheet1 = {"A": ["U1.1", "U1.2", "U1.3"], "B": ["U2.1", "U2.2", "U2.3", "U2.4"]}
+    sheet2 = {"X": ["U2.1", "U2.2", "U2.3", "U2.5"], "Y": ["U1.1", "U1.2", "U1.3"]}
+    diff = diff_of(sheet1, sheet2, detect_renames=True)
+    assert {old: rename.new_name for old, rename in diff.renamed_nets.items()} == {"A": "Y", "B": "X"}
+
+
+@pytest.mark.parametrize("reader", compare.EXCEL_READERS)
+def test_sheet_columns_come_from_the_header_row(tmp_path, reader):
+    import openpyxl
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = "Cadence"
+    ws.append(["Board X netlist"])
+    ws.append(["Exported", "2024-01-01"])
+    ws.append(["Ref", "Net Pins", "Notes", "Net Name"])
+    ws.append(["1", "U1.1 U2.1", "ground", "GND"])
+    ws.append(["2", "U1.8", None, "VCC"])
+    ws.append(["3", "R1.1", None, None])
+    wb.save(str(tmp_path / "board.xlsx"))
+
+    netlist = compare.load_netlist(str(tmp_path / "board.xlsx"), "Cadence", reader=reader)
+    assert netlist.to_dict() == {"GND": ["U1.1", "U2.1"], "VCC": ["U1.8"]}
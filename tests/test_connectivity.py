@@ -0,0 +1,60 @@
+import random
+
+import pytest
+
+import benchmark
+import compare
+
+'''
+Regression checks for compare_connectivity: pins moving between nets must not be reported as merges or splits, and
+the result must not depend on the order the nets are listed in.
+'''
+
+
+def records(first, second):
+    return list(compare.compare_connectivity(first, second).records())
+
+
+def moved(first_net, second_net, pins):
+    return {"kind": "moved", "first_nets": [first_net], "second_nets": [second_net], "pins": pins}
+
+
+@pytest.mark.parametrize("second", [{"X": ["1"], "Y": ["2", "3", "4", "5"]}, {"Y": ["2", "3", "4", "5"], "X": ["1"]}])
+def test_pin_moved_to_another_net(second):
+    assert records({"X": ["1", "2"], "Y": ["3", "4", "5"]}, second) == [moved("X", "Y", ["2"])]
+
+
+def test_half_of_a_net_moved_is_not_a_merge():
+    first = {"X": ["1", "2", "6", "7"], "Y": ["3", "4", "5"]}
+    second = {"Y": ["3", "4", "5", "2", "6"], "X": ["1", "7"]}
+    assert records(first, second) == [moved("X", "Y", ["2", "6"])]
+
+
+def test_net_that_carries_on_is_not_merged():
+    first = {"X": ["1", "2", "3", "4", "5"], "Y": ["6", "7", "8"]}
+    second = {"X": ["1", "2"], "Y": ["3", "4", "5", "6", "7", "8"]}
+    assert records(first, second) == [moved("X", "Y", ["3", "4", "5"])]
+
+
+def test_short_and_open():
+    assert records({"X": ["1", "2"], "Y": ["3", "4"]}, {"Z": ["1", "2", "3", "4"]}) == [
+        {"kind": "merged", "first_nets": ["X", "Y"], "second_nets": ["Z"], "pins": []}]
+    assert records({"X": ["1", "2", "3", "4"]}, {"Q": ["3", "4"], "P": ["1", "2"]}) == [
+        {"kind": "split", "first_nets": ["X"], "second_nets": ["P", "Q"], "pins": []}]
+
+
+def test_pin_split_off_on_its_own_has_moved():
+    assert records({"X": ["1", "2", "3", "4"]}, {"X": ["1", "2", "3"], "W": ["4"]}) == [moved("X", "W", ["4"])]
+
+
+# A revision with only renamed nets, single pins moved and deleted nets has no merges or splits, however it is listed
+def test_generated_revision_has_no_merges_or_splits():
+    rng = random.Random(0)
+    first = benchmark.generate_netlist(5000, 3.5, 50, rng)
+    second = benchmark.perturb_netlist(first, 0.02, 0.02, 0.01, rng)
+    diff = compare.compare_connectivity(first, second)
+    assert not diff.merged and not diff.split and diff.moved
+
+    shuffled = list(second.items())
+    rng.shuffle(shuffled)
+    assert records(first, dict(shuffled)) == list(diff.records())
@@ -0,0 +1,116 @@
+import itertools
+import json
+import random
+
+import pytest
+
+import benchmark
+import compare
+import netlist_store
+from netlist_cache import ParseCache
+
+'''
+Checks that the faster ways of comparing netlists give the same answer as compare_sheets on generated revisions: the
+pairwise diffs read out of compare_revisions, compare_incremental, the SQLite netlist store and both Excel readers.
+'''
+
+NETS = 2000
+
+
+# count revisions of a generated board, each a perturbed copy of the one before
+def make_revisions(count, nets=NETS, seed=0):
+    rng = random.Random(seed)
+    revisions = [benchmark.generate_netlist(nets, 3.5, 50, rng)]
+    for _ in range(count - 1):
+        revisions.append(benchmark.perturb_netlist(revisions[-1], 0.02, 0.02, 0.01, rng))
+    return revisions
+
+
+# Records of a diff with pin lists sorted, in a fixed order, for diffs whose nets are listed in a different order
+def normalized(diff):
+    records = []
+    for record in diff.records():
+        record = {key: sorted(value) if isinstance(value, list) else value for key, value in record.items()}
+        records.append(json.dumps(record, sort_keys=True))
+    return sorted(records)
+
+
+@pytest.mark.parametrize("detect_renames", [True, False])
+def test_revision_pairs_match_compare_sheets(detect_renames):
+    revisions = make_revisions(5)
+    names = compare.NameTable()
+    netlists = [compare.Netlist.from_dict(revision, names) for revision in revisions]
+    diff = compare.compare_revisions(netlists)
+    for first, second in itertools.permutations(range(len(netlists)), 2):
+        expected = compare.compare_sheets(netlists[first], netlists[second], detect_renames=detect_renames)
+        assert normalized(diff.sheet_diff(first, second, detect_renames=detect_renames)) == normalized(expected)
+
+
+def test_revisions_first_diverged():
+    revisions = make_revisions(4, seed=1)
+    diff = compare.compare_revisions(revisions)
+    names = diff.names.names
+    for net_id in diff.variants:
+        net = names[net_id]
+        first = revisions[0].get(net)
+        changed = [k for k in range(1, len(revisions))
+                   if (net in revisions[k]) != (first is not None) or
+                   (first is not None and set(revisions[k][net]) != set(first))]
+        assert diff.first_diverged(net_id) == (changed[0] if changed else None)
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_compare_incremental_matches_compare_sheets(seed):
+    first, second = make_revisions(2, seed=seed)
+    # Same pins in another order, and a pin listed twice, are not a change
+    net = next(iter(second))
+    second[net] = list(reversed(second[net])) + second[net][:1]
+    names = compare.NameTable()
+    netlist1 = compare.Netlist.from_dict(first, names)
+    netlist2 = compare.Netlist.from_dict(second, names)
+    expected = list(compare.compare_sheets(netlist1, netlist2).records())
+    assert list(compare.compare_incremental(netlist1, netlist2).records()) == expected
+    assert list(compare.compare_incremental(first, second).records()) == expected
+
+
+def test_fingerprints_are_kept_in_the_cache(tmp_path):
+    first, second = make_revisions(2)
+    paths = [str(tmp_path / "first.htm"), str(tmp_path / "second.htm")]
+    benchmark.write_net_list_report(paths[0], first)
+    benchmark.write_net_list_report(paths[1], second)
+    cache = ParseCache(str(tmp_path / "cache"))
+    sources = [(path, None) for path in paths]
+    parsed = compare.load_netlists(sources, cache=cache, fingerprints=True)
+    cached = compare.load_netlists(sources, cache=cache)
+    assert cache.hits == 2
+    for netlist1, netlist2 in zip(parsed, cached):
+        assert netlist2._fingerprints is not None
+        assert netlist2.fingerprints() == netlist1.fingerprints()
+    assert list(compare.compare_incremental(*cached).records()) == list(compare.compare_sheets(*parsed).records())
+
+
+def test_excel_readers_agree(tmp_path):
+    pytest.importorskip("pandas")
+    pytest.importorskip("openpyxl")
+    revisions = make_revisions(2)
+    path = str(tmp_path / "netlists.xlsx")
+    benchmark.write_xlsx(path, [("First", revisions[0]), ("Second", revisions[1])])
+    for sheet_name, revision in zip(["First", "Second"], revisions):
+        by_pandas = compare.load_netlist(path, sheet_name, reader="pandas")
+        by_openpyxl = compare.load_netlist(path, sheet_name, reader="openpyxl")
+        assert by_pandas.to_dict() == by_openpyxl.to_dict() == revision
+
+
+@pytest.mark.parametrize("detect_renames", [True, False])
+def test_store_diff_matches_sheet_diff(tmp_path, detect_renames):
+    first, second = make_revisions(2, seed=2)
+    paths = [str(tmp_path / "first.htm"), str(tmp_path / "second.htm")]
+    benchmark.write_net_list_report(paths[0], first)
+    benchmark.write_net_list_report(paths[1], second)
+    expected = compare.compare_sheets(*compare.load_netlists([(path, None) for path in paths]),
+                                      detect_renames=detect_renames)
+    with netlist_store.NetlistStore(str(tmp_path / "netlists.db")) as store:
+        ids = [store.add(path) for path in paths]
+        diff = store.compare(ids[0], ids[1], detect_renames=detect_renames)
+        assert list(diff.records()) == list(expected.records())
+        assert list(diff.to_sheet_diff().records()) == list(expected.records())
@@ -0,0 +1,66 @@
+import functools
+
+import pytest
+
+import compare
+import report_parser
+
+'''
+Checks the streaming Net List Report reader on hand-written reports, including the loose HTML Allegro writes out.
+'''
+
+REPORT = """<html><head><title>Net List Report</title></head><body>
+<table>
+<tr><td>Net List Report</td></tr>
+<tr><td>Design: board.brd</td></tr>
+<tr><td>Net Name</td><td>Net Pins</td></tr>
+<tr><td>GND</td><td>U1.1 U2.1 C1.2</td></tr>
+<tr><td></td><td>C2.2 C3.2</td></tr>
+<tr><td>A&amp;B</td><td>U1.2 R&lt;1&gt;.1</td></tr>
+<tr><td>VCC</td><td>U1.8 C1.1</td></tr>
+</table>
+<table><tr><td>Not</td><td>a net</td></tr></table>
+</body></html>
+"""
+EXPECTED = {"GND": ["U1.1", "U2.1", "C1.2", "C2.2", "C3.2"], "A&B": ["U1.2", "R<1>.1"], "VCC": ["U1.8", "C1.1"]}
+
+
+def write_report(tmp_path, text, name="report.htm"):
+    path = tmp_path / name
+    path.write_text(text)
+    return str(path)
+
+
+def test_wrapped_pins_and_entities(tmp_path):
+    assert compare.htm_to_dict(write_report(tmp_path, REPORT)) == EXPECTED
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 5, 7, 11, 64])
+def test_tags_split_across_chunks(tmp_path, monkeypatch, chunk_size):
+    monkeypatch.setattr(compare, "read_report", functools.partial(report_parser.read_report, chunk_size=chunk_size))
+    assert compare.htm_to_dict(write_report(tmp_path, REPORT)) == EXPECTED
+
+
+def test_unclosed_rows_and_cells(tmp_path):
+    report = ("<html><head><title>Net List Report</title></head><body><table>\n"
+              "<tr><td>Net Name<td>Net Pins\n"
+              "<tr><td>GND<td>U1.1 U2.1\n"
+              "<tr><td><td>C1.2\n"
+              "<tr><td>VCC</td><td>U1.8\n"
+              "</table></body></html>\n")
+    assert compare.htm_to_dict(write_report(tmp_path, report)) == {"GND": ["U1.1", "U2.1", "C1.2"], "VCC": ["U1.8"]}
+
+
+def test_wrong_report(tmp_path):
+    path = write_report(tmp_path, REPORT.replace("<title>Net List Report", "<title>Component Report"))
+    with pytest.raises(IOError, match="not a Net List Report"):
+        compare.htm_to_dict(path)
+    path = write_report(tmp_path, REPORT.replace("<title>Net List Report</title>", ""), "untitled.htm")
+    with pytest.raises(IOError, match="not a Net List Report"):
+        compare.htm_to_dict(path)
+
+
+def test_missing_header(tmp_path):
+    path = write_report(tmp_path, REPORT.replace("<td>Net Name</td><td>Net Pins</td>", "<td>Name</td><td>Pins</td>"))
+    with pytest.raises(IOError, match="Net Name/Net Pins"):
+        compare.htm_to_dict(path)
@@ -0,0 +1,80 @@
+import functools
+import os
+
+import pytest
+
+import modify_footprints
+import report_parser
+
+'''
+Checks Component Report parsing, matching components between reports, and the duplicate symbol report against
+hard-linked libraries.
+'''
+
+COMPONENT_REPORT = """<html><head><title>Component Report</title></head><body>
+<table>
+<tr><th>REFDES</th><th>COMP_CLASS</th><th>COMP_PART_NUMBER</th><th>COMP_VALUE</th><th>SYM_NAME</th></tr>
+<tr><td>R1</td><td>DISCRETE</td><td>RES-10K</td><td>10K</td><td>R0402</td></tr>
+<tr><td>C1<td>DISCRETE<td>CAP-1U<td>1&micro;F<td>C0603_A&amp;B
+<tr><td>U1</td><td>IC</td><td>MCU</td><td></td><td>QFN48</td></tr>
+</table>
+</body></html>
+"""
+
+
+# Unclosed cells and rows, entities and, with small chunks, tags split across reads
+@pytest.mark.parametrize("chunk_size", [1, 3, 16, report_parser.CHUNK_SIZE])
+def test_parse_component_report(tmp_path, monkeypatch, chunk_size):
+    monkeypatch.setattr(modify_footprints, "read_report",
+                        functools.partial(report_parser.read_report, chunk_size=chunk_size))
+    path = tmp_path / "components.htm"
+    path.write_text(COMPONENT_REPORT)
+    assert modify_footprints.parse_to_dict(str(path)) == {"R1": "R0402", "C1": "C0603_A&B", "U1": "QFN48"}
+
+
+def test_parse_errors(tmp_path, capsys):
+    path = tmp_path / "netlist.htm"
+    path.write_text(COMPONENT_REPORT.replace("Component Report", "Net List Report"))
+    with pytest.raises(SystemExit):
+        modify_footprints.parse_to_dict(str(path))
+    assert "not a Component Report" in capsys.readouterr().out
+
+    with pytest.raises(SystemExit):
+        modify_footprints.parse_to_dict(str(tmp_path / "missing.htm"))
+    output = capsys.readouterr().out
+    assert "No such file or directory" in output and "not a Component Report" not in output
+
+
+def test_hard_links_are_not_counted_as_wasted(tmp_path, capsys):
+    library1, library2 = tmp_path / "lib1", tmp_path / "lib2"
+    library1.mkdir()
+    library2.mkdir()
+    (library1 / "r0402.psm").write_bytes(b"x" * 100)
+    (library2 / "r0402.psm").write_bytes(b"x" * 100)
+    os.link(str(library1 / "r0402.psm"), str(library2 / "r0402_linked.psm"))
+
+    modify_footprints.print_duplicates([str(library1), str(library2)], workers=1)
+    output = capsys.readouterr().out
+    assert "3 identical files:" in output
+    assert "r0402_linked.psm (linked to " in output
+    # Three paths but only two copies on disk
+    assert "100 bytes stored more than once." in output
+
+
+def test_match_components():
+    old = {"R1": "R0402", "R2": "R0402", "R3": "R0402", "C1": "C0603", "U1": "QFN48", "J9": "HDR2"}
+    # Listed in a different order, with C1's footprint changed, J9 removed and TP1 added
+    new = {"U1": "QFN48", "TP1": "TESTPOINT", "C1": "C0805", "R3": "R0402", "R2": "R0402_HD", "R1": "R0402"}
+    match = modify_footprints.match_components(old, new)
+    assert match.mapping == {"R0402": "R0402", "C0603": "C0805", "QFN48": "QFN48"}
+    assert match.only_in_first == ["J9"]
+    assert match.only_in_second == ["TP1"]
+    # Most of the R0402 parts stayed R0402, so that's what the package maps to
+    assert match.conflicts == {"R0402": {"R0402": ["R1", "R3"], "R0402_HD": ["R2"]}}
+
+
+def test_old_to_new_mapping_reports_unmatched_components(capsys):
+    mapping = modify_footprints.get_old_to_new_mapping({"R1": "R0402", "J9": "HDR2"}, {"R1": "R0603", "TP1": "TP"})
+    assert mapping == {"R0402": "R0603"}
+    assert capsys.readouterr().out.splitlines() == ["J9 (HDR2) is not in the second report",
+                                                    "TP1 (TP) is not in the first report"]
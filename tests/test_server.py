@@ -0,0 +1,77 @@
+import os
+import random
+
+import pytest
+
+import benchmark
+import compare
+import server
+
+'''
+Checks that the server's caches stay within their memory limits, counting the names the netlists share.
+'''
+
+
+def make_netlist(names, prefix, nets=2000):
+    items = [("{}_N{}".format(prefix, i), ["{}_U{}.{}".format(prefix, i, j) for j in range(4)]) for i in range(nets)]
+    return compare.Netlist.from_items(items, names)
+
+
+def test_names_count_towards_the_limit():
+    lru = server.NetlistLRU(1)
+    lru.put("a", make_netlist(lru.names, "A"))
+    netlist_size = server.netlist_bytes(lru.get("a"))
+    # Every name is new, so the names take up more than the arrays
+    assert lru.bytes > 2 * netlist_size
+
+    lru = server.NetlistLRU(3 * lru.bytes)
+    for prefix in "ABCDEFGH":
+        lru.put(prefix, make_netlist(lru.names, prefix))
+        assert lru.bytes <= lru.max_bytes
+    # The evicted netlists' names were dropped to stay under the limit, not left to pile up in the NameTable
+    assert len(lru) == 3 and lru.evictions == 5
+    assert lru.compactions > 0
+    assert len(lru.names) == 3 * 2000 * 5
+    assert lru.get("H").to_dict() == make_netlist(compare.NameTable(), "H").to_dict()
+
+
+def test_result_cache_is_bounded_in_bytes(tmp_path):
+    rng = random.Random(0)
+    paths = []
+    netlist = benchmark.generate_netlist(500, 3.5, 20, rng)
+    for i in range(4):
+        netlist = benchmark.perturb_netlist(netlist, 0.05, 0.05, 0.02, rng)
+        paths.append(str(tmp_path / "rev_{}.htm".format(i)))
+        benchmark.write_net_list_report(paths[-1], netlist)
+
+    service = server.CompareService(cache_dir=None)
+    size = server.diff_bytes(service.compare(paths[0], paths[1]))
+    service = server.CompareService(cache_dir=None, max_result_bytes=int(2.5 * size))
+    for first, second in zip(paths, paths[1:]):
+        service.compare(first, second)
+        assert service.result_bytes <= service.max_result_bytes
+    assert 0 < len(service.results) < 3
+    assert service.result_bytes == sum(size for _, size in service.results.values())
+
+
+def test_requests_stay_within_their_sources_and_results_dir(tmp_path):
+    netlist = benchmark.generate_netlist(50, 3.5, 10, random.Random(0))
+    for name in ("rev_a.htm", "rev_b.htm"):
+        benchmark.write_net_list_report(str(tmp_path / name), netlist)
+    first, second = str(tmp_path / "rev_a.htm"), str(tmp_path / "rev_b.htm")
+
+    service = server.CompareService(cache_dir=None)
+    with pytest.raises(ValueError, match="sheets"):
+        service.handle_compare({"first": [first, "OrCAD"], "second": second})
+    with pytest.raises(ValueError, match="--results-dir"):
+        service.handle_compare({"first": first, "second": second, "output": "a vs b.csv"})
+
+    results_dir = tmp_path / "results"
+    results_dir.mkdir()
+    service = server.CompareService(cache_dir=None, results_dir=str(results_dir))
+    for output in ("../a vs b.csv", str(tmp_path / "a vs b.csv"), ".."):
+        with pytest.raises(ValueError, match="file name"):
+            service.handle_compare({"first": first, "second": second, "output": output})
+    response = service.handle_compare({"first": first, "second": second, "output": "a vs b.csv"})
+    assert response["output"] == str(results_dir / "a vs b.csv")
+    assert os.listdir(str(results_dir)) == ["a vs b.csv"]
@@ -0,0 +1,125 @@
+import os
+
+import symbol_library
+
+'''
+Checks that sync_symbols copies, links, keeps and removes exactly the files it should, on tmp_path libraries.
+'''
+
+
+def make_library(directory, files):
+    directory.mkdir()
+    for name, contents in files.items():
+        (directory / name).write_bytes(contents)
+    return {name: str(directory / name) for name in files}
+
+
+def inode(path):
+    stat = os.stat(str(path))
+    return stat.st_dev, stat.st_ino
+
+
+def test_copies_then_skips_unchanged(tmp_path):
+    wanted = make_library(tmp_path / "library", {"r0402.psm": b"r" * 10, "c0603.dra": b"c" * 20})
+    target = tmp_path / "symbols_updated"
+
+    result = symbol_library.sync_symbols(wanted, str(target), cache_dir=None)
+    assert sorted(result.copied) == ["c0603.dra", "r0402.psm"]
+    assert (target / "r0402.psm").read_bytes() == b"r" * 10
+    assert inode(target / "r0402.psm") != inode(wanted["r0402.psm"])
+
+    result = symbol_library.sync_symbols(wanted, str(target), cache_dir=None)
+    assert result.copied == [] and sorted(result.unchanged) == ["c0603.dra", "r0402.psm"]
+
+    # A different size means a different file, whatever the modification time says
+    with open(wanted["r0402.psm"], 'wb') as f:
+        f.write(b"R" * 11)
+    result = symbol_library.sync_symbols(wanted, str(target), cache_dir=None)
+    assert result.copied == ["r0402.psm"] and result.unchanged == ["c0603.dra"]
+    assert (target / "r0402.psm").read_bytes() == b"R" * 11
+
+
+def test_only_removes_stale_files_from_the_target(tmp_path):
+    wanted = make_library(tmp_path / "library", {"r0402.psm": b"r", "old.psm": b"o"})
+    other = make_library(tmp_path / "other", {"keep.psm": b"k"})
+    target = tmp_path / "symbols_updated"
+    symbol_library.sync_symbols(wanted, str(target), cache_dir=None)
+    (target / "notes.txt").write_bytes(b"n")
+    os.mkdir(str(target / "subdir"))
+
+    del wanted["old.psm"]
+    result = symbol_library.sync_symbols(wanted, str(target), cache_dir=None)
+    assert sorted(result.removed) == ["notes.txt", "old.psm"]
+    assert sorted(os.listdir(str(target))) == ["r0402.psm", "subdir"]
+    # The library the files came from, and anything else, is left alone
+    assert sorted(os.listdir(str(tmp_path / "library"))) == ["old.psm", "r0402.psm"]
+    assert os.path.exists(other["keep.psm"])
+
+
+def test_hardlink(tmp_path):
+    wanted = make_library(tmp_path / "library", {"r0402.psm": b"r" * 10})
+    target = tmp_path / "symbols_updated"
+    # A copy made earlier is replaced by a link, without writing through to the library file
+    symbol_library.sync_symbols(wanted, str(target), cache_dir=None)
+    result = symbol_library.sync_symbols(wanted, str(target), link="hardlink", cache_dir=None)
+    assert result.copied == ["r0402.psm"]
+    assert inode(target / "r0402.psm") == inode(wanted["r0402.psm"])
+
+    result = symbol_library.sync_symbols(wanted, str(target), link="hardlink", cache_dir=None)
+    assert result.unchanged == ["r0402.psm"]
+
+
+def test_hardlink_falls_back_to_copy(tmp_path, monkeypatch):
+    wanted = make_library(tmp_path / "library", {"r0402.psm": b"r" * 10})
+    target = tmp_path / "symbols_updated"
+
+    def cross_device(source, target):
+        raise OSError(18, "Invalid cross-device link")
+    monkeypatch.setattr(os, "link", cross_device)
+    result = symbol_library.sync_symbols(wanted, str(target), link="hardlink", cache_dir=None)
+    assert result.copied == ["r0402.psm"]
+    assert (target / "r0402.psm").read_bytes() == b"r" * 10
+    assert inode(target / "r0402.psm") != inode(wanted["r0402.psm"])
+
+
+def test_reflink_falls_back_to_copy(tmp_path, monkeypatch):
+    import fcntl
+    wanted = make_library(tmp_path / "library", {"r0402.psm": b"r" * 10})
+    target = tmp_path / "symbols_updated"
+
+    def unsupported(fd, request, arg=0):
+        raise OSError(95, "Operation not supported")
+    monkeypatch.setattr(fcntl, "ioctl", unsupported)
+    result = symbol_library.sync_symbols(wanted, str(target), link="reflink", cache_dir=None)
+    assert result.copied == ["r0402.psm"]
+    assert (target / "r0402.psm").read_bytes() == b"r" * 10
+    assert os.stat(str(target / "r0402.psm")).st_mtime == os.stat(wanted["r0402.psm"]).st_mtime
+
+
+def test_dedup_links_identical_targets(tmp_path):
+    wanted = make_library(tmp_path / "library", {"r0402.psm": b"r" * 10, "r0402_hd.psm": b"r" * 10,
+                                                 "r0402_ld.psm": b"r" * 10, "c0603.psm": b"c" * 10})
+    target = tmp_path / "symbols_updated"
+
+    result = symbol_library.sync_symbols(wanted, str(target), dedup=True, cache_dir=None)
+    assert sorted(result.copied) == ["c0603.psm", "r0402.psm"]
+    assert sorted(result.linked) == ["r0402_hd.psm", "r0402_ld.psm"]
+    assert inode(target / "r0402_hd.psm") == inode(target / "r0402.psm") == inode(target / "r0402_ld.psm")
+    assert inode(target / "r0402.psm") != inode(wanted["r0402.psm"])
+    assert inode(target / "c0603.psm") != inode(target / "r0402.psm")
+
+    result = symbol_library.sync_symbols(wanted, str(target), dedup=True, cache_dir=None)
+    assert result.copied == [] and result.linked == [] and len(result.unchanged) == 4
+
+
+def test_dedup_falls_back_to_copy(tmp_path, monkeypatch):
+    wanted = make_library(tmp_path / "library", {"r0402.psm": b"r" * 10, "r0402_hd.psm": b"r" * 10})
+    target = tmp_path / "symbols_updated"
+
+    def unsupported(source, target):
+        raise OSError(1, "Operation not permitted")
+    monkeypatch.setattr(os, "link", unsupported)
+    result = symbol_library.sync_symbols(wanted, str(target), dedup=True, cache_dir=None)
+    assert result.copied == ["r0402.psm"] and result.linked == ["r0402_hd.psm"]
+    assert (target / "r0402_hd.psm").read_bytes() == b"r" * 10
+    assert inode(target / "r0402_hd.psm") != inode(target / "r0402.psm")